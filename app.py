@@ -12,16 +12,23 @@ Setup:
 """
 
 import streamlit as st
-import pandas as pd
-import networkx as nx
-from typing import List, Dict, Optional
-import json
+from typing import Optional
 import os
-from pathlib import Path
-from google import genai
+import time
+import uuid
 from dotenv import load_dotenv
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
+
+# Core classes live in their own modules; re-exported here for scripts importing from app
+from knowledge_graph import TableKnowledgeGraph
+from llm_client import GeminiClient, ResilientLLMClient
+from pipeline import TextToSQLPipeline
+from prompt_budget import PromptBudget
+from query_templates import QueryTemplateCache
+from schema_loader import read_schema_workbook
+from graph_export import GraphArtifacts, save_knowledge_graph
+from job_queue import Job, JobQueue
+from sql_preview import SAMPLE_DATA_DIR, PreviewError, SqlPreview
+from table_stats import load_table_stats
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
@@ -37,280 +44,12 @@ if GOOGLE_API_KEY:
 # GOOGLE_API_KEY
 
 EXCEL_FILE_PATH = "AI_SampleDataStruture.xlsx"  # Update path as needed
-KNOWLEDGE_GRAPH_OUTPUT_DIR = "knowledge_graph_exports"  # Directory for exports
-
-
-# ============================================
-# KNOWLEDGE GRAPH CLASS
-# ============================================
-
-class TableKnowledgeGraph:
-    def __init__(self, schemas: Dict, relationships: List[Dict]):
-        self.graph = nx.MultiDiGraph()  # Use MultiDiGraph to support multiple edges between same nodes
-        self.schemas = schemas
-        self.relationships = relationships
-        self._build_graph()
-    
-    def _build_graph(self):
-        """Build the knowledge graph from schemas and relationships"""
-        # Add nodes (tables)
-        for table_name, columns in self.schemas.items():
-            self.graph.add_node(
-                table_name, 
-                columns=[col["name"] for col in columns]
-            )
-        
-        # Add edges (relationships)
-        for rel in self.relationships:
-            table1 = rel['table1']
-            table2 = rel['table2']
-            
-            # Parse composite keys
-            source_cols = [col.strip() for col in rel['join_key_1'].split('+')]
-            target_cols = [col.strip() for col in rel['join_key_2'].split('+')]
-            
-            self.graph.add_edge(
-                table1,
-                table2,
-                source_columns=source_cols,
-                target_columns=target_cols,
-                join_type=rel.get('join_type', 'INNER'),
-                context=rel.get('context', 'default'),
-                description=rel.get('description', f"Join {table1} with {table2}")
-            )
-    
-    def get_join_relationships(self, tables: List[str], context: Optional[str] = None) -> List[Dict]:
-        """Find all join relationships between given tables"""
-        relationships = []
-
-        for i in range(len(tables)):
-            for j in range(i + 1, len(tables)):
-                source = tables[i]
-                target = tables[j]
-
-                # Check both directions - MultiDiGraph returns a dict of edge keys
-                for start, end in [(source, target), (target, source)]:
-                    if self.graph.has_edge(start, end):
-                        # Get all edges between these nodes (MultiDiGraph can have multiple)
-                        edges_dict = self.graph.get_edge_data(start, end)
-
-                        # Iterate through all edges between these two nodes
-                        for edge_key, edge_data in edges_dict.items():
-                            # Filter by context if provided
-                            edge_context = edge_data.get('context', 'default')
-
-                            # Context filtering logic:
-                            # - If no context is specified, include all edges
-                            # - If context is specified, prefer context-specific edges but fallback to default if no context-specific edge exists
-                            if context:
-                                context_lower = context.lower()
-                                edge_context_lower = edge_context.lower()
-
-                                # Check if this edge has a context-specific match
-                                has_context_match = context_lower in edge_context_lower
-                                is_default = edge_context == 'default'
-
-                                # Check if there are any context-specific edges for this table pair
-                                has_context_specific_edges = any(
-                                    context_lower in ed.get('context', 'default').lower()
-                                    for ed in edges_dict.values()
-                                    if ed.get('context', 'default') != 'default'
-                                )
-
-                                # Include edge if:
-                                # 1. It matches the context, OR
-                                # 2. It's a default edge AND there are no context-specific edges for this table pair
-                                if not has_context_match:
-                                    if is_default and not has_context_specific_edges:
-                                        pass  # Include default edge as fallback
-                                    else:
-                                        continue  # Skip this edge
-
-                            # Build join condition
-                            source_cols = edge_data['source_columns']
-                            target_cols = edge_data['target_columns']
-
-                            join_conditions = [
-                                f"{start}.{src} = {end}.{tgt}"
-                                for src, tgt in zip(source_cols, target_cols)
-                            ]
-
-                            relationships.append({
-                                "from_table": start,
-                                "to_table": end,
-                                "join_condition": " AND ".join(join_conditions),
-                                "join_type": edge_data['join_type'],
-                                "context": edge_data.get('context', 'default'),
-                                "description": edge_data.get('description', '')
-                            })
-
-        return relationships
-    
-    def get_all_tables_needed(self, tables: List[str]) -> List[str]:
-        """Find all tables including intermediate ones needed for joins"""
-        all_tables = set(tables)
-        
-        for i in range(len(tables)):
-            for j in range(i + 1, len(tables)):
-                try:
-                    path = nx.shortest_path(
-                        self.graph.to_undirected(), 
-                        tables[i], 
-                        tables[j]
-                    )
-                    all_tables.update(path)
-                except nx.NetworkXNoPath:
-                    pass
-        
-        return list(all_tables)
-    
-    def get_columns_for_tables(self, tables: List[str]) -> Dict:
-        """Get schema information for specified tables"""
-        return {table: self.schemas.get(table, []) for table in tables}
-
-    def visualize_graph_plotly(self, highlight_tables: List[str] = None):
-        """Create an interactive Plotly visualization of the knowledge graph"""
-        # Get graph layout using spring layout
-        pos = nx.spring_layout(self.graph, k=2, iterations=50)
-
-        # Create edge traces - handle MultiDiGraph with multiple edges
-        edge_traces = []
-        for edge in self.graph.edges(keys=True):  # Include keys for MultiDiGraph
-            source, target, key = edge
-            x0, y0 = pos[source]
-            x1, y1 = pos[target]
-
-            # Get specific edge data using the key
-            edge_data = self.graph.get_edge_data(source, target, key)
-            join_info = f"{source} → {target}<br>"
-            join_info += f"Keys: {', '.join(edge_data['source_columns'])} = {', '.join(edge_data['target_columns'])}<br>"
-            join_info += f"Type: {edge_data['join_type']}<br>"
-            join_info += f"Context: {edge_data.get('context', 'default')}"
-
-            # Color edges differently based on context
-            edge_color = '#888'
-            if edge_data.get('context') == 'For country level data':
-                edge_color = '#4CAF50'  # Green
-            elif edge_data.get('context') == 'For sector level data':
-                edge_color = '#2196F3'  # Blue
-            elif edge_data.get('context') == 'For rating level data':
-                edge_color = '#FF9800'  # Orange
-
-            edge_trace = go.Scatter(
-                x=[x0, x1, None],
-                y=[y0, y1, None],
-                mode='lines',
-                line=dict(width=2, color=edge_color),
-                hoverinfo='text',
-                text=join_info,
-                showlegend=False
-            )
-            edge_traces.append(edge_trace)
-
-        # Create node trace
-        node_x = []
-        node_y = []
-        node_text = []
-        node_colors = []
-        node_sizes = []
-
-        for node in self.graph.nodes():
-            x, y = pos[node]
-            node_x.append(x)
-            node_y.append(y)
-
-            # Get column count
-            columns = self.graph.nodes[node].get('columns', [])
-            node_info = f"<b>{node}</b><br>"
-            node_info += f"Columns: {len(columns)}<br>"
-            node_info += f"Sample: {', '.join(columns[:5])}"
-            if len(columns) > 5:
-                node_info += "..."
-
-            node_text.append(node_info)
-
-            # Color nodes based on whether they're highlighted
-            if highlight_tables and node in highlight_tables:
-                node_colors.append('#FF6B6B')  # Red for highlighted
-                node_sizes.append(30)
-            else:
-                node_colors.append('#4ECDC4')  # Teal for normal
-                node_sizes.append(20)
-
-        node_trace = go.Scatter(
-            x=node_x,
-            y=node_y,
-            mode='markers+text',
-            hoverinfo='text',
-            text=[node for node in self.graph.nodes()],
-            textposition="top center",
-            textfont=dict(size=12, color='black'),
-            hovertext=node_text,
-            marker=dict(
-                size=node_sizes,
-                color=node_colors,
-                line=dict(width=2, color='white')
-            ),
-            showlegend=False
-        )
-
-        # Create figure
-        fig = go.Figure(data=edge_traces + [node_trace])
-
-        fig.update_layout(
-            title=dict(text="Database Knowledge Graph", font=dict(size=16)),
-            showlegend=False,
-            hovermode='closest',
-            margin=dict(b=20, l=5, r=5, t=40),
-            xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-            yaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-            plot_bgcolor='white',
-            height=600
-        )
-
-        return fig
-
-    def get_graph_stats(self) -> Dict: 
-        """Get statistics about the knowledge graph"""
-        return {
-            "total_tables": self.graph.number_of_nodes(),
-            "total_relationships": self.graph.number_of_edges(),
-            "tables": list(self.graph.nodes()),
-            "average_connections": sum(dict(self.graph.degree()).values()) / self.graph.number_of_nodes() if self.graph.number_of_nodes() > 0 else 0,
-            "is_connected": nx.is_weakly_connected(self.graph)
-        }
-
-    def export_graph_data(self) -> Dict:
-        """Export complete graph data for inspection"""
-        export_data = {
-            "nodes": [],
-            "edges": []
-        }
-
-        # Export nodes
-        for node in self.graph.nodes():
-            node_data = {
-                "table_name": node,
-                "columns": self.graph.nodes[node].get('columns', []),
-                "column_count": len(self.graph.nodes[node].get('columns', []))
-            }
-            export_data["nodes"].append(node_data)
-
-        # Export edges - handle MultiDiGraph with multiple edges
-        for edge in self.graph.edges(keys=True):  # Include keys for MultiDiGraph
-            source, target, key = edge
-            edge_data = self.graph.get_edge_data(source, target, key)
-            export_data["edges"].append({
-                "from": source,
-                "to": target,
-                "source_columns": edge_data['source_columns'],
-                "target_columns": edge_data['target_columns'],
-                "join_type": edge_data['join_type'],
-                "context": edge_data.get('context', 'default'),
-                "description": edge_data.get('description', '')
-            })
-
-        return export_data
+# Parquet/Arrow sample files for previewing generated SQL
+SAMPLE_DIR = os.getenv('SAMPLE_DATA_DIR', SAMPLE_DATA_DIR)
+# Smaller model tried first when the model cascade is enabled
+FAST_MODEL = os.getenv('GEMINI_FAST_MODEL', 'gemini-2.0-flash-lite')
+# Above this many tables the graph tab focuses on the selected tables' neighborhood
+LARGE_GRAPH_TABLES = 200
 
 
 # ============================================
@@ -321,55 +60,7 @@ class TableKnowledgeGraph:
 def load_excel_data(file_path: str) -> tuple:
     """Load schemas and relationships from Excel file (cached)"""
     try:
-        # Read all sheets
-        counterparty_df = pd.read_excel(file_path, sheet_name="Counterparty New")
-        trade_df = pd.read_excel(file_path, sheet_name="Trade New")
-        concentration_df = pd.read_excel(file_path, sheet_name="Concentration New")
-        joins_df = pd.read_excel(file_path, sheet_name="Joins")
-
-        # Build schemas dictionary
-        schemas = {
-            "Counterparty": [
-                {
-                    "name": row["Column Name"],
-                    "description": row["Description"],
-                    "example": row.get("Example Value", "")
-                }
-                for _, row in counterparty_df.iterrows()
-            ],
-            "Trade": [
-                {
-                    "name": row["Column Name"],
-                    "description": row["Description"],
-                    "example": row.get("Example Value", "")
-                }
-                for _, row in trade_df.iterrows()
-            ],
-            "Concentration": [
-                {
-                    "name": row["Column Name"],
-                    "description": row["Description"],
-                    "example": row.get("Example Value", "")
-                }
-                for _, row in concentration_df.iterrows()
-            ]
-        }
-
-        # Build relationships list
-        relationships = []
-        for _, row in joins_df.iterrows():
-            rel = {
-                "table1": row["Table1"],
-                "table2": row["Table2"],
-                "join_key_1": row["Join Key Table1"],
-                "join_key_2": row["Join Key Table2"],
-                "join_type": "INNER",
-                "context": row.get("Context", "default") if pd.notna(row.get("Context")) else "default",
-                "description": f"Join {row['Table1']} with {row['Table2']}"
-            }
-            relationships.append(rel)
-
-        return schemas, relationships
+        return read_schema_workbook(file_path)
 
     except Exception as e:
         st.error(f"Error loading Excel file: {str(e)}")
@@ -381,341 +72,202 @@ def build_knowledge_graph(file_path: str) -> TableKnowledgeGraph:
     """Build and cache the knowledge graph (cached as a resource)"""
     schemas, relationships = load_excel_data(file_path)
     if schemas and relationships:
-        return TableKnowledgeGraph(schemas, relationships)
+        kg = TableKnowledgeGraph(schemas, relationships)
+        # Row counts and key cardinalities for join ordering, when available
+        kg.set_statistics(load_table_stats(kg, file_path, SAMPLE_DIR))
+        kg.analytics  # Graph metrics computed once here, never on a rerun
+        # A reloaded workbook gets its metrics up front as well
+        kg.on_change(lambda graph, previous_fingerprint: graph.analytics)
+        return kg
     return None
 
 
-def save_knowledge_graph(kg: TableKnowledgeGraph):
-    """Save knowledge graph to files on app startup"""
-    from datetime import datetime
-
-    # Create output directory if it doesn't exist
-    output_dir = Path(KNOWLEDGE_GRAPH_OUTPUT_DIR)
-    output_dir.mkdir(exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-    # Save as JSON
-    json_path = output_dir / f"knowledge_graph_{timestamp}.json"
-    graph_data = kg.export_graph_data()
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(graph_data, f, indent=2)
-
-    # Also save a "latest" version without timestamp
-    latest_json_path = output_dir / "knowledge_graph_latest.json"
-    with open(latest_json_path, 'w', encoding='utf-8') as f:
-        json.dump(graph_data, f, indent=2)
-
-    # Save as GraphML
-    graphml_path = output_dir / f"knowledge_graph_{timestamp}.graphml"
-    latest_graphml_path = output_dir / "knowledge_graph_latest.graphml"
-
-    # Create a new clean graph for GraphML export (lists are not supported)
-    export_graph = nx.MultiDiGraph()
-
-    # Add nodes with converted attributes
-    for node in kg.graph.nodes():
-        node_attrs = {}
-        for key, value in kg.graph.nodes[node].items():
-            if isinstance(value, list):
-                node_attrs[key] = ','.join(str(v) for v in value)
-            else:
-                node_attrs[key] = str(value) if value is not None else ''
-        export_graph.add_node(node, **node_attrs)
-
-    # Add edges with converted attributes
-    for source, target, key, edge_data in kg.graph.edges(keys=True, data=True):
-        clean_edge_data = {}
-        for attr_key, attr_value in edge_data.items():
-            if isinstance(attr_value, list):
-                clean_edge_data[attr_key] = ','.join(str(v) for v in attr_value)
-            else:
-                clean_edge_data[attr_key] = str(attr_value) if attr_value is not None else ''
-        export_graph.add_edge(source, target, key=key, **clean_edge_data)
-
-    nx.write_graphml(export_graph, str(graphml_path))
-    nx.write_graphml(export_graph, str(latest_graphml_path))
-
-    # Save statistics as text file
-    stats_path = output_dir / f"knowledge_graph_stats_{timestamp}.txt"
-    latest_stats_path = output_dir / "knowledge_graph_stats_latest.txt"
-
-    stats = kg.get_graph_stats()
-    stats_content = f"""Knowledge Graph Statistics
-Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-{'=' * 60}
-
-Total Tables: {stats['total_tables']}
-Total Relationships: {stats['total_relationships']}
-Average Connections per Table: {stats['average_connections']:.2f}
-Is Connected: {'Yes' if stats['is_connected'] else 'No'}
-
-Tables:
-{chr(10).join(f"  - {table}" for table in stats['tables'])}
-
-Detailed Relationships:
-"""
-
-    for edge_data in graph_data['edges']:
-        stats_content += f"\n{edge_data['from']} → {edge_data['to']}\n"
-        stats_content += f"  Join: {', '.join(edge_data['source_columns'])} = {', '.join(edge_data['target_columns'])}\n"
-        stats_content += f"  Type: {edge_data['join_type']} | Context: {edge_data['context']}\n"
-        stats_content += f"  Description: {edge_data['description']}\n"
-
-    with open(stats_path, 'w', encoding='utf-8') as f:
-        f.write(stats_content)
-
-    with open(latest_stats_path, 'w', encoding='utf-8') as f:
-        f.write(stats_content)
+# Resources derived from the graph take its fingerprint as an argument, so a
+# reloaded schema gets fresh ones and unchanged content keeps the cached ones.
 
-    return {
-        'json_path': json_path,
-        'graphml_path': graphml_path,
-        'stats_path': stats_path,
-        'timestamp': timestamp
-    }
+@st.cache_resource
+def get_template_cache(file_path: str, fingerprint: str) -> Optional[QueryTemplateCache]:
+    """Build the query-template cache for the knowledge graph (cached as a resource)"""
+    kg = build_knowledge_graph(file_path)
+    if kg:
+        return QueryTemplateCache(kg.schemas)
+    return None
 
 
-# ============================================
-# GEMINI LLM INTEGRATION
-# ============================================
-
-class GeminiClient:
-    def __init__(self):
-        """Initialize Gemini client using the new google-genai SDK"""
-        api_key = GOOGLE_API_KEY
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment")
-
-        # Use the new Client API (REST-based, no gRPC issues)
-        self.client = genai.Client(api_key=api_key)
-        self.model_name = 'gemini-2.0-flash-exp'  # Use available model
-
-        # Configure generation settings
-        self.generation_config = {
-            'temperature': 0.1,  # Low temperature for more deterministic outputs
-            'max_output_tokens': 2048,
-        }
-
-    def call(self, prompt: str, system_instruction: str = None) -> str:
-        """Make Gemini API call"""
-        try:
-            # Combine system instruction with prompt if provided
-            if system_instruction:
-                full_prompt = f"{system_instruction}\n\n{prompt}"
-            else:
-                full_prompt = prompt
-
-            # Generate response using the new SDK
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=full_prompt,
-                config=self.generation_config
-            )
+@st.cache_resource
+def export_knowledge_graph_files(file_path: str, fingerprint: str) -> dict:
+    """Write the export files once per graph version (cached as a resource)"""
+    return save_knowledge_graph(build_knowledge_graph(file_path))
 
-            return response.text
 
-        except Exception as e:
-            raise Exception(f"Gemini API error: {str(e)}")
+@st.cache_resource
+def get_llm_client() -> ResilientLLMClient:
+    """Shared Gemini client (cached as a resource so cached contexts and latency history survive reruns)"""
+    # Optional second model to answer while the primary one is failing
+    fallback_model = os.getenv('GEMINI_FALLBACK_MODEL')
+    fallback = GeminiClient(model_name=fallback_model) if fallback_model else None
+    return ResilientLLMClient(GeminiClient(), fallback=fallback)
 
 
-# ============================================
-# TEXT-TO-SQL PIPELINE
-# ============================================
+@st.cache_resource
+def get_sql_preview(file_path: str, sample_dir: str, fingerprint: str) -> SqlPreview:
+    """Embedded database over the sample files (cached as a resource; raises PreviewError)"""
+    return SqlPreview(build_knowledge_graph(file_path), sample_dir)
 
-class TextToSQLPipeline:
-    def __init__(self, kg: TableKnowledgeGraph, llm_client: GeminiClient):
-        self.kg = kg
-        self.llm = llm_client
-    
-    def identify_tables(self, user_query: str) -> Dict:
-        """Step 1: Identify required tables using LLM"""
-        # Build schema context
-        schema_context = "Available tables and their descriptions:\n\n"
 
-        for table_name, columns in self.kg.schemas.items():
-            schema_context += f"Table: {table_name}\n"
-            schema_context += "Key columns:\n"
-            for col in columns[:15]:  # Show first 15 columns
-                schema_context += f"  - {col['name']}: {col['description']}\n"
-            schema_context += "\n"
+@st.cache_resource
+def get_graph_artifacts(file_path: str) -> GraphArtifacts:
+    """Download files of the knowledge graph (cached as a resource; built on request)"""
+    return GraphArtifacts(build_knowledge_graph(file_path))
 
-        print(schema_context)
 
-        prompt = f"""{schema_context}
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """Background pipeline jobs shared by all sessions (cached as a resource)"""
+    return JobQueue()
 
-        
 
-User Query: "{user_query}"
+# ============================================
+# QUERY RESULTS
+# ============================================
 
-Based on the query, identify which tables are needed. Follow these guidelines:
+PIPELINE_STAGES = {
+    "template_lookup": "Checking query templates",
+    "identify_tables": "Identifying tables with Gemini",
+    "join_info": "Looking up joins in the knowledge graph",
+    "generate_sql": "Generating SQL with Gemini",
+    "validate": "Validating SQL"
+}
+
+
+def render_artifact_download(artifacts: GraphArtifacts, fmt: str, label: str):
+    """Prepare button until the file exists, then the download button"""
+    if not artifacts.ready(fmt):
+        if st.button(f"⚙️ Prepare {label} export", key=f"prepare_{fmt}", use_container_width=True):
+            with st.spinner(f"Serializing the graph as {label}..."):
+                artifacts.get(fmt)
+    if artifacts.ready(fmt):
+        st.download_button(
+            label=f"📥 Download as {label}",
+            data=artifacts.get(fmt),
+            file_name=artifacts.file_name(fmt),
+            mime=artifacts.mime(fmt),
+            use_container_width=True
+        )
 
-1. If the query asks about "concentration", you typically need BOTH the "Counterparty" and "Concentration" tables joined together.
-2. If the query asks about "trades", you typically need BOTH the "Counterparty" and "Trade" tables joined together.
-3. If the query specifically asks only about counterparty attributes, you may only need the "Counterparty" table.
 
-Also identify if there's a specific context mentioned:
-- If the query mentions "country" or "countries" or "by country", set context to "Country"
-- If the query mentions "rating" or "ratings" or "by rating", set context to "Rating"
-- If the query mentions "sector" or "sectors" or "by sector", set context to "Sector"
-- Otherwise, set context to null
+def render_job_progress(job: Job):
+    """Live progress of a running pipeline job"""
+    stage = job.stage
+    position = list(PIPELINE_STAGES).index(stage) + 1 if stage in PIPELINE_STAGES else 0
+    st.progress(
+        position / len(PIPELINE_STAGES),
+        text=f"🔄 {PIPELINE_STAGES.get(stage, 'Waiting for a worker')}... \"{job.label}\""
+    )
+    for done in job.stages[:-1]:
+        st.caption(f"✓ {PIPELINE_STAGES.get(done['stage'], done['stage'])} "
+                   f"({done['finished'] - done['started']:.1f}s)")
 
-IMPORTANT: Use the EXACT table names as shown above (e.g., "Counterparty", "Concentration", "Trade"), not descriptive names.
 
-Return ONLY a JSON object with this exact structure (no additional text, no markdown formatting):
-{{
-    "tables": ["Counterparty", "Concentration"],
-    "context": "Country",
-    "reasoning": "brief explanation"
-}}
+def render_preview(job_id: str, sql_query: str):
+    """Run the SQL on the local sample data on request and show the first rows"""
+    preview_key = f"preview_{job_id}"
+    if st.button("▶️ Preview on sample data", key=f"run_preview_{job_id}",
+                 help=f"Runs the query in an embedded DuckDB database over the files in {SAMPLE_DIR}/"):
+        try:
+            sql_preview = get_sql_preview(
+                EXCEL_FILE_PATH, SAMPLE_DIR, build_knowledge_graph(EXCEL_FILE_PATH).fingerprint
+            )
+            st.session_state[preview_key] = {**sql_preview.run(sql_query), "unreadable": sql_preview.unreadable}
+        except PreviewError as e:
+            st.session_state[preview_key] = e
+
+    preview = st.session_state.get(preview_key)
+    if isinstance(preview, PreviewError):
+        st.error(f"Preview failed: {preview}")
+    elif preview is not None:
+        # The Arrow table goes to the frontend without a pandas conversion
+        st.dataframe(preview['table'], use_container_width=True)
+        more = " (more rows not shown)" if preview['truncated'] else ""
+        st.caption(f"{preview['rows']} rows{more} in {preview['seconds']:.2f}s")
+        if preview.get('unreadable'):
+            st.warning(f"Unreadable sample files, queried as empty tables: {', '.join(preview['unreadable'])}")
+
+
+def render_job_result(job: Job):
+    """Generated SQL and processing details of a finished job"""
+    if job.status == "cancelled":
+        st.info(f"Query cancelled: \"{job.label}\"")
+        return
+    if job.status == "failed":
+        st.error(f"❌ Error: {job.error}")
+        with st.expander("View Error Details"):
+            st.exception(job.exception)
+        return
+
+    result = job.result
+
+    # Display results
+    st.success("✅ SQL query generated successfully!")
+
+    # Show the SQL query prominently
+    st.subheader("📊 Generated SQL Query")
+    st.code(result['sql_query'], language='sql')
+
+    # Identifiers that are not exact table/column names (e.g. an unexpanded column family)
+    for unknown in result['validation']['unknown_identifiers']:
+        message = f"⚠️ Unknown column or table: \"{unknown['identifier']}\""
+        if unknown['family_members']:
+            message += f" - expands to {', '.join(unknown['family_members'])}"
+        st.warning(message)
+
+    # Download button
+    st.download_button(
+        label="📥 Download SQL",
+        data=result['sql_query'],
+        file_name="generated_query.sql",
+        mime="text/plain"
+    )
 
-The table names in the "tables" array must match exactly the table names shown in the schema above."""
+    render_preview(job.id, result['sql_query'])
 
-        system_instruction = "You are a database expert. Analyze queries and identify required tables. Return only valid JSON without any markdown formatting or additional text."
+    # Show details in expander
+    with st.expander("🔍 View Processing Details"):
+        col_a, col_b = st.columns(2)
 
-        response = self.llm.call(prompt, system_instruction)
-        
-        # Parse JSON from response
-        try:
-            # Clean up response - remove markdown code blocks if present
-            response = response.strip()
-            if response.startswith('```json'):
-                response = response[7:]
-            elif response.startswith('```'):
-                response = response[3:]
-            if response.endswith('```'):
-                response = response[:-3]
-            response = response.strip()
-            
-            # Try to extract JSON if there's extra text
-            start = response.find('{')
-            end = response.rfind('}') + 1
-            if start != -1 and end > start:
-                json_str = response[start:end]
-                result = json.loads(json_str)
-                return result
-            else:
-                result = json.loads(response)
-                return result
-        except json.JSONDecodeError as e:
-            st.error(f"Failed to parse LLM response: {response}")
-            raise e
-    
-    def get_join_info(self, tables: List[str], context: Optional[str]) -> Dict:
-        """Step 2: Get join information from Knowledge Graph"""
-        # Get all tables including intermediate ones
-        all_tables = self.kg.get_all_tables_needed(tables)
-
-        # Get join relationships
-        joins = self.kg.get_join_relationships(all_tables, context)
-
-        # Get schemas
-        schemas = self.kg.get_columns_for_tables(all_tables)
-
-        return {
-            "requested_tables": tables,
-            "all_tables_needed": all_tables,
-            "joins": joins,
-            "schemas": schemas,
-            "context": context
-        }
-    
-    def generate_sql(self, user_query: str, join_info: Dict) -> str:
-        """Step 3: Generate SQL query using LLM"""
-        # Build comprehensive context
-        context = f"""Generate a SQL query for the following request.
-
-USER QUERY: "{user_query}"
-
-TABLES TO USE: {', '.join(join_info['all_tables_needed'])}
-
-JOIN RELATIONSHIPS:
-"""
+        with col_a:
+            st.markdown("### Step 1: Table Identification")
+            st.json(result['table_info'])
 
-        for join in join_info['joins']:
-            context += f"\n{join['from_table']} {join['join_type']} JOIN {join['to_table']}"
-            context += f"\nON {join['join_condition']}"
-
-            # Emphasize multi-part joins
-            if " AND " in join['join_condition']:
-                context += f"\n*** THIS IS A COMPOSITE JOIN - YOU MUST USE ALL CONDITIONS: {join['join_condition']} ***"
-
-            if join.get('description'):
-                context += f"\n({join['description']})"
-            context += "\n"
-        
-        context += "\n\nTABLE SCHEMAS (with all columns and descriptions):\n"
-        
-        for table, columns in join_info['schemas'].items():
-            context += f"\n{table}:\n"
-            for col in columns:
-                context += f"  - {col['name']}: {col['description']}\n"
-        
-        context += """
-
-INSTRUCTIONS FOR SQL GENERATION:
-
-1. JOIN CONDITIONS - ABSOLUTELY CRITICAL:
-   - Copy the EXACT join condition from above into your ON clause
-   - If you see " AND " in the join condition, that means MULTIPLE conditions - use ALL of them
-   - DO NOT simplify or omit any part of the join condition
-   - DO NOT use only one part of a multi-part join condition
-
-2. SELECT relevant columns based on the user query
-
-3. Include appropriate WHERE clauses if needed
-
-4. Use table aliases for readability
-
-5. Format properly with indentation
-
-EXAMPLE OF CORRECT JOIN USAGE:
-If the join condition provided is:
-"Counterparty.Entity = Trade.Entity AND Counterparty.Counterparty ID = Trade.Reporting Counterparty ID"
-
-Your ON clause MUST be:
-ON c.Entity = t.Entity AND c."Counterparty ID" = t."Reporting Counterparty ID"
-
-NOT just: ON c."Counterparty ID" = t."Reporting Counterparty ID"  (WRONG - missing Entity)
-NOT just: ON c.Entity = t.Entity  (WRONG - missing Counterparty ID)
-
-Return ONLY the SQL query without any explanations, markdown formatting, or code blocks."""
-        
-        system_instruction = "You are a SQL expert. Generate accurate, well-formatted SQL queries based on provided schema and join information. CRITICAL: You MUST use ALL parts of every join condition provided - never omit any condition. Return only the SQL query without any markdown formatting or explanations."
-        
-        sql_query = self.llm.call(context, system_instruction)
-        
-        # Clean up the response
-        sql_query = sql_query.strip()
-        if sql_query.startswith('```sql'):
-            sql_query = sql_query[6:]
-        elif sql_query.startswith('```'):
-            sql_query = sql_query[3:]
-        if sql_query.endswith('```'):
-            sql_query = sql_query[:-3]
-        
-        return sql_query.strip()
-    
-    def process(self, user_query: str) -> Dict:
-        """Execute complete pipeline"""
-        # Step 1: Identify tables
-        table_info = self.identify_tables(user_query)
-        
-        # Step 2: Get join information
-        join_info = self.get_join_info(
-            table_info['tables'], 
-            table_info.get('context')
-        )
-        
-        # Step 3: Generate SQL
-        sql_query = self.generate_sql(user_query, join_info)
-        
-        return {
-            "user_query": user_query,
-            "table_info": table_info,
-            "join_info": join_info,
-            "sql_query": sql_query
-        }
+        with col_b:
+            st.markdown("### Step 2: Join Information")
+            st.write(f"**Tables needed:** {', '.join(result['join_info']['all_tables_needed'])}")
+            st.write(f"**Number of joins:** {len(result['join_info']['joins'])}")
+            join_plan = result['join_info'].get('join_plan')
+            if join_plan:
+                st.write(f"**Join order:** {' → '.join(join_plan['join_order'])} "
+                         f"(~{join_plan['estimated_rows']:,.0f} rows before filters)")
+            if result.get('graph_fingerprint'):
+                st.caption(f"Schema version {result['graph_fingerprint'][:16]}")
+            if result.get('template', {}).get('hit'):
+                st.write(f"**Template cache:** hit {result['template']['parameters']}")
+            if 'speculation' in result:
+                speculation = result['speculation']
+                st.write(f"**Speculation:** {'hit' if speculation['hit'] else 'miss'} "
+                         f"({speculation['candidates']} candidates)")
+            for prompt in result.get('prompts', []):
+                cached = " (cached context)" if prompt['cached_context'] else ""
+                rejected = f" - rejected: {prompt['rejected']}" if prompt.get('rejected') else ""
+                st.write(f"**{prompt['step']} prompt ({prompt['model']}):** ~{prompt['prompt_tokens']} "
+                         f"of {prompt['budget']} tokens{cached}{rejected}")
+            for stage in job.stages:
+                st.write(f"**{PIPELINE_STAGES.get(stage['stage'], stage['stage'])}:** "
+                         f"{stage['finished'] - stage['started']:.2f}s")
+
+        st.markdown("### Join Details")
+        for i, join in enumerate(result['join_info']['joins'], 1):
+            st.markdown(f"**Join {i}:** {join['from_table']} → {join['to_table']}")
+            st.code(join['join_condition'], language='sql')
 
 
 # ============================================
@@ -734,6 +286,7 @@ def main():
 
     # Create tabs
     tab1, tab2 = st.tabs(["🚀 Query Generator", "🕸️ Knowledge Graph"])
+    poll_job = False  # rerun once the page is drawn while a background job is running
 
     # Sidebar configuration
     with st.sidebar:
@@ -763,6 +316,57 @@ def main():
 
         st.divider()
 
+        # Latency options
+        with st.expander("⚡ Latency Options"):
+            speculative_enabled = st.checkbox(
+                "Generate SQL while identifying tables",
+                value=False,
+                help="Starts SQL generation for the most likely table sets in parallel with table identification. "
+                     "Hides most of the first LLM round trip at the cost of extra LLM calls."
+            )
+            speculative_candidates = st.slider(
+                "Extra candidates",
+                min_value=1,
+                max_value=4,
+                value=1,
+                disabled=not speculative_enabled,
+                help="Maximum number of additional SQL generation calls per query"
+            )
+
+            reuse_templates = st.checkbox(
+                "Reuse SQL for repeat-shaped questions",
+                value=False,
+                help="Questions that differ only in a literal (rating, country, ID, date...) "
+                     "are answered from a cached SQL template without calling Gemini."
+            )
+
+            use_cascade = st.checkbox(
+                "Try a faster model first",
+                value=False,
+                help=f"Each step first asks {FAST_MODEL} and only falls back to the default model "
+                     "when the answer fails local checks (invalid JSON, unknown tables, incomplete joins)."
+            )
+
+            skeleton_sql = st.checkbox(
+                "Build joins from the knowledge graph",
+                value=False,
+                help="The FROM/JOIN clause is assembled from the join plan and Gemini only returns "
+                     "the SELECT list and the WHERE, GROUP BY and ORDER BY clauses as JSON. "
+                     "Fewer output tokens, and composite join conditions are always complete."
+            )
+
+            token_budget = st.number_input(
+                "Prompt token budget",
+                min_value=1000,
+                max_value=100000,
+                value=8000,
+                step=1000,
+                help="Estimated tokens per Gemini call. Schema columns least relevant to the question "
+                     "are left out of the prompt once the budget is reached."
+            )
+
+        st.divider()
+
         # Data source info
         with st.expander("📁 Data Source"):
             st.markdown(f"""
@@ -779,15 +383,29 @@ def main():
     kg = build_knowledge_graph(EXCEL_FILE_PATH)
 
     if kg:
-        # Auto-save knowledge graph on app startup
+        with st.sidebar.expander("🔖 Schema Version"):
+            st.code(kg.fingerprint[:16])
+            if st.button("🔄 Reload schema workbook", use_container_width=True):
+                load_excel_data.clear()
+                schemas, relationships = load_excel_data(EXCEL_FILE_PATH)
+                if schemas and relationships and kg.rebuild(
+                        schemas, relationships,
+                        stats_loader=lambda graph: load_table_stats(graph, EXCEL_FILE_PATH, SAMPLE_DIR)):
+                    st.success(f"Schema changed: now {kg.fingerprint[:16]}")
+                elif schemas and relationships:
+                    st.info("Schema unchanged")
+
+        # Auto-save knowledge graph on app startup (once per schema version)
         try:
-            saved_files = save_knowledge_graph(kg)
+            saved_files = export_knowledge_graph_files(EXCEL_FILE_PATH, kg.fingerprint)
             st.sidebar.success(f"Knowledge graph exported!")
             with st.sidebar.expander("View Export Details"):
                 st.markdown(f"**Timestamp:** {saved_files['timestamp']}")
                 st.markdown(f"**JSON:** `{saved_files['json_path']}`")
                 st.markdown(f"**GraphML:** `{saved_files['graphml_path']}`")
                 st.markdown(f"**Stats:** `{saved_files['stats_path']}`")
+                if saved_files['tables_path']:
+                    st.markdown(f"**Arrow tables:** `{saved_files['tables_path']}`")
         except Exception as e:
             st.sidebar.warning(f"Could not auto-save knowledge graph: {e}")
 
@@ -832,7 +450,10 @@ def main():
             - Mention if you want data by country, rating, or sector
             """)
 
-        # Process query
+        # Run the query in the background: widget changes rerun the script but not the job
+        session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+        job_queue = get_job_queue()
+
         if generate_button:
             if not user_query:
                 st.warning("Please enter a query first!")
@@ -843,57 +464,41 @@ def main():
                 st.info("Please add GOOGLE_API_KEY to your .env file")
                 return
 
-            try:
-                with st.spinner("🔄 Processing your query with Gemini..."):
-                    # Reuse the knowledge graph already loaded at app startup
-                    if not kg:
-                        st.error("Failed to load knowledge graph!")
-                        return
-
-                    # Initialize components
-                    llm_client = GeminiClient()
-                    pipeline = TextToSQLPipeline(kg, llm_client)
-
-                    # Process query
-                    result = pipeline.process(user_query)
-
-                    # Display results
-                    st.success("✅ SQL query generated successfully!")
-
-                    # Show the SQL query prominently
-                    st.subheader("📊 Generated SQL Query")
-                    st.code(result['sql_query'], language='sql')
-
-                    # Download button
-                    st.download_button(
-                        label="📥 Download SQL",
-                        data=result['sql_query'],
-                        file_name="generated_query.sql",
-                        mime="text/plain"
-                    )
-
-                    # Show details in expander
-                    with st.expander("🔍 View Processing Details"):
-                        col_a, col_b = st.columns(2)
-
-                        with col_a:
-                            st.markdown("### Step 1: Table Identification")
-                            st.json(result['table_info'])
-
-                        with col_b:
-                            st.markdown("### Step 2: Join Information")
-                            st.write(f"**Tables needed:** {', '.join(result['join_info']['all_tables_needed'])}")
-                            st.write(f"**Number of joins:** {len(result['join_info']['joins'])}")
-
-                        st.markdown("### Join Details")
-                        for i, join in enumerate(result['join_info']['joins'], 1):
-                            st.markdown(f"**Join {i}:** {join['from_table']} → {join['to_table']}")
-                            st.code(join['join_condition'], language='sql')
-
-            except Exception as e:
-                st.error(f"❌ Error: {str(e)}")
-                with st.expander("View Error Details"):
-                    st.exception(e)
+            # Reuse the knowledge graph already loaded at app startup
+            if not kg:
+                st.error("Failed to load knowledge graph!")
+                return
+
+            # Initialize components
+            llm_client = get_llm_client()
+            pipeline = TextToSQLPipeline(
+                kg,
+                llm_client,
+                speculative_candidates=speculative_candidates if speculative_enabled else 0,
+                template_cache=get_template_cache(EXCEL_FILE_PATH, kg.fingerprint) if reuse_templates else None,
+                prompt_budget=PromptBudget(int(token_budget)),
+                model_cascade=[FAST_MODEL, None] if use_cascade else None,
+                skeleton_sql=skeleton_sql
+            )
+
+            # Process query
+            job_queue.submit(session_id, pipeline.process, user_query, label=user_query)
+            st.session_state.pop('last_job', None)
+
+        job = job_queue.get(session_id)
+        if job is not None and job.active:
+            render_job_progress(job)
+            if st.button("⏹️ Cancel", key="cancel_job"):
+                job_queue.cancel(session_id)
+            poll_job = True
+        elif job is not None:
+            # Keep the finished job in session state so later reruns still show it
+            st.session_state['last_job'] = job
+            job_queue.discard(session_id)
+
+        last_job = st.session_state.get('last_job')
+        if last_job is not None:
+            render_job_result(last_job)
 
     # TAB 2: Knowledge Graph Visualization
     with tab2:
@@ -922,6 +527,25 @@ def main():
         with col4:
             st.metric("Connected", "Yes" if stats['is_connected'] else "No")
 
+        analytics = kg.analytics
+        with st.expander("📈 Graph Analytics"):
+            col_hubs, col_structure = st.columns(2)
+            with col_hubs:
+                st.markdown("**Hub tables**")
+                st.dataframe(analytics.hubs, use_container_width=True, hide_index=True)
+                st.markdown("**Relationships per context**")
+                st.dataframe(
+                    [{"context": c, "relationships": n} for c, n in analytics.context_counts.items()],
+                    use_container_width=True, hide_index=True
+                )
+            with col_structure:
+                st.markdown("**Articulation points** (removing one disconnects other tables)")
+                st.write(", ".join(analytics.articulation_points) or "None")
+                st.markdown(f"**Connected components:** {len(analytics.components)}")
+                for component in analytics.components[:10]:
+                    st.caption(f"{len(component)} tables: {', '.join(component[:10])}"
+                               f"{'...' if len(component) > 10 else ''}")
+
         st.divider()
 
         # Option to highlight specific tables
@@ -932,78 +556,71 @@ def main():
             default=[]
         )
 
-        # Display the graph
-        fig = kg.visualize_graph_plotly(highlight_tables=selected_tables if selected_tables else None)
-        st.plotly_chart(fig, use_container_width=True)
+        # Focus on the selected tables' neighborhood; large catalogs are only drawn that way
+        col_focus, col_context = st.columns(2)
+        large = stats['total_tables'] > LARGE_GRAPH_TABLES
+        with col_focus:
+            focus = st.checkbox(
+                "Show only the neighborhood of the selected tables",
+                value=large,
+                disabled=large or not selected_tables,
+                help="Lays out and draws only tables within a few joins of the selection and the join paths between them"
+                     + (f"; always on above {LARGE_GRAPH_TABLES} tables" if large else "")
+            )
+            hops = st.slider("Neighborhood size (joins away)", min_value=0, max_value=3, value=1,
+                             disabled=not (focus and selected_tables))
+        with col_context:
+            all_contexts = kg.edge_contexts()
+            contexts = st.multiselect("Join contexts to show:", options=all_contexts, default=all_contexts)
+
+        if large and not selected_tables:
+            st.info(f"The catalog has {stats['total_tables']} tables; select tables to draw their neighborhood.")
+        else:
+            # Display the graph
+            fig = kg.visualize_graph_plotly(
+                highlight_tables=selected_tables if selected_tables else None,
+                focus_hops=hops if focus and selected_tables else None,
+                contexts=contexts if len(contexts) < len(all_contexts) else None
+            )
+            st.plotly_chart(fig, use_container_width=True)
 
         # Export options
         st.divider()
         st.markdown("#### Export Graph Data")
 
+        # Files are serialized only when first asked for, then shared by all sessions
+        artifacts = get_graph_artifacts(EXCEL_FILE_PATH)
         col_a, col_b = st.columns(2)
 
         with col_a:
-            # Export as JSON
-            graph_data = kg.export_graph_data()
-            graph_json = json.dumps(graph_data, indent=2)
-
-            st.download_button(
-                label="📥 Download as JSON",
-                data=graph_json,
-                file_name="knowledge_graph.json",
-                mime="application/json",
-                use_container_width=True
-            )
+            render_artifact_download(artifacts, "json", "JSON")
 
         with col_b:
-            # Export as GraphML (NetworkX format)
-            # Convert list attributes to strings for GraphML compatibility
-            import io
-            buffer = io.BytesIO()
-
-            # Create a copy of the graph for export
-            export_graph = kg.graph.copy()
-            for node in export_graph.nodes():
-                if 'columns' in export_graph.nodes[node]:
-                    export_graph.nodes[node]['columns'] = ','.join(export_graph.nodes[node]['columns'])
-            # Handle MultiDiGraph edges
-            for edge in export_graph.edges(keys=True):
-                source, target, key = edge
-                edge_data = export_graph.get_edge_data(source, target, key)
-                if 'source_columns' in edge_data:
-                    edge_data['source_columns'] = ','.join(edge_data['source_columns'])
-                if 'target_columns' in edge_data:
-                    edge_data['target_columns'] = ','.join(edge_data['target_columns'])
-
-            nx.write_graphml(export_graph, buffer)
-            buffer.seek(0)
-
-            st.download_button(
-                label="📥 Download as GraphML",
-                data=buffer.getvalue(),
-                file_name="knowledge_graph.graphml",
-                mime="application/xml",
-                use_container_width=True
-            )
+            render_artifact_download(artifacts, "graphml", "GraphML")
 
         # Show detailed graph information
         with st.expander("🔍 View Detailed Graph Data"):
+            # Read straight from the graph; no export dicts are built per rerun
             st.markdown("### Tables (Nodes)")
-            for node_data in graph_data['nodes']:
-                st.markdown(f"**{node_data['table_name']}** ({node_data['column_count']} columns)")
+            for table, columns in kg.schemas.items():
+                st.markdown(f"**{table}** ({len(columns)} columns)")
                 with st.container():
-                    cols_str = ", ".join(node_data['columns'])
+                    cols_str = ", ".join(columns.names)
                     st.text(cols_str)
                 st.divider()
 
             st.markdown("### Relationships (Edges)")
-            for edge_data in graph_data['edges']:
-                st.markdown(f"**{edge_data['from']}** → **{edge_data['to']}**")
+            for source, target, edge_data in kg.graph.edges(data=True):
+                st.markdown(f"**{source}** → **{target}**")
                 st.text(f"Join: {', '.join(edge_data['source_columns'])} = {', '.join(edge_data['target_columns'])}")
-                st.text(f"Type: {edge_data['join_type']} | Context: {edge_data['context']}")
-                st.caption(edge_data['description'])
+                st.text(f"Type: {edge_data['join_type']} | Context: {edge_data.get('context', 'default')}")
+                st.caption(edge_data.get('description', ''))
                 st.divider()
 
+    if poll_job:
+        time.sleep(0.5)
+        st.rerun()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
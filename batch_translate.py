@@ -0,0 +1,90 @@
+"""
+Batch Text-to-SQL translation
+File: batch_translate.py
+
+Translates a file of questions to SQL, classifying the tables for many questions per
+LLM call. Input is JSONL with "id" and "question" fields, or plain text with one
+question per line; output is JSONL with one result per question.
+
+Usage: python batch_translate.py questions.jsonl results.jsonl [--batch-size 20]
+"""
+
+import argparse
+import json
+import sys
+
+from dotenv import load_dotenv
+
+from knowledge_graph import TableKnowledgeGraph
+from llm_client import GeminiClient
+from pipeline import TextToSQLPipeline
+from query_templates import QueryTemplateCache
+from schema_loader import read_schema_workbook
+from sql_preview import SAMPLE_DATA_DIR
+from table_stats import load_table_stats
+
+EXCEL_FILE_PATH = "AI_SampleDataStruture.xlsx"
+
+
+def read_questions(path: str) -> dict:
+    """Question ID -> question text; plain lines are numbered from 1"""
+    questions = {}
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                record = json.loads(line)
+                questions[str(record.get('id', number))] = record['question']
+            else:
+                questions[str(number)] = line
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate a file of questions to SQL")
+    parser.add_argument("input", help="JSONL ({\"id\", \"question\"}) or one question per line")
+    parser.add_argument("output", help="JSONL file to write results to")
+    parser.add_argument("--schema", default=EXCEL_FILE_PATH, help="Schema workbook")
+    parser.add_argument("--sample-dir", default=SAMPLE_DATA_DIR,
+                        help="Sample files to compute table statistics from when the workbook has no Stats sheet")
+    parser.add_argument("--batch-size", type=int, default=20, help="Questions per table identification call")
+    parser.add_argument("--skeleton-sql", action="store_true",
+                        help="Build FROM/JOIN from the join plan; the LLM returns only the other clauses")
+    args = parser.parse_args()
+
+    load_dotenv()
+    schemas, relationships = read_schema_workbook(args.schema)
+    kg = TableKnowledgeGraph(schemas, relationships)
+    kg.set_statistics(load_table_stats(kg, args.schema, args.sample_dir))
+    pipeline = TextToSQLPipeline(kg, GeminiClient(), template_cache=QueryTemplateCache(kg.schemas),
+                                 skeleton_sql=args.skeleton_sql)
+
+    questions = read_questions(args.input)
+    results = pipeline.process_batch(questions, batch_size=args.batch_size)
+
+    failed = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for qid, result in results.items():
+            record = {"id": qid, "question": result['user_query']}
+            if 'error' in result:
+                failed += 1
+                record['error'] = result['error']
+            else:
+                record.update({
+                    "sql": result['sql_query'],
+                    "graph_fingerprint": result['graph_fingerprint'],
+                    "tables": result['join_info']['all_tables_needed'],
+                    "context": result['table_info'].get('context'),
+                    "valid": result['validation']['valid']
+                })
+            f.write(json.dumps(record) + "\n")
+
+    calls = len(pipeline.prompt_log)
+    print(f"Translated {len(results) - failed}/{len(results)} questions with {calls} LLM calls -> {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Cold-start import benchmark
+Measures how long each module takes to import in a fresh interpreter and which
+heavy libraries it pulls in.
+
+Usage: python bench_startup.py [--repeat 5] [--check] [module ...]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Core modules must import without any of these
+HEAVY_MODULES = ['streamlit', 'plotly', 'matplotlib', 'google.genai', 'pandas']
+CORE_MODULES = ['knowledge_graph', 'pipeline', 'llm_client', 'schema_loader']
+DEFAULT_MODULES = CORE_MODULES + ['app']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """Import a module in `repeat` fresh interpreters"""
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True,
+            text=True
+        )
+        if completed.returncode != 0:
+            return {"module": module, "error": completed.stderr.strip().splitlines()[-1]}
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        loaded = result['loaded']
+
+    return {
+        "module": module,
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "heavy_loaded": loaded
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import benchmark")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit non-zero if a core module imports a heavy library")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("COLD-START IMPORT BENCHMARK")
+    print("=" * 60)
+
+    failed = False
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        if 'error' in result:
+            print(f"{module:<20} ERROR: {result['error']}")
+            failed = True
+            continue
+
+        heavy = ', '.join(result['heavy_loaded']) or '-'
+        print(f"{module:<20} median {result['median_ms']:8.1f} ms   min {result['min_ms']:8.1f} ms   heavy: {heavy}")
+        if args.check and module in CORE_MODULES and result['heavy_loaded']:
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Compact column metadata store
+File: column_store.py
+
+Holds column metadata as parallel tuples per table instead of one dict per column.
+Names are interned, identical descriptions are stored once, and the knowledge graph
+nodes share the same name tuples. A read-only dict-like view keeps code written
+against ``schemas[table][i]['name']`` working unchanged.
+"""
+
+import sys
+from collections.abc import Mapping, Sequence
+from typing import Dict, List
+
+
+class ColumnRecord(Mapping):
+    """Read-only dict view of one column: keys name, description and example"""
+
+    __slots__ = ('_table', '_index')
+
+    KEYS = ('name', 'description', 'example')
+
+    def __init__(self, table: 'TableColumns', index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def name(self) -> str:
+        return self._table.names[self._index]
+
+    @property
+    def description(self) -> str:
+        return self._table.descriptions[self._index]
+
+    @property
+    def example(self):
+        return self._table.examples[self._index]
+
+    def __getitem__(self, key):
+        if key == 'name':
+            return self._table.names[self._index]
+        if key == 'description':
+            return self._table.descriptions[self._index]
+        if key == 'example':
+            return self._table.examples[self._index]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class TableColumns(Sequence):
+    """Columns of one table as parallel tuples; indexing yields ColumnRecord views"""
+
+    __slots__ = ('table_name', 'names', 'descriptions', 'examples', '_positions')
+
+    def __init__(self, table_name: str, names: tuple, descriptions: tuple, examples: tuple):
+        self.table_name = table_name
+        self.names = names
+        self.descriptions = descriptions
+        self.examples = examples
+        self._positions = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ColumnRecord(self, i) for i in range(*index.indices(len(self.names)))]
+        if index < 0:
+            index += len(self.names)
+        if not 0 <= index < len(self.names):
+            raise IndexError(index)
+        return ColumnRecord(self, index)
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_of(self, column_name: str) -> int:
+        """Position of a column by name (lookup table built on first use)"""
+        if self._positions is None:
+            self._positions = {name: i for i, name in enumerate(self.names)}
+        return self._positions[column_name]
+
+    def to_dicts(self) -> List[Dict]:
+        """Plain per-column dicts, e.g. for JSON serialization"""
+        return [
+            {"name": n, "description": d, "example": e}
+            for n, d, e in zip(self.names, self.descriptions, self.examples)
+        ]
+
+    def __repr__(self):
+        return f"TableColumns({self.table_name!r}, {len(self.names)} columns)"
+
+
+class ColumnStore(Mapping):
+    """All tables' column metadata, mapping table name -> TableColumns"""
+
+    def __init__(self):
+        self._tables = {}
+        self._descriptions = {}  # pool so repeated descriptions share one string
+
+    @classmethod
+    def from_schemas(cls, schemas: Dict) -> 'ColumnStore':
+        """Build from the ``{table: [{"name", "description", "example"}, ...]}`` layout"""
+        store = cls()
+        for table_name, columns in schemas.items():
+            store.add_table(table_name, columns)
+        return store
+
+    def _shared_description(self, description):
+        if not isinstance(description, str):
+            return description
+        return self._descriptions.setdefault(description, description)
+
+    def add_table(self, table_name: str, columns):
+        """Add a table from an iterable of column dicts or ColumnRecords"""
+        if isinstance(columns, TableColumns):
+            names, descriptions, examples = columns.names, columns.descriptions, columns.examples
+        else:
+            names, descriptions, examples = [], [], []
+            for col in columns:
+                names.append(col['name'])
+                descriptions.append(col.get('description', ''))
+                examples.append(col.get('example', ''))
+
+        self._tables[sys.intern(table_name)] = TableColumns(
+            table_name,
+            tuple(sys.intern(n) if isinstance(n, str) else n for n in names),
+            tuple(self._shared_description(d) for d in descriptions),
+            tuple(examples)
+        )
+
+    def add_pooled_table(self, table_name: str, names: tuple, descriptions: tuple, examples: tuple):
+        """Add a table from tuples whose strings the caller has already interned and pooled"""
+        self._tables[sys.intern(table_name)] = TableColumns(table_name, names, descriptions, examples)
+
+    def __getitem__(self, table_name: str) -> TableColumns:
+        return self._tables[table_name]
+
+    def __iter__(self):
+        return iter(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+    def to_dict(self) -> Dict:
+        """Plain ``{table: [column dict, ...]}`` copy"""
+        return {table: columns.to_dicts() for table, columns in self._tables.items()}
@@ -0,0 +1,159 @@
+"""
+Aho-Corasick entity matcher over table and column names
+File: entity_matcher.py
+
+Builds one multi-pattern automaton over every table name, column name and common
+alias in the schema, then scans a question in a single pass to find which tables
+and columns it mentions. Build cost is linear in the total length of the names and
+scan cost is linear in the question length, independent of the number of names.
+"""
+
+from collections import deque
+from typing import Dict, List
+
+
+def _table_aliases(table_name: str) -> List[str]:
+    """Lower-case spellings of a table name: as written, plural and snake_case"""
+    name = table_name.lower()
+    aliases = {name, name.replace('_', ' '), name.replace(' ', '_')}
+    if name.endswith('y'):
+        aliases.add(name[:-1] + 'ies')
+    elif name.endswith(('s', 'x', 'ch', 'sh')):
+        aliases.add(name + 'es')
+    else:
+        aliases.add(name + 's')
+    return sorted(a for a in aliases if a)
+
+
+def _column_aliases(column_name: str) -> List[str]:
+    """Lower-case spellings of a column name: as written, snake_case / spaced and '#' spelled out"""
+    name = ' '.join(str(column_name).lower().split())
+    aliases = {name, name.replace('_', ' '), name.replace(' ', '_')}
+    if name.startswith('# of '):
+        rest = name[len('# of '):]
+        aliases.update([f"number of {rest}", f"count of {rest}", f"no. of {rest}"])
+    return sorted(a for a in aliases if a)
+
+
+class EntityMatcher:
+    """Aho-Corasick automaton mapping name spellings to the tables and columns they refer to"""
+
+    def __init__(self, schemas: Dict):
+        # Trie as parallel arrays: transitions, failure link, pattern ending here, nearest output on the fail chain
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [-1]
+        self._dict_link = [-1]
+
+        self.patterns = []  # pattern text
+        self.entities = []  # per pattern: list of {"kind", "table", "column"}
+        index = {}
+
+        def add(alias: str, entity: Dict):
+            if alias not in index:
+                index[alias] = len(self.patterns)
+                self.patterns.append(alias)
+                self.entities.append([])
+                self._insert(alias, index[alias])
+            if entity not in self.entities[index[alias]]:
+                self.entities[index[alias]].append(entity)
+
+        for table_name, columns in schemas.items():
+            for alias in _table_aliases(table_name):
+                add(alias, {"kind": "table", "table": table_name, "column": None})
+            for col in columns:
+                for alias in _column_aliases(col['name']):
+                    add(alias, {"kind": "column", "table": table_name, "column": col['name']})
+
+        self._build_links()
+
+    def _insert(self, text: str, pattern_id: int):
+        node = 0
+        for char in text:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(-1)
+                self._dict_link.append(-1)
+            node = next_node
+        self._out[node] = pattern_id
+
+    def _build_links(self):
+        """Breadth-first pass computing failure and dictionary-suffix links"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._dict_link[child] = fail if self._out[fail] != -1 else self._dict_link[fail]
+
+    def match(self, query: str, longest_only: bool = True) -> List[Dict]:
+        """Find whole-word mentions of tables and columns in a query.
+
+        Returns dicts with start, end, text, kind, table and column, ordered by position.
+        With longest_only, mentions nested inside a longer one ("counterparty" inside
+        "counterparty id") are dropped.
+        """
+        text = query.lower()
+        matches = []
+        node = 0
+
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            output = node if self._out[node] != -1 else self._dict_link[node]
+            while output != -1:
+                pattern_id = self._out[output]
+                end = position + 1
+                start = end - len(self.patterns[pattern_id])
+                # Whole words only - "rate" must not match inside "rated"
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    for entity in self.entities[pattern_id]:
+                        matches.append({
+                            "start": start,
+                            "end": end,
+                            "text": query[start:end],
+                            **entity
+                        })
+                output = self._dict_link[output]
+
+        matches.sort(key=lambda m: (m['start'], -m['end']))
+
+        if longest_only:
+            # Sweep in (start, longest first) order: a mention ending inside the span seen so far is nested
+            kept = []
+            span = (-1, -1)
+            for m in matches:
+                if m['end'] < span[1] or (m['end'] == span[1] and m['start'] != span[0]):
+                    continue
+                if m['end'] > span[1]:
+                    span = (m['start'], m['end'])
+                kept.append(m)
+            matches = kept
+
+        return matches
+
+    def ground(self, query: str) -> Dict:
+        """Summarize the tables and columns a query mentions"""
+        matches = self.match(query)
+        tables = []
+        columns = {}
+        for m in matches:
+            if m['table'] not in tables:
+                tables.append(m['table'])
+            if m['kind'] == 'column':
+                table_columns = columns.setdefault(m['table'], [])
+                if m['column'] not in table_columns:
+                    table_columns.append(m['column'])
+        return {"tables": tables, "columns": columns, "matches": matches}
@@ -0,0 +1,324 @@
+"""
+Synthetic sample data generator
+File: generate_sample_data.py
+
+Writes one Parquet file per knowledge graph table with NumPy-generated rows, for
+previewing and benchmarking generated SQL. Values follow each column's example value
+pattern (ratings, ISO country codes, dates, IDs, numbers, flags), or its name when
+there is no example. Join keys are drawn from the parent table's rows, so every
+Trade."Reporting Counterparty ID" + Entity pair exists in Counterparty.
+
+Usage:
+    python generate_sample_data.py --rows 100000 --table-rows Trade=5000000
+    python generate_sample_data.py --graph-json knowledge_graph_data.json --rows 10000
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, List, NamedTuple, Union
+
+import networkx as nx
+import numpy as np
+
+from knowledge_graph import TableKnowledgeGraph
+from literals import ISO_ALPHA3, classify_value
+from sql_preview import SAMPLE_DATA_DIR
+
+EXCEL_FILE_PATH = "AI_SampleDataStruture.xlsx"
+
+RATINGS = ['AAA', 'AA+', 'AA', 'AA-', 'A+', 'A', 'A-', 'BBB+', 'BBB', 'BBB-', 'BB+', 'BB', 'BB-', 'B+', 'B', 'B-', 'CCC']
+MOODYS_RATINGS = ['Aaa', 'Aa1', 'Aa2', 'Aa3', 'A1', 'A2', 'A3', 'Baa1', 'Baa2', 'Baa3', 'Ba1', 'Ba2', 'Ba3', 'B1', 'B2', 'B3', 'Caa1']
+COUNTRIES = ['US', 'GB', 'DE', 'FR', 'JP', 'CA', 'AU', 'CH', 'NL', 'SG', 'HK', 'IT', 'ES', 'SE', 'IE', 'LU', 'CN', 'IN', 'BR', 'KR']
+CURRENCIES = ['USD', 'EUR', 'GBP', 'JPY', 'CHF', 'CAD', 'AUD', 'SGD', 'HKD']
+DEFAULT_DATE = np.datetime64('2024-12-31')
+
+# Kind guessed from the column name when the example value says nothing
+NAME_KINDS = [
+    (re.compile(r'\bdate\b', re.I), 'date'),
+    (re.compile(r'\bid\b', re.I), 'id'),
+    (re.compile(r'rating', re.I), 'rating'),
+    (re.compile(r'country', re.I), 'country'),
+    (re.compile(r'currency', re.I), 'currency'),
+    (re.compile(r'\bflag\b', re.I), 'flag'),
+    (re.compile(r'^# of|\bcount\b|\bmonth\b', re.I), 'count'),
+    (re.compile(r'notional|amount|mtm|mpe|limit|collateral|exposure|value', re.I), 'number'),
+]
+
+
+def column_kind(name: str, example) -> str:
+    """Value kind of a column: from its example value, else from its name"""
+    kind = classify_value(example)
+    if kind not in (None, 'text'):
+        return kind
+    for pattern, name_kind in NAME_KINDS:
+        if pattern.search(name):
+            return name_kind
+    return 'text'
+
+
+def _id_format(name: str, example) -> tuple:
+    """(prefix, digits) of generated IDs: from an example like CP-00123, else the name's initials"""
+    match = re.match(r'^(.*?)(\d+)$', str(example or ''))
+    if match and classify_value(example) == 'id':
+        return match.group(1), len(match.group(2))
+    initials = ''.join(word[0] for word in re.findall(r'[A-Za-z]+', name) if word.upper() != 'ID')
+    return (initials.upper() or 'ID'), 8
+
+
+def format_ids(prefix: str, numbers: np.ndarray, digits: int) -> np.ndarray:
+    """prefix + zero-padded numbers as a fixed-width unicode array, built from code points
+    without per-value string formatting"""
+    if len(numbers):
+        digits = max(digits, len(str(int(numbers.max()))))
+    width = len(prefix) + digits
+    codes = np.empty((len(numbers), width), dtype=np.uint32)
+    codes[:, :len(prefix)] = [ord(c) for c in prefix]
+    powers = 10 ** np.arange(digits - 1, -1, -1, dtype=np.int64)
+    codes[:, len(prefix):] = 48 + (numbers[:, None] // powers) % 10
+    return codes.view(f'<U{width}').ravel()
+
+
+class PooledValues(NamedTuple):
+    """Values drawn from a small pool, kept as pool + codes until they are written"""
+    pool: np.ndarray
+    codes: np.ndarray
+
+    def values(self) -> np.ndarray:
+        return self.pool[self.codes]
+
+    def to_arrow(self):
+        # Dictionary-encoded: no per-value string conversion, and Parquet stores it as is
+        import pyarrow as pa
+        return pa.DictionaryArray.from_arrays(pa.array(self.codes.astype(np.int32)), pa.array(self.pool))
+
+
+def _choice(rng: np.random.Generator, pool, n: int) -> PooledValues:
+    pool = np.asarray(pool)
+    return PooledValues(pool, rng.integers(0, len(pool), n))
+
+
+def generate_column(rng: np.random.Generator, name: str, example, n: int,
+                    offset: int = 0, unique: bool = False, pool_size: int = 50) -> np.ndarray:
+    """n values for one column; unique IDs are numbered from `offset` so chunks do not collide"""
+    values = _generate(rng, name, example, n, offset, unique, pool_size)
+    return values.values() if isinstance(values, PooledValues) else values
+
+
+def _generate(rng: np.random.Generator, name: str, example, n: int,
+              offset: int, unique: bool, pool_size: int) -> Union[np.ndarray, PooledValues]:
+    kind = column_kind(name, example)
+
+    if kind == 'id':
+        prefix, digits = _id_format(name, example)
+        numbers = np.arange(offset, offset + n) if unique else rng.integers(0, pool_size * 100, n)
+        return format_ids(prefix, numbers, digits)
+
+    if kind == 'date':
+        example_date = str(example or '')[:10]
+        base = np.datetime64(example_date) if re.fullmatch(r'\d{4}-\d{2}-\d{2}', example_date) else DEFAULT_DATE
+        if re.search(r'as of', name, re.I):
+            return np.full(n, base)  # One reporting date per extract
+        return base - rng.integers(0, 3650, n).astype('timedelta64[D]')
+
+    if kind == 'rating':
+        ratings = MOODYS_RATINGS if str(example or '')[1:2].islower() else RATINGS
+        return _choice(rng, ratings, n)
+
+    if kind == 'country':
+        countries = sorted(ISO_ALPHA3)[:60] if len(str(example or '')) == 3 else COUNTRIES
+        return _choice(rng, countries, n)
+
+    if kind == 'currency':
+        return _choice(rng, CURRENCIES, n)
+
+    if kind == 'flag':
+        text = str(example or 'Y')
+        pairs = {'Y': ('Y', 'N'), 'N': ('Y', 'N'), 'YES': ('Yes', 'No'), 'NO': ('Yes', 'No'),
+                 'TRUE': ('True', 'False'), 'FALSE': ('True', 'False')}
+        values = pairs.get(text.upper(), ('Y', 'N'))
+        if text.isupper():
+            values = tuple(v.upper() for v in values)
+        return _choice(rng, values, n)
+
+    if kind == 'count':
+        return rng.poisson(5, n)
+
+    if kind == 'number':
+        try:
+            scale = abs(float(example)) or 1e6
+        except (TypeError, ValueError):
+            scale = 1e6
+        values = rng.lognormal(np.log(scale), 1.0, n)
+        if re.fullmatch(r'-?\d+', str(example or '').strip()):
+            return values.astype(np.int64)
+        return np.round(values, 2)
+
+    # Free text: a fixed pool of labels around the example value
+    label = str(example) if example not in (None, '') and example == example else name
+    return _choice(rng, [label] + [f"{label} {k}" for k in range(2, pool_size + 1)], n)
+
+
+def _widen(target: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Target array that can hold the parent's key values without truncating them"""
+    if target.dtype == values.dtype:
+        return target
+    if target.dtype.kind in 'iuf' and values.dtype.kind in 'iuf':
+        return target.astype(np.result_type(target, values))
+    if target.dtype.kind != 'U':
+        target = target.astype(str)
+    if values.dtype.kind == 'U' and values.dtype.itemsize > target.dtype.itemsize:
+        target = target.astype(values.dtype)
+    return target
+
+
+def _generation_order(kg: TableKnowledgeGraph) -> List[str]:
+    """Parents before children; tables in a join cycle keep their schema order"""
+    try:
+        return list(nx.topological_sort(nx.DiGraph(kg.graph)))
+    except nx.NetworkXUnfeasible:
+        return list(kg.schemas)
+
+
+def generate_tables(kg: TableKnowledgeGraph, rows: Dict[str, int], output_dir: str = SAMPLE_DATA_DIR,
+                    chunk_size: int = 1_000_000, seed: int = 0) -> Dict[str, str]:
+    """Write <output_dir>/<Table>.parquet for every table; returns table -> path.
+
+    Each table is written in chunks of `chunk_size` rows. Columns that other tables join
+    on are kept in memory until the children are generated.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    # Columns other tables join on; ID-like ones are unique per row
+    parent_keys = {table: set() for table in kg.schemas}
+    for source, _, data in kg.graph.edges(data=True):
+        parent_keys[source].update(data['source_columns'])
+
+    retained = {}  # table -> {column: full array} of parent key columns
+    paths = {}
+    for table in _generation_order(kg):
+        columns = kg.schemas[table]
+        n_rows = rows.get(table, 0)
+
+        # Incoming joins from tables already generated; rows pick one join at random,
+        # e.g. a Concentration row is at country, sector or rating level
+        incoming = [
+            (source, data) for source, _, data in kg.graph.in_edges(table, data=True)
+            if source in retained and data['source_columns']
+        ]
+
+        kept = {name: [] for name in parent_keys[table]}
+        join_targets = {tgt for _, edge in incoming for tgt in edge['target_columns']}
+        path = os.path.join(output_dir, f"{table}.parquet")
+        writer = None
+        try:
+            for offset in range(0, max(n_rows, 1), chunk_size):
+                n = min(chunk_size, n_rows - offset) if n_rows else 0
+                data = {}
+                for col in columns:
+                    unique = col['name'] in parent_keys[table] and column_kind(col['name'], col['example']) == 'id'
+                    values = _generate(rng, col['name'], col['example'], n, offset, unique, pool_size=50)
+                    # Key columns are needed as plain arrays: kept for children or overwritten from parents
+                    if isinstance(values, PooledValues) and (col['name'] in kept or col['name'] in join_targets):
+                        values = values.values()
+                    data[col['name']] = values
+
+                if incoming and n:
+                    choice = rng.integers(0, len(incoming), n)
+                    for i, (source, edge) in enumerate(incoming):
+                        rows_i = np.nonzero(choice == i)[0]
+                        parent_count = len(next(iter(retained[source].values())))
+                        # Whole parent rows, so composite keys (Entity + ID) stay paired
+                        parent_rows = rng.integers(0, parent_count, len(rows_i))
+                        for src, tgt in zip(edge['source_columns'], edge['target_columns']):
+                            parent_values = retained[source][src][parent_rows]
+                            data[tgt] = _widen(data[tgt], parent_values)
+                            data[tgt][rows_i] = parent_values
+
+                for name in kept:
+                    kept[name].append(data[name])
+
+                chunk = pa.table({
+                    name: values.to_arrow() if isinstance(values, PooledValues) else pa.array(values)
+                    for name, values in data.items()
+                })
+                if writer is None:
+                    writer = pq.ParquetWriter(path, chunk.schema)
+                writer.write_table(chunk.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if kept and n_rows:
+            retained[table] = {name: np.concatenate(parts) for name, parts in kept.items()}
+        paths[table] = path
+
+    return paths
+
+
+def load_graph_json(path: str) -> TableKnowledgeGraph:
+    """Knowledge graph from an exported knowledge_graph_data.json (column names only)"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    schemas = {
+        node['table_name']: [{"name": name, "description": "", "example": ""} for name in node['columns']]
+        for node in data['nodes']
+    }
+    relationships = [
+        {
+            "table1": edge['from'],
+            "table2": edge['to'],
+            "join_key_1": "+".join(edge['source_columns']),
+            "join_key_2": "+".join(edge['target_columns']),
+            "join_type": edge['join_type'],
+            "context": edge['context'],
+            "description": edge['description']
+        }
+        for edge in data['edges']
+    ]
+    return TableKnowledgeGraph(schemas, relationships)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Parquet sample data for the schema")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--schema", default=EXCEL_FILE_PATH, help="Schema workbook")
+    source.add_argument("--graph-json", help="Exported knowledge_graph_data.json instead of the workbook")
+    parser.add_argument("--output", default=SAMPLE_DATA_DIR, help="Output directory")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows per table")
+    parser.add_argument("--table-rows", action="append", default=[], metavar="TABLE=N",
+                        help="Rows for one table, e.g. Trade=5000000 (repeatable)")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Rows generated and written at a time")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, for repeatable data")
+    args = parser.parse_args()
+
+    if args.graph_json:
+        kg = load_graph_json(args.graph_json)
+    else:
+        from schema_loader import read_schema_workbook
+        kg = TableKnowledgeGraph(*read_schema_workbook(args.schema))
+
+    rows = {table: args.rows for table in kg.schemas}
+    for item in args.table_rows:
+        table, _, count = item.partition('=')
+        if table not in rows:
+            parser.error(f"Unknown table {table!r}; tables are {', '.join(rows)}")
+        rows[table] = int(count)
+
+    start = time.perf_counter()
+    paths = generate_tables(kg, rows, args.output, args.chunk_size, args.seed)
+    for table, path in paths.items():
+        print(f"{table:<20} {rows[table]:>12,} rows -> {path}")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Knowledge graph analytics
+File: graph_analytics.py
+
+Structural metrics of the join graph: size and connectivity, hub tables,
+articulation points (tables whose removal disconnects others), connected
+components and edge counts per join context. Computed once when the graph is built
+and kept with it, so the UI and the stats export only read them.
+"""
+
+from collections import Counter
+from typing import Dict, List
+
+import networkx as nx
+
+
+class GraphAnalytics:
+    """Metrics of one knowledge graph, computed once in the constructor"""
+
+    def __init__(self, graph: nx.MultiDiGraph, top_hubs: int = 10):
+        degree = dict(graph.degree())
+        undirected = nx.Graph(graph.to_undirected(as_view=True))  # Simple graph: parallel joins count once
+
+        self.total_tables = graph.number_of_nodes()
+        self.total_relationships = graph.number_of_edges()
+        self.tables = list(graph.nodes())
+        self.average_connections = sum(degree.values()) / self.total_tables if self.total_tables else 0
+        self.is_connected = nx.is_weakly_connected(graph) if self.total_tables else False
+
+        # Most joined tables: join edges, then distinct neighbouring tables
+        ranked = sorted(self.tables, key=lambda t: (-degree[t], -undirected.degree(t), t))
+        self.hubs: List[Dict] = [
+            {
+                "table": table,
+                "joins": degree[table],
+                "neighbours": undirected.degree(table),
+                "outgoing": graph.out_degree(table),
+                "incoming": graph.in_degree(table)
+            }
+            for table in ranked[:top_hubs]
+        ]
+
+        self.articulation_points = sorted(nx.articulation_points(undirected))
+        self.components = sorted(
+            (sorted(component) for component in nx.connected_components(undirected)),
+            key=lambda component: (-len(component), component)
+        )
+        self.isolated_tables = sorted(nx.isolates(undirected))
+        self.context_counts = dict(Counter(
+            data.get('context', 'default') for _, _, data in graph.edges(data=True)
+        ).most_common())
+
+    def stats(self) -> Dict:
+        """The basic statistics in the get_graph_stats layout"""
+        return {
+            "total_tables": self.total_tables,
+            "total_relationships": self.total_relationships,
+            "tables": list(self.tables),
+            "average_connections": self.average_connections,
+            "is_connected": self.is_connected
+        }
+
+    def to_dict(self) -> Dict:
+        """All metrics, e.g. for JSON export"""
+        return {
+            **self.stats(),
+            "hubs": self.hubs,
+            "articulation_points": self.articulation_points,
+            "components": self.components,
+            "isolated_tables": self.isolated_tables,
+            "context_counts": self.context_counts
+        }
+
+    def report_lines(self) -> List[str]:
+        """Plain-text section for the statistics report"""
+        lines = ["Hub Tables (join edges / neighbouring tables):"]
+        lines += [f"  - {h['table']}: {h['joins']} / {h['neighbours']}" for h in self.hubs]
+        lines.append(f"Articulation Points: {', '.join(self.articulation_points) or 'None'}")
+        lines.append(f"Connected Components: {len(self.components)}")
+        lines += [f"  - {len(c)} tables: {', '.join(c[:10])}{'...' if len(c) > 10 else ''}" for c in self.components]
+        lines.append("Relationships per Context:")
+        lines += [f"  - {context}: {count}" for context, count in self.context_counts.items()]
+        return lines
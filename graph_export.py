@@ -0,0 +1,350 @@
+"""
+Knowledge graph export
+File: graph_export.py
+
+Writes the knowledge graph as JSON, GraphML and a plain-text statistics report, and
+as columnar tables/columns/edges files (Arrow IPC or Parquet) that load back into a
+TableKnowledgeGraph from memory-mapped buffers. pyarrow is optional and imported on
+first use. GraphArtifacts serves the download formats, built on first request.
+"""
+
+import io
+import json
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict
+
+import networkx as nx
+
+from column_store import ColumnStore
+from knowledge_graph import TableKnowledgeGraph
+
+
+KNOWLEDGE_GRAPH_OUTPUT_DIR = "knowledge_graph_exports"  # Directory for exports
+GRAPH_TABLES_DIR = "knowledge_graph_latest_tables"  # Columnar export inside the output directory
+GRAPH_TABLE_FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def save_knowledge_graph(kg: TableKnowledgeGraph, output_dir: str = KNOWLEDGE_GRAPH_OUTPUT_DIR):
+    """Save knowledge graph to files on app startup"""
+    # Create output directory if it doesn't exist
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Save as JSON
+    json_path = output_dir / f"knowledge_graph_{timestamp}.json"
+    graph_data = kg.export_graph_data()
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(graph_data, f, indent=2)
+
+    # Also save a "latest" version without timestamp
+    latest_json_path = output_dir / "knowledge_graph_latest.json"
+    with open(latest_json_path, 'w', encoding='utf-8') as f:
+        json.dump(graph_data, f, indent=2)
+
+    # Save as GraphML
+    graphml_path = output_dir / f"knowledge_graph_{timestamp}.graphml"
+    latest_graphml_path = output_dir / "knowledge_graph_latest.graphml"
+
+    # Create a new clean graph for GraphML export (lists are not supported)
+    export_graph = nx.MultiDiGraph()
+
+    # Add nodes with converted attributes
+    for node in kg.graph.nodes():
+        node_attrs = {}
+        for key, value in kg.graph.nodes[node].items():
+            if isinstance(value, (list, tuple)):
+                node_attrs[key] = ','.join(str(v) for v in value)
+            else:
+                node_attrs[key] = str(value) if value is not None else ''
+        export_graph.add_node(node, **node_attrs)
+
+    # Add edges with converted attributes
+    for source, target, key, edge_data in kg.graph.edges(keys=True, data=True):
+        clean_edge_data = {}
+        for attr_key, attr_value in edge_data.items():
+            if isinstance(attr_value, (list, tuple)):
+                clean_edge_data[attr_key] = ','.join(str(v) for v in attr_value)
+            else:
+                clean_edge_data[attr_key] = str(attr_value) if attr_value is not None else ''
+        export_graph.add_edge(source, target, key=key, **clean_edge_data)
+
+    nx.write_graphml(export_graph, str(graphml_path))
+    nx.write_graphml(export_graph, str(latest_graphml_path))
+
+    # Save statistics as text file
+    stats_path = output_dir / f"knowledge_graph_stats_{timestamp}.txt"
+    latest_stats_path = output_dir / "knowledge_graph_stats_latest.txt"
+
+    stats = kg.get_graph_stats()
+    stats_content = f"""Knowledge Graph Statistics
+Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+{'=' * 60}
+
+Fingerprint: {kg.fingerprint}
+Total Tables: {stats['total_tables']}
+Total Relationships: {stats['total_relationships']}
+Average Connections per Table: {stats['average_connections']:.2f}
+Is Connected: {'Yes' if stats['is_connected'] else 'No'}
+
+Tables:
+{chr(10).join(f"  - {table}" for table in stats['tables'])}
+
+{chr(10).join(kg.analytics.report_lines())}
+
+Detailed Relationships:
+"""
+
+    for edge_data in graph_data['edges']:
+        stats_content += f"\n{edge_data['from']} → {edge_data['to']}\n"
+        stats_content += f"  Join: {', '.join(edge_data['source_columns'])} = {', '.join(edge_data['target_columns'])}\n"
+        stats_content += f"  Type: {edge_data['join_type']} | Context: {edge_data['context']}\n"
+        stats_content += f"  Description: {edge_data['description']}\n"
+
+    with open(stats_path, 'w', encoding='utf-8') as f:
+        f.write(stats_content)
+
+    with open(latest_stats_path, 'w', encoding='utf-8') as f:
+        f.write(stats_content)
+
+    # Columnar copy for fast reloads and non-Python readers
+    try:
+        tables_path = save_graph_tables(kg, output_dir / GRAPH_TABLES_DIR)
+    except ImportError:
+        tables_path = None  # pyarrow not installed
+
+    return {
+        'json_path': json_path,
+        'graphml_path': graphml_path,
+        'stats_path': stats_path,
+        'tables_path': tables_path,
+        'timestamp': timestamp
+    }
+
+
+# ============================================
+# COLUMNAR EXPORT
+# ============================================
+
+def _text(value):
+    """Example values and descriptions as strings; empty cells (None, NaN) become null"""
+    if value is None or value != value:
+        return None
+    return str(value)
+
+
+def graph_to_arrow(kg: TableKnowledgeGraph) -> Dict:
+    """The graph as three Arrow tables: "tables", "columns" and "edges".
+
+    Columns are stored table by table in schema order, so a table's columns are the
+    slice given by the column counts of the tables before it.
+    """
+    import pyarrow as pa  # Optional dependency, loaded on first use
+
+    table_names = list(kg.schemas)
+    tables = pa.table({
+        "table_name": pa.array(table_names, pa.string()),
+        "column_count": pa.array([len(kg.schemas[t]) for t in table_names], pa.int32()),
+        "row_count": pa.array([kg.graph.nodes[t].get('row_count') for t in table_names], pa.int64())
+    })
+
+    column_tables, names, descriptions, examples = [], [], [], []
+    for table in table_names:
+        columns = kg.schemas[table]
+        column_tables.extend([table] * len(columns))
+        names.extend(columns.names)
+        descriptions.extend(_text(d) for d in columns.descriptions)
+        examples.extend(_text(e) for e in columns.examples)
+    columns = pa.table({
+        "table_name": pa.array(column_tables, pa.string()).dictionary_encode(),
+        "name": pa.array(names, pa.string()),
+        "description": pa.array(descriptions, pa.string()),
+        "example": pa.array(examples, pa.string())
+    })
+
+    edge_rows = [data | {"from_table": source, "to_table": target}
+                 for source, target, data in kg.graph.edges(data=True)]
+    edges = pa.table({
+        "from_table": pa.array([e['from_table'] for e in edge_rows], pa.string()),
+        "to_table": pa.array([e['to_table'] for e in edge_rows], pa.string()),
+        "source_columns": pa.array([e['source_columns'] for e in edge_rows], pa.list_(pa.string())),
+        "target_columns": pa.array([e['target_columns'] for e in edge_rows], pa.list_(pa.string())),
+        "join_type": pa.array([e['join_type'] for e in edge_rows], pa.string()),
+        "context": pa.array([e.get('context', 'default') for e in edge_rows], pa.string()),
+        "description": pa.array([e.get('description', '') for e in edge_rows], pa.string()),
+        # Key cardinalities, when the graph has table statistics
+        "source_distinct": pa.array([e.get('source_distinct') for e in edge_rows], pa.int64()),
+        "target_distinct": pa.array([e.get('target_distinct') for e in edge_rows], pa.int64())
+    })
+
+    return {"tables": tables, "columns": columns, "edges": edges}
+
+
+def save_graph_tables(kg: TableKnowledgeGraph, directory, fmt: str = "arrow") -> Path:
+    """Write tables/columns/edges files to a directory.
+
+    "arrow" writes uncompressed Arrow IPC files that load_graph_tables memory-maps;
+    "parquet" writes smaller files for other tools. Raises ImportError without pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    suffix = GRAPH_TABLE_FORMATS[fmt]
+    for name, table in graph_to_arrow(kg).items():
+        table = table.replace_schema_metadata({"fingerprint": kg.fingerprint})
+        path = directory / f"{name}{suffix}"
+        if fmt == "parquet":
+            pq.write_table(table, path)
+        else:
+            with pa.ipc.new_file(path, table.schema) as writer:
+                writer.write_table(table)
+    return directory
+
+
+def _read_graph_table(directory: Path, name: str):
+    """One table of a columnar export, memory-mapped rather than read into memory"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if (directory / f"{name}.arrow").exists():
+        return pa.ipc.open_file(pa.memory_map(str(directory / f"{name}.arrow"))).read_all()
+    return pq.read_table(directory / f"{name}.parquet", memory_map=True)
+
+
+def _pooled_strings(column) -> list:
+    """Column values as Python strings, converting (and interning) each distinct value once"""
+    import pyarrow.compute as pc
+
+    encoded = pc.fill_null(column, '').combine_chunks().dictionary_encode()
+    pool = [sys.intern(value) for value in encoded.dictionary.to_pylist()]
+    return list(map(pool.__getitem__, encoded.indices.to_numpy().tolist()))
+
+
+def load_graph_tables(directory) -> TableKnowledgeGraph:
+    """Rebuild a TableKnowledgeGraph from a columnar export.
+
+    Each distinct column name, description and example is converted to a Python string
+    once and shared, and the columns go straight into the column store without
+    per-column dicts. Table statistics in the export are attached again. Raises
+    ValueError when the rebuilt graph does not match the exported fingerprint.
+    """
+    directory = Path(directory)
+    tables_table = _read_graph_table(directory, "tables")
+    expected = (tables_table.schema.metadata or {}).get(b"fingerprint")
+    tables = tables_table.to_pydict()
+    columns = _read_graph_table(directory, "columns")
+    edges = _read_graph_table(directory, "edges").to_pylist()
+
+    names = _pooled_strings(columns.column("name"))
+    descriptions = _pooled_strings(columns.column("description"))
+    examples = _pooled_strings(columns.column("example"))
+    schemas = ColumnStore()
+    offset = 0
+    for table, count in zip(tables['table_name'], tables['column_count']):
+        end = offset + count
+        schemas.add_pooled_table(table, tuple(names[offset:end]), tuple(descriptions[offset:end]),
+                                 tuple(examples[offset:end]))
+        offset = end
+
+    relationships = [
+        {
+            "table1": edge['from_table'],
+            "table2": edge['to_table'],
+            "join_key_1": "+".join(edge['source_columns']),
+            "join_key_2": "+".join(edge['target_columns']),
+            "join_type": edge['join_type'],
+            "context": edge['context'],
+            "description": edge['description']
+        }
+        for edge in edges
+    ]
+    kg = TableKnowledgeGraph(schemas, relationships)
+    if expected is not None and expected.decode() != kg.fingerprint:
+        raise ValueError(f"Graph export in {directory} does not match its fingerprint")
+
+    # Row counts and the key cardinalities recorded on the edges
+    stats = {
+        table: {"row_count": row_count, "distinct": {}}
+        for table, row_count in zip(tables['table_name'], tables['row_count'])
+        if row_count is not None
+    }
+    for edge in edges:
+        for table, cols, distinct in ((edge['from_table'], edge['source_columns'], edge['source_distinct']),
+                                      (edge['to_table'], edge['target_columns'], edge['target_distinct'])):
+            if table in stats and distinct is not None:
+                stats[table]['distinct'][" + ".join(cols)] = distinct
+    if stats:
+        kg.set_statistics(stats)
+    return kg
+
+
+
+# ============================================
+# DOWNLOAD ARTIFACTS
+# ============================================
+
+def graph_json_bytes(kg: TableKnowledgeGraph) -> bytes:
+    """export_graph_data as indented JSON"""
+    return json.dumps(kg.export_graph_data(), indent=2).encode('utf-8')
+
+
+def graph_graphml_bytes(kg: TableKnowledgeGraph) -> bytes:
+    """The graph as GraphML, with list attributes joined by commas"""
+    buffer = io.BytesIO()
+
+    # Create a copy of the graph for export
+    export_graph = kg.graph.copy()
+    for node in export_graph.nodes():
+        if 'columns' in export_graph.nodes[node]:
+            export_graph.nodes[node]['columns'] = ','.join(export_graph.nodes[node]['columns'])
+    # Handle MultiDiGraph edges
+    for source, target, key, edge_data in export_graph.edges(keys=True, data=True):
+        if 'source_columns' in edge_data:
+            edge_data['source_columns'] = ','.join(edge_data['source_columns'])
+        if 'target_columns' in edge_data:
+            edge_data['target_columns'] = ','.join(edge_data['target_columns'])
+
+    nx.write_graphml(export_graph, buffer)
+    return buffer.getvalue()
+
+
+class GraphArtifacts:
+    """Download files of a graph, each serialized on first request and kept per fingerprint"""
+
+    # format -> (builder, file name, MIME type)
+    FORMATS: Dict[str, tuple] = {
+        "json": (graph_json_bytes, "knowledge_graph.json", "application/json"),
+        "graphml": (graph_graphml_bytes, "knowledge_graph.graphml", "application/xml"),
+    }
+
+    def __init__(self, kg: TableKnowledgeGraph):
+        self.kg = kg
+        self._artifacts: Dict[tuple, bytes] = {}  # (format, fingerprint) -> bytes
+        self._lock = threading.Lock()
+
+    def ready(self, fmt: str) -> bool:
+        return (fmt, self.kg.fingerprint) in self._artifacts
+
+    def get(self, fmt: str) -> bytes:
+        """Bytes of one format; the first caller builds them, concurrent callers wait"""
+        key = (fmt, self.kg.fingerprint)
+        if key not in self._artifacts:
+            builder: Callable = self.FORMATS[fmt][0]
+            with self._lock:
+                if key not in self._artifacts:
+                    # Files of an earlier graph version are never served again
+                    self._artifacts = {k: v for k, v in self._artifacts.items() if k[1] == key[1]}
+                    self._artifacts[key] = builder(self.kg)
+        return self._artifacts[key]
+
+    def file_name(self, fmt: str) -> str:
+        return self.FORMATS[fmt][1]
+
+    def mime(self, fmt: str) -> str:
+        return self.FORMATS[fmt][2]
@@ -0,0 +1,140 @@
+"""
+Background job queue
+File: job_queue.py
+
+Runs pipeline work on a shared thread pool so it outlives Streamlit reruns. Each
+session has at most one current job; the job records per-stage progress, and a
+cancelled or abandoned job stops at its next stage boundary.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+class JobCancelled(Exception):
+    """Raised inside a job at a stage boundary once the job has been cancelled"""
+
+
+class Job:
+    """One unit of background work and its progress"""
+
+    def __init__(self, session_id: str, label: str, abandon_after: float):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.label = label
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.stages: List[Dict] = []  # {"stage", "started", "finished"}
+        self.result = None
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.abandon_after = abandon_after
+        self.last_seen = time.monotonic()
+        self._cancel = threading.Event()
+
+    @property
+    def stage(self) -> Optional[str]:
+        return self.stages[-1]['stage'] if self.stages else None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self) -> bool:
+        """Cancelled explicitly, or nobody has polled the job for `abandon_after` seconds"""
+        if self.abandon_after and time.monotonic() - self.last_seen > self.abandon_after:
+            self._cancel.set()
+        return self._cancel.is_set()
+
+    def progress(self, stage: str):
+        """Stage callback handed to the work function; stops the job if it was cancelled"""
+        if self.cancelled():
+            raise JobCancelled(f"Cancelled before {stage}")
+        now = time.time()
+        if self.stages:
+            self.stages[-1]['finished'] = now
+        self.stages.append({"stage": stage, "started": now, "finished": None})
+
+
+class JobQueue:
+    """Thread pool of jobs, with one current job per session"""
+
+    def __init__(self, max_workers: int = 4, abandon_after: float = 120.0, keep_seconds: float = 3600.0):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}  # session id -> current job
+        self._lock = threading.Lock()
+        self.abandon_after = abandon_after
+        self.keep_seconds = keep_seconds
+
+    def submit(self, session_id: str, fn: Callable, *args, label: str = "", **kwargs) -> Job:
+        """Run fn(*args, progress=job.progress, **kwargs) in the background.
+
+        A job already running for the session is cancelled: its result would replace
+        the new one anyway.
+        """
+        job = Job(session_id, label, self.abandon_after)
+        with self._lock:
+            self._evict()
+            previous = self._jobs.get(session_id)
+            if previous is not None and previous.active:
+                previous.cancel()
+            self._jobs[session_id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: Dict):
+        status = "failed"
+        try:
+            if job.cancelled():
+                raise JobCancelled("Cancelled before start")
+            job.status = "running"
+            job.result = fn(*args, progress=job.progress, **kwargs)
+            status = "done"
+        except JobCancelled as e:
+            status = "cancelled"
+            job.error = str(e)
+        except Exception as e:
+            job.error = str(e)
+            job.exception = e
+        finally:
+            job.finished = time.time()
+            if job.stages and job.stages[-1]['finished'] is None:
+                job.stages[-1]['finished'] = job.finished
+            # Set last: readers treat a finished status as "all fields final"
+            job.status = status
+
+    def get(self, session_id: str) -> Optional[Job]:
+        """Current job of a session; polling keeps it from being treated as abandoned"""
+        with self._lock:
+            job = self._jobs.get(session_id)
+        if job is not None:
+            job.last_seen = time.monotonic()
+        return job
+
+    def cancel(self, session_id: str) -> bool:
+        job = self.get(session_id)
+        if job is None or not job.active:
+            return False
+        job.cancel()
+        return True
+
+    def discard(self, session_id: str):
+        """Forget a session's finished job once its result has been collected"""
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job is not None and not job.active:
+                del self._jobs[session_id]
+
+    def _evict(self):
+        """Drop finished jobs nobody collected within keep_seconds (caller holds the lock)"""
+        cutoff = time.time() - self.keep_seconds
+        for session_id, job in list(self._jobs.items()):
+            if not job.active and job.finished is not None and job.finished < cutoff:
+                del self._jobs[session_id]
@@ -0,0 +1,122 @@
+"""
+Steiner-tree join planner
+File: join_planner.py
+
+Picks a cheap set of joins connecting the requested tables: a Steiner tree over the
+join graph (Mehlhorn's 2-approximation of the minimum-weight tree), with exactly one
+join per tree edge. Among parallel joins between two tables the one matching the
+query context is used, ties going to the relationship listed first in the workbook;
+with table statistics, joins with large estimated results cost more.
+"""
+
+import math
+from typing import Dict, List, Optional
+
+import networkx as nx
+from networkx.algorithms.approximation import steiner_tree
+
+# Weight factors for a join edge; the base cost of every join is 1
+OTHER_CONTEXT_PENALTY = 1.5  # No context asked for: a context-specific join where no default exists
+MISMATCH_PENALTY = 10.0  # Context asked for: a join of another context, only to keep tables connected
+CARDINALITY_WEIGHT = 0.1  # Per order of magnitude of the join's estimated result rows
+
+
+def _matches(context: Optional[str], edge_context: str) -> bool:
+    return bool(context) and context.lower() in edge_context.lower()
+
+
+class JoinPlanner:
+    """Approximately minimum-weight join trees over one knowledge graph"""
+
+    def __init__(self, kg: 'TableKnowledgeGraph'):
+        self.kg = kg
+        self.graph = kg.graph  # Pinned: a rebuild of the knowledge graph gets a new planner
+        self._graphs = {}  # context -> weighted undirected graph with the chosen edge per table pair
+
+    def edge_weight(self, edge_data: Dict, context: Optional[str], pair_edges: List[Dict]) -> float:
+        """Cost of joining through one edge, given all parallel edges of its table pair"""
+        edge_context = edge_data.get('context', 'default')
+        if context:
+            # Same rule as get_join_relationships: matching context, else default when
+            # the pair has no join for this context, else only as a last resort
+            if _matches(context, edge_context):
+                weight = 1.0
+            elif edge_context == 'default' and not any(_matches(context, e.get('context', 'default'))
+                                                       for e in pair_edges):
+                weight = 1.0
+            else:
+                weight = MISMATCH_PENALTY
+        else:
+            weight = 1.0 if edge_context == 'default' else OTHER_CONTEXT_PENALTY
+
+        if 'estimated_rows' in edge_data:
+            weight *= 1 + CARDINALITY_WEIGHT * math.log10(1 + edge_data['estimated_rows'])
+        return weight
+
+    def weighted_graph(self, context: Optional[str] = None) -> nx.Graph:
+        """Undirected graph holding the cheapest edge of each table pair for a context"""
+        key = context.lower() if context else None
+        if key in self._graphs:
+            return self._graphs[key]
+
+        graph = self.graph
+        pairs = {}  # frozenset pair -> [(start, end, edge data)]
+        for start, end, data in graph.edges(data=True):
+            pairs.setdefault(frozenset((start, end)), []).append((start, end, data))
+
+        weighted = nx.Graph()
+        weighted.add_nodes_from(graph.nodes())
+        for edges in pairs.values():
+            pair_edges = [data for _, _, data in edges]
+            # Ties go to the relationship listed first in the workbook, so plans are stable
+            weight, (start, end, data) = min(
+                ((self.edge_weight(data, context, pair_edges), (start, end, data)) for start, end, data in edges),
+                key=lambda item: (item[0], item[1][2].get('order', 0))
+            )
+            if start == end:
+                continue  # A self-join never connects two tables
+            weighted.add_edge(start, end, weight=weight, start=start, end=end, data=data,
+                              alternatives=len(edges) - 1)
+
+        self._graphs[key] = weighted
+        return weighted
+
+    def plan(self, tables: List[str], context: Optional[str] = None) -> Dict:
+        """Tables and joins of a cheap tree connecting the requested tables.
+
+        The tree is Mehlhorn's Steiner approximation, at most twice the weight of the
+        minimum tree.
+
+        Returns {"tables", "joins", "weight"}; joins are in get_join_relationships form,
+        ordered so each one attaches a new table to the tables before it. Requested
+        tables that cannot be connected are kept without a join.
+        """
+        weighted = self.weighted_graph(context)
+        terminals = list(dict.fromkeys(t for t in tables if t in weighted))
+
+        tree = nx.Graph()
+        tree.add_nodes_from(terminals)
+        for component in nx.connected_components(weighted):
+            group = [t for t in terminals if t in component]
+            if len(group) > 1:
+                subtree = steiner_tree(weighted.subgraph(component), group, weight='weight', method='mehlhorn')
+                tree.add_edges_from(subtree.edges)
+
+        # Walk the tree from the first requested table so every join reaches a new table
+        ordered_tables, joins, total = [], [], 0.0
+        for root in terminals:
+            if root in ordered_tables:
+                continue
+            ordered_tables.append(root)
+            for u, v in nx.bfs_edges(tree, root):
+                edge = weighted.edges[u, v]
+                join = self.kg.join_relationship(edge['start'], edge['end'], edge['data'])
+                if edge['alternatives']:
+                    join['alternatives'] = edge['alternatives']  # Other contexts existed for this pair
+                joins.append(join)
+                ordered_tables.append(v)
+                total += edge['weight']
+
+        # Unknown table names are kept so SQL validation can report them
+        ordered_tables += [t for t in dict.fromkeys(tables) if t not in weighted]
+        return {"tables": ordered_tables, "joins": joins, "weight": total}
@@ -0,0 +1,597 @@
+"""
+Table Knowledge Graph
+File: knowledge_graph.py
+
+Tables as nodes and join relationships as edges, plus the local lookup structures
+built from the schema. Depends only on networkx; the Plotly visualization is
+imported on first use.
+"""
+
+import hashlib
+import json
+from typing import Callable, List, Dict, Optional
+
+import networkx as nx
+
+from column_store import ColumnStore
+from entity_matcher import EntityMatcher
+from graph_analytics import GraphAnalytics
+from join_planner import JoinPlanner
+from schema_summary import SchemaSummary
+from value_index import ValueColumnIndex
+
+
+# ============================================
+# KNOWLEDGE GRAPH CLASS
+# ============================================
+
+def _canonical(value) -> str:
+    """Text form of a schema value for hashing; empty cells (None, NaN) hash as ''"""
+    if value is None or value != value:
+        return ''
+    return str(value)
+
+
+def _split_join_key(value) -> List[str]:
+    """Columns of a (composite) join key cell, e.g. "Entity + Counterparty ID" """
+    return [col.strip() for col in _canonical(value).split('+')]
+
+
+def graph_fingerprint(schemas: ColumnStore, relationships: List[Dict]) -> str:
+    """SHA-256 over table schemas and join relationships.
+
+    Tables are hashed in name order and relationships as a set, so the hash depends on
+    content only; column order within a table is part of the content.
+    """
+    digest = hashlib.sha256()
+    for table in sorted(schemas):
+        columns = schemas[table]
+        digest.update(json.dumps([
+            table,
+            [_canonical(n) for n in columns.names],
+            [_canonical(d) for d in columns.descriptions],
+            [_canonical(e) for e in columns.examples]
+        ]).encode('utf-8'))
+    joins = sorted(
+        json.dumps(
+            [_canonical(rel.get(key)) for key in ('table1', 'table2')]
+            # Join keys as parsed column lists, so "A+B" and "A + B" hash alike
+            + [_split_join_key(rel.get(key)) for key in ('join_key_1', 'join_key_2')]
+            + [_canonical(rel.get(key)) for key in ('join_type', 'context', 'description')]
+        )
+        for rel in relationships
+    )
+    digest.update(json.dumps(joins).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _GraphVersion:
+    """One schema version: the graph, its source data and the lookups derived from it.
+
+    A rebuild builds a new version completely and then swaps it in, so readers see
+    either the old or the new one, never a mix.
+    """
+
+    def __init__(self, schemas: ColumnStore, relationships: List[Dict]):
+        self.graph = nx.MultiDiGraph()  # Use MultiDiGraph to support multiple edges between same nodes
+        self.schemas = schemas
+        self.relationships = relationships
+        # Content hash of this schema version; caches derived from the graph key on it
+        self.fingerprint = graph_fingerprint(schemas, relationships)
+        self.stats = {}  # Optional row counts and key cardinalities, see set_statistics
+        self.entity_matcher = None
+        self.value_index = None
+        self.schema_summary = None
+        self.analytics = None
+        self.join_planner = None
+        self.undirected = None
+
+
+class TableKnowledgeGraph:
+    def __init__(self, schemas: Dict, relationships: List[Dict]):
+        self._listeners: List[Callable[['TableKnowledgeGraph', str], None]] = []
+        # Compact column store; reads like the original {table: [column dict, ...]} layout
+        if not isinstance(schemas, ColumnStore):
+            schemas = ColumnStore.from_schemas(schemas)
+        self._version = _GraphVersion(schemas, relationships)
+        self._build_graph()
+
+    # Current version's data; each read goes through the one _version reference
+    @property
+    def graph(self) -> nx.MultiDiGraph:
+        return self._version.graph
+
+    @property
+    def schemas(self) -> ColumnStore:
+        return self._version.schemas
+
+    @property
+    def relationships(self) -> List[Dict]:
+        return self._version.relationships
+
+    @property
+    def fingerprint(self) -> str:
+        return self._version.fingerprint
+
+    @property
+    def stats(self) -> Dict[str, Dict]:
+        return self._version.stats
+
+    def on_change(self, callback: Callable[['TableKnowledgeGraph', str], None]):
+        """Register callback(kg, previous_fingerprint), called after a rebuild changes the content"""
+        self._listeners.append(callback)
+
+    def rebuild(self, schemas: Dict, relationships: List[Dict],
+                stats_loader: Optional[Callable[['TableKnowledgeGraph'], Dict[str, Dict]]] = None) -> bool:
+        """Reload schemas and relationships in place; returns whether the content changed.
+
+        The new graph is built aside, with statistics from stats_loader(new_graph) when
+        given (none otherwise, as the old row counts may no longer hold), and swapped in
+        with a single assignment, so running jobs keep a consistent view. Derived lookups
+        are rebuilt on next use. Listeners are notified only when the fingerprint changes.
+        """
+        staged = TableKnowledgeGraph(schemas, relationships)
+        if staged.fingerprint == self.fingerprint:
+            return False
+        if stats_loader is not None:
+            staged.set_statistics(stats_loader(staged))
+        previous = self.fingerprint
+        self._version = staged._version
+        for callback in list(self._listeners):
+            callback(self, previous)
+        return True
+    
+    def _build_graph(self):
+        """Build the knowledge graph from schemas and relationships"""
+        # Add nodes (tables)
+        for table_name, columns in self.schemas.items():
+            self.graph.add_node(
+                table_name, 
+                columns=columns.names  # Shared with the column store, not copied
+            )
+        
+        # Add edges (relationships)
+        for order, rel in enumerate(self.relationships):
+            table1 = rel['table1']
+            table2 = rel['table2']
+            
+            # Parse composite keys
+            source_cols = _split_join_key(rel['join_key_1'])
+            target_cols = _split_join_key(rel['join_key_2'])
+            
+            self.graph.add_edge(
+                table1,
+                table2,
+                source_columns=source_cols,
+                target_columns=target_cols,
+                join_type=rel.get('join_type', 'INNER'),
+                context=rel.get('context', 'default'),
+                description=rel.get('description', f"Join {table1} with {table2}"),
+                order=order  # Position in the workbook, the join planner's tie-break
+            )
+    
+    # Lazy lookups are stored on the version they were built from, so one finished
+    # after a rebuild never lands on the newer version
+    @property
+    def entity_matcher(self) -> EntityMatcher:
+        """Table/column name matcher for this graph (built on first use)"""
+        version = self._version
+        if version.entity_matcher is None:
+            version.entity_matcher = EntityMatcher(version.schemas)
+        return version.entity_matcher
+
+    @property
+    def value_index(self) -> ValueColumnIndex:
+        """Example-value to column index for this graph (built on first use)"""
+        version = self._version
+        if version.value_index is None:
+            version.value_index = ValueColumnIndex(version.schemas)
+        return version.value_index
+
+    @property
+    def analytics(self) -> GraphAnalytics:
+        """Structural metrics of this graph (computed on first use, then kept)"""
+        version = self._version
+        if version.analytics is None:
+            version.analytics = GraphAnalytics(version.graph)
+        return version.analytics
+
+    @property
+    def undirected(self) -> nx.MultiGraph:
+        """Undirected copy of the graph (built on first use, rebuilt after a reload)"""
+        version = self._version
+        if version.undirected is None:
+            version.undirected = version.graph.to_undirected()
+        return version.undirected
+
+    @property
+    def join_planner(self) -> JoinPlanner:
+        """Approximate Steiner-tree join planner for this graph (built on first use)"""
+        version = self._version
+        if version.join_planner is None:
+            version.join_planner = JoinPlanner(self)
+        return version.join_planner
+
+    @property
+    def schema_summary(self) -> SchemaSummary:
+        """Column-family summary of this graph's schemas (built on first use)"""
+        version = self._version
+        if version.schema_summary is None:
+            version.schema_summary = SchemaSummary(version.schemas)
+        return version.schema_summary
+
+    def get_join_relationships(self, tables: List[str], context: Optional[str] = None) -> List[Dict]:
+        """Find all join relationships between given tables"""
+        relationships = []
+
+        for i in range(len(tables)):
+            for j in range(i + 1, len(tables)):
+                source = tables[i]
+                target = tables[j]
+
+                # Check both directions - MultiDiGraph returns a dict of edge keys
+                for start, end in [(source, target), (target, source)]:
+                    if self.graph.has_edge(start, end):
+                        # Get all edges between these nodes (MultiDiGraph can have multiple)
+                        edges_dict = self.graph.get_edge_data(start, end)
+
+                        # Iterate through all edges between these two nodes
+                        for edge_key, edge_data in edges_dict.items():
+                            # Filter by context if provided
+                            edge_context = edge_data.get('context', 'default')
+
+                            # Context filtering logic:
+                            # - If no context is specified, include all edges
+                            # - If context is specified, prefer context-specific edges but fallback to default if no context-specific edge exists
+                            if context:
+                                context_lower = context.lower()
+                                edge_context_lower = edge_context.lower()
+
+                                # Check if this edge has a context-specific match
+                                has_context_match = context_lower in edge_context_lower
+                                is_default = edge_context == 'default'
+
+                                # Check if there are any context-specific edges for this table pair
+                                has_context_specific_edges = any(
+                                    context_lower in ed.get('context', 'default').lower()
+                                    for ed in edges_dict.values()
+                                    if ed.get('context', 'default') != 'default'
+                                )
+
+                                # Include edge if:
+                                # 1. It matches the context, OR
+                                # 2. It's a default edge AND there are no context-specific edges for this table pair
+                                if not has_context_match:
+                                    if is_default and not has_context_specific_edges:
+                                        pass  # Include default edge as fallback
+                                    else:
+                                        continue  # Skip this edge
+
+                            relationships.append(self.join_relationship(start, end, edge_data))
+
+        return relationships
+
+    @staticmethod
+    def join_relationship(start: str, end: str, edge_data: Dict) -> Dict:
+        """Join dict for one edge, with its full (composite) join condition"""
+        # Build join condition
+        source_cols = edge_data['source_columns']
+        target_cols = edge_data['target_columns']
+
+        join_conditions = [
+            f"{start}.{src} = {end}.{tgt}"
+            for src, tgt in zip(source_cols, target_cols)
+        ]
+
+        return {
+            "from_table": start,
+            "to_table": end,
+            "join_condition": " AND ".join(join_conditions),
+            "join_type": edge_data['join_type'],
+            "context": edge_data.get('context', 'default'),
+            "description": edge_data.get('description', ''),
+            # Column pairs of the condition, for building the ON clause without parsing it
+            "source_columns": list(source_cols),
+            "target_columns": list(target_cols)
+        }
+    
+    def get_all_tables_needed(self, tables: List[str]) -> List[str]:
+        """Find all tables including intermediate ones needed for joins"""
+        all_tables = set(tables)
+        
+        for i in range(len(tables)):
+            for j in range(i + 1, len(tables)):
+                try:
+                    path = nx.shortest_path(
+                        self.graph.to_undirected(), 
+                        tables[i], 
+                        tables[j]
+                    )
+                    all_tables.update(path)
+                except nx.NetworkXNoPath:
+                    pass
+        
+        return list(all_tables)
+    
+    def get_columns_for_tables(self, tables: List[str]) -> Dict:
+        """Get schema information for specified tables"""
+        return {table: self.schemas.get(table, []) for table in tables}
+
+    def set_statistics(self, stats: Dict[str, Dict]):
+        """Attach row counts to nodes and cardinality estimates to edges.
+
+        `stats` is {table: {"row_count", "distinct": {"Col A + Col B": n}}} (see
+        table_stats.py). A join key without a distinct count is taken to be unique on
+        the source side and to match every source key on the target side.
+        """
+        self._version.stats = stats
+        self._version.join_planner = None  # Edge weights depend on the cardinalities
+        for table, data in self.graph.nodes(data=True):
+            data.pop('row_count', None)
+            row_count = stats.get(table, {}).get('row_count')
+            if row_count is not None:
+                data['row_count'] = row_count
+
+        for source, target, data in self.graph.edges(data=True):
+            for attr in ('source_distinct', 'target_distinct', 'fanout', 'reverse_fanout', 'estimated_rows'):
+                data.pop(attr, None)
+            source_rows = stats.get(source, {}).get('row_count')
+            target_rows = stats.get(target, {}).get('row_count')
+            if source_rows is None or target_rows is None:
+                continue
+
+            source_distinct = stats[source].get('distinct', {}).get(" + ".join(data['source_columns']), source_rows)
+            target_distinct = stats[target].get('distinct', {}).get(" + ".join(data['target_columns']),
+                                                                     min(source_distinct, target_rows))
+            source_distinct, target_distinct = max(source_distinct, 1), max(target_distinct, 1)
+            data['source_distinct'] = source_distinct
+            data['target_distinct'] = target_distinct
+            data['fanout'] = target_rows / target_distinct  # Target rows per source row
+            data['reverse_fanout'] = source_rows / source_distinct  # Source rows per target row
+            # Textbook equi-join estimate: |S| * |T| / max(V(S, key), V(T, key))
+            data['estimated_rows'] = source_rows * target_rows / max(source_distinct, target_distinct)
+
+    def _join_edge(self, join: Dict) -> Optional[Dict]:
+        """Edge attributes behind a join from get_join_relationships"""
+        edges = self.graph.get_edge_data(join['from_table'], join['to_table']) or {}
+        for data in edges.values():
+            if data.get('context', 'default') == join.get('context', 'default'):
+                return data
+        return None
+
+    def plan_join_order(self, tables: List[str], joins: List[Dict]) -> Optional[Dict]:
+        """Driving table and join order from the statistics; None without row counts.
+
+        The largest table drives the query and is scanned once; the smaller tables are
+        joined onto it, smallest first, each joined only once a table it connects to is
+        in place. With hash joins the small tables become the build side instead of
+        the billion-row one.
+        """
+        row_counts = {table: self.graph.nodes[table].get('row_count') for table in tables if table in self.graph}
+        if not tables or len(row_counts) != len(tables) or None in row_counts.values():
+            return None
+
+        driving = max(tables, key=lambda t: (row_counts[t], t))
+        order = [driving]
+        estimated_rows = row_counts[driving]
+        steps = []
+        remaining = set(tables) - {driving}
+        while remaining:
+            connecting = {
+                table: [j for j in joins if table in (j['from_table'], j['to_table']) and
+                        (j['to_table'] if j['from_table'] == table else j['from_table']) in order]
+                for table in remaining
+            }
+            candidates = [t for t in remaining if connecting[t]] or list(remaining)
+            table = min(candidates, key=lambda t: (row_counts[t], t))
+
+            # Rows of `table` matching each row joined so far
+            fanout = None
+            for join in connecting[table]:
+                edge = self._join_edge(join)
+                if edge is None or 'fanout' not in edge:
+                    continue
+                fanout = edge['fanout'] if join['to_table'] == table else edge['reverse_fanout']
+                estimated_rows = estimated_rows * fanout
+                break
+            steps.append({"table": table, "rows": row_counts[table], "fanout": fanout})
+            order.append(table)
+            remaining.remove(table)
+
+        return {
+            "driving_table": driving,
+            "join_order": order,
+            "row_counts": row_counts,
+            "steps": steps,
+            "estimated_rows": estimated_rows
+        }
+
+    def edge_contexts(self) -> List[str]:
+        """Distinct join contexts of the graph's edges"""
+        return sorted({data.get('context', 'default') for _, _, data in self.graph.edges(data=True)})
+
+    def _context_view(self, contexts: Optional[List[str]] = None):
+        """Read-only view of the graph keeping only edges in the given contexts (all when None)"""
+        if contexts is None:
+            return self.graph
+        allowed = set(contexts)
+        return nx.subgraph_view(
+            self.graph,
+            filter_edge=lambda u, v, k: self.graph.edges[u, v, k].get('context', 'default') in allowed
+        )
+
+    def neighborhood_subgraph(self, tables: List[str], hops: int = 1,
+                              contexts: Optional[List[str]] = None) -> nx.MultiDiGraph:
+        """Tables within `hops` joins of the given tables, plus the join paths between them.
+
+        Only edges in `contexts` (all when None) are followed and kept. Only the local
+        neighborhood is visited, so the cost does not grow with the catalog.
+        """
+        view = self._context_view(contexts)
+        undirected = view.to_undirected(as_view=True)
+        tables = [t for t in tables if t in view]
+
+        nodes = set(tables)
+        for table in tables:
+            nodes.update(nx.single_source_shortest_path_length(undirected, table, cutoff=hops))
+        for i in range(len(tables)):
+            for j in range(i + 1, len(tables)):
+                try:
+                    nodes.update(nx.shortest_path(undirected, tables[i], tables[j]))
+                except nx.NetworkXNoPath:
+                    pass
+
+        return view.subgraph(nodes).copy()
+
+    def visualize_graph_plotly(self, highlight_tables: List[str] = None, focus_hops: Optional[int] = None,
+                               contexts: Optional[List[str]] = None):
+        """Create an interactive Plotly visualization of the knowledge graph.
+
+        With `focus_hops` and highlighted tables only their neighborhood subgraph is laid
+        out and drawn; `contexts` limits the edges drawn to those join contexts.
+        """
+        import plotly.graph_objects as go  # Plotting stack loads on first use
+
+        if highlight_tables and focus_hops is not None:
+            graph = self.neighborhood_subgraph(highlight_tables, focus_hops, contexts)
+            title = f"Neighborhood of {', '.join(highlight_tables)} ({focus_hops} hop{'s' if focus_hops != 1 else ''})"
+        else:
+            graph = self._context_view(contexts)
+            title = "Database Knowledge Graph"
+
+        # Get graph layout using spring layout
+        pos = nx.spring_layout(graph, k=2, iterations=50)
+
+        # Create edge traces - handle MultiDiGraph with multiple edges
+        edge_traces = []
+        for edge in graph.edges(keys=True):  # Include keys for MultiDiGraph
+            source, target, key = edge
+            x0, y0 = pos[source]
+            x1, y1 = pos[target]
+
+            # Get specific edge data using the key
+            edge_data = graph.get_edge_data(source, target, key)
+            join_info = f"{source} → {target}<br>"
+            join_info += f"Keys: {', '.join(edge_data['source_columns'])} = {', '.join(edge_data['target_columns'])}<br>"
+            join_info += f"Type: {edge_data['join_type']}<br>"
+            join_info += f"Context: {edge_data.get('context', 'default')}"
+
+            # Color edges differently based on context
+            edge_color = '#888'
+            if edge_data.get('context') == 'For country level data':
+                edge_color = '#4CAF50'  # Green
+            elif edge_data.get('context') == 'For sector level data':
+                edge_color = '#2196F3'  # Blue
+            elif edge_data.get('context') == 'For rating level data':
+                edge_color = '#FF9800'  # Orange
+
+            edge_trace = go.Scatter(
+                x=[x0, x1, None],
+                y=[y0, y1, None],
+                mode='lines',
+                line=dict(width=2, color=edge_color),
+                hoverinfo='text',
+                text=join_info,
+                showlegend=False
+            )
+            edge_traces.append(edge_trace)
+
+        # Create node trace
+        node_x = []
+        node_y = []
+        node_text = []
+        node_colors = []
+        node_sizes = []
+
+        for node in graph.nodes():
+            x, y = pos[node]
+            node_x.append(x)
+            node_y.append(y)
+
+            # Get column count
+            columns = graph.nodes[node].get('columns', [])
+            node_info = f"<b>{node}</b><br>"
+            node_info += f"Columns: {len(columns)}<br>"
+            node_info += f"Sample: {', '.join(columns[:5])}"
+            if len(columns) > 5:
+                node_info += "..."
+
+            node_text.append(node_info)
+
+            # Color nodes based on whether they're highlighted
+            if highlight_tables and node in highlight_tables:
+                node_colors.append('#FF6B6B')  # Red for highlighted
+                node_sizes.append(30)
+            else:
+                node_colors.append('#4ECDC4')  # Teal for normal
+                node_sizes.append(20)
+
+        node_trace = go.Scatter(
+            x=node_x,
+            y=node_y,
+            mode='markers+text',
+            hoverinfo='text',
+            text=[node for node in graph.nodes()],
+            textposition="top center",
+            textfont=dict(size=12, color='black'),
+            hovertext=node_text,
+            marker=dict(
+                size=node_sizes,
+                color=node_colors,
+                line=dict(width=2, color='white')
+            ),
+            showlegend=False
+        )
+
+        # Create figure
+        fig = go.Figure(data=edge_traces + [node_trace])
+
+        fig.update_layout(
+            title=dict(text=title, font=dict(size=16)),
+            showlegend=False,
+            hovermode='closest',
+            margin=dict(b=20, l=5, r=5, t=40),
+            xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+            yaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+            plot_bgcolor='white',
+            height=600
+        )
+
+        return fig
+
+    def get_graph_stats(self) -> Dict:
+        """Get statistics about the knowledge graph (precomputed, see analytics)"""
+        return self.analytics.stats()
+
+    def export_graph_data(self) -> Dict:
+        """Export complete graph data for inspection"""
+        export_data = {
+            "fingerprint": self.fingerprint,
+            "nodes": [],
+            "edges": []
+        }
+
+        # Export nodes
+        for node in self.graph.nodes():
+            node_data = {
+                "table_name": node,
+                "columns": list(self.graph.nodes[node].get('columns', [])),
+                "column_count": len(self.graph.nodes[node].get('columns', []))
+            }
+            export_data["nodes"].append(node_data)
+
+        # Export edges - handle MultiDiGraph with multiple edges
+        for edge in self.graph.edges(keys=True):  # Include keys for MultiDiGraph
+            source, target, key = edge
+            edge_data = self.graph.get_edge_data(source, target, key)
+            export_data["edges"].append({
+                "from": source,
+                "to": target,
+                "source_columns": edge_data['source_columns'],
+                "target_columns": edge_data['target_columns'],
+                "join_type": edge_data['join_type'],
+                "context": edge_data.get('context', 'default'),
+                "description": edge_data.get('description', '')
+            })
+
+        return export_data
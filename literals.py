@@ -0,0 +1,197 @@
+"""
+Literal value patterns and extraction
+File: literals.py
+
+Classifies schema "Example Value" entries into value kinds (ratings, ISO country
+codes, dates, IDs, numbers, flags, free text) and pulls literals of those kinds
+out of natural language questions.
+"""
+
+import re
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+
+# ============================================
+# VALUE PATTERNS
+# ============================================
+
+ISO_ALPHA2 = frozenset("""
+AD AE AF AG AI AL AM AO AQ AR AS AT AU AW AX AZ BA BB BD BE BF BG BH BI BJ BL BM BN BO BQ BR BS BT BV BW BY BZ
+CA CC CD CF CG CH CI CK CL CM CN CO CR CU CV CW CX CY CZ DE DJ DK DM DO DZ EC EE EG EH ER ES ET FI FJ FK FM FO
+FR GA GB GD GE GF GG GH GI GL GM GN GP GQ GR GS GT GU GW GY HK HM HN HR HT HU ID IE IL IM IN IO IQ IR IS IT JE
+JM JO JP KE KG KH KI KM KN KP KR KW KY KZ LA LB LC LI LK LR LS LT LU LV LY MA MC MD ME MF MG MH MK ML MM MN MO
+MP MQ MR MS MT MU MV MW MX MY MZ NA NC NE NF NG NI NL NO NP NR NU NZ OM PA PE PF PG PH PK PL PM PN PR PS PT PW
+PY QA RE RO RS RU RW SA SB SC SD SE SG SH SI SJ SK SL SM SN SO SR SS ST SV SX SY SZ TC TD TF TG TH TJ TK TL TM
+TN TO TR TT TV TW TZ UA UG UM US UY UZ VA VC VE VG VI VN VU WF WS YE YT ZA ZM ZW
+""".split())
+
+ISO_ALPHA3 = frozenset("""
+ABW AFG AGO AIA ALA ALB AND ARE ARG ARM ASM ATA ATF ATG AUS AUT AZE BDI BEL BEN BES BFA BGD BGR BHR BHS BIH BLM
+BLR BLZ BMU BOL BRA BRB BRN BTN BVT BWA CAF CAN CCK CHE CHL CHN CIV CMR COD COG COK COL COM CPV CRI CUB CUW CXR
+CYM CYP CZE DEU DJI DMA DNK DOM DZA ECU EGY ERI ESH ESP EST ETH FIN FJI FLK FRA FRO FSM GAB GBR GEO GGY GHA GIB
+GIN GLP GMB GNB GNQ GRC GRD GRL GTM GUF GUM GUY HKG HMD HND HRV HTI HUN IDN IMN IND IOT IRL IRN IRQ ISL ISR ITA
+JAM JEY JOR JPN KAZ KEN KGZ KHM KIR KNA KOR KWT LAO LBN LBR LBY LCA LIE LKA LSO LTU LUX LVA MAC MAF MAR MCO MDA
+MDG MDV MEX MHL MKD MLI MLT MMR MNE MNG MNP MOZ MRT MSR MTQ MUS MWI MYS MYT NAM NCL NER NFK NGA NIC NIU NLD NOR
+NPL NRU NZL OMN PAK PAN PCN PER PHL PLW PNG POL PRI PRK PRT PRY PSE PYF QAT REU ROU RUS RWA SAU SDN SEN SGP SGS
+SHN SJM SLB SLE SLV SMR SOM SPM SRB SSD STP SUR SVK SVN SWE SWZ SXM SYC SYR TCA TCD TGO THA TJK TKL TKM TLS TON
+TTO TUN TUR TUV TWN TZA UGA UKR UMI URY USA UZB VAT VCT VEN VGB VIR VNM VUT WLF WSM YEM ZAF ZMB ZWE
+""".split())
+
+# S&P/Fitch style and Moody's style long-term ratings (single letters are too ambiguous in free text)
+RATING_RE = re.compile(
+    r'^(?:AAA|AA[+-]?|A[+-]|BBB[+-]?|BB[+-]?|B[+-]|CCC[+-]?|CC'
+    r'|Aaa|Aa[123]|A[123]|Baa[123]|Ba[123]|B[123]|Caa[123]|Ca)$'
+)
+DATE_RE = re.compile(r'^(?:\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4})$')
+NUMBER_RE = re.compile(r'^-?\d+(?:\.\d+)?$')
+ID_RE = re.compile(r'^(?=.*\d)(?=.*[A-Za-z])[A-Za-z0-9][A-Za-z0-9_\-]{2,}$')
+FLAG_VALUES = frozenset(['Y', 'N', 'YES', 'NO', 'TRUE', 'FALSE'])
+
+# Kinds recognised from their shape alone, in the order they are tried
+PATTERN_KINDS = ('date', 'rating', 'country', 'id', 'number')
+
+# Candidate literal tokens in a question: quoted strings or word-like runs such as
+# AA+, BBB-, 2024-01-31, 31/01/2024, CP-00123, 10.5
+QUOTED_RE = re.compile(r"'([^']+)'|\"([^\"]+)\"")
+TOKEN_RE = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9_/\-.]*[A-Za-z0-9])?[+\-]?")
+
+
+def classify_value(value) -> Optional[str]:
+    """Return the value kind of an example value, or None if it is empty"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'flag'
+    if isinstance(value, (datetime, date)):
+        return 'date'
+    if isinstance(value, (int, float)):
+        return None if value != value else 'number'  # NaN check
+
+    text = str(value).strip()
+    if not text or text.lower() == 'nan':
+        return None
+    if DATE_RE.match(text) or re.match(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}', text):
+        return 'date'
+    if RATING_RE.match(text):
+        return 'rating'
+    if text in ISO_ALPHA2 or text in ISO_ALPHA3:
+        return 'country'
+    if text.upper() in FLAG_VALUES:
+        return 'flag'
+    if NUMBER_RE.match(text.replace(',', '')):
+        return 'number'
+    if ID_RE.match(text):
+        return 'id'
+    return 'text'
+
+
+def normalize_value(value) -> str:
+    """Normalized lookup form of a literal value"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return ' '.join(str(value).strip().lower().split())
+
+
+# ============================================
+# LITERAL EXTRACTION
+# ============================================
+
+class LiteralExtractor:
+    """Finds literal values in questions, using the kinds present in the schema's example values"""
+
+    def __init__(self, schemas: Dict):
+        # Kinds of literal the schema can actually hold, and the example phrases of free text columns
+        self.kinds = set()
+        self.phrases = {}  # normalized phrase -> example spelling
+        names = set()
+
+        for table_name, columns in schemas.items():
+            names.add(table_name)
+            for col in columns:
+                names.add(col['name'])
+                example = col.get('example')
+                kind = classify_value(example)
+                if kind is None:
+                    continue
+                self.kinds.add(kind)
+                if kind == 'text' and len(str(example).split()) <= 5:
+                    self.phrases.setdefault(normalize_value(example), str(example).strip())
+
+        # Numbers and dates are always worth extracting (limits, thresholds, as-of dates)
+        self.kinds.update(['number', 'date'])
+
+        # Table and column names are never literals ("Counterparty ID" must not yield the country "ID")
+        self._name_re = self._alternation(names)
+        self._phrase_re = self._alternation(self.phrases)
+
+    @staticmethod
+    def _alternation(terms) -> Optional[re.Pattern]:
+        terms = sorted((t for t in terms if t), key=len, reverse=True)
+        if not terms:
+            return None
+        return re.compile(
+            r'(?<![A-Za-z0-9])(?:' + '|'.join(re.escape(t) for t in terms) + r')(?![A-Za-z0-9])',
+            re.IGNORECASE
+        )
+
+    def _token_kind(self, token: str) -> Optional[str]:
+        if DATE_RE.match(token):
+            return 'date'
+        if RATING_RE.match(token):
+            return 'rating' if 'rating' in self.kinds else None
+        if token in ISO_ALPHA2 or token in ISO_ALPHA3:
+            return 'country' if 'country' in self.kinds else None
+        if NUMBER_RE.match(token):
+            return 'number'
+        if ID_RE.match(token):
+            return 'id' if 'id' in self.kinds else None
+        return None
+
+    def extract(self, question: str) -> List[Dict]:
+        """Return literals in order of appearance as dicts with value, kind, start and end"""
+        taken = [False] * len(question)
+        literals = []
+
+        def claim(start, end, value, kind):
+            if any(taken[start:end]):
+                return
+            for i in range(start, end):
+                taken[i] = True
+            if kind is not None:
+                literals.append({"value": value, "kind": kind, "start": start, "end": end})
+
+        # Explicitly quoted values first, then names to skip, then known example phrases
+        for match in QUOTED_RE.finditer(question):
+            value = match.group(1) if match.group(1) is not None else match.group(2)
+            claim(match.start(), match.end(), value, classify_value(value) or 'text')
+        if self._name_re:
+            for match in self._name_re.finditer(question):
+                claim(match.start(), match.end(), None, None)
+        if self._phrase_re:
+            for match in self._phrase_re.finditer(question):
+                claim(match.start(), match.end(), self.phrases[normalize_value(match.group(0))], 'text')
+
+        for match in TOKEN_RE.finditer(question):
+            token = match.group(0)
+            kind = self._token_kind(token)
+            if kind is not None:
+                claim(match.start(), match.end(), token, kind)
+
+        literals.sort(key=lambda lit: lit['start'])
+        return literals
+
+    @staticmethod
+    def shape(question: str, literals: List[Dict]) -> str:
+        """Question text with every literal replaced by a slot naming its kind"""
+        parts = []
+        position = 0
+        for literal in literals:
+            parts.append(question[position:literal['start']])
+            parts.append(f"{{{literal['kind']}}}")
+            position = literal['end']
+        parts.append(question[position:])
+        text = ''.join(parts).lower()
+        return ' '.join(text.split()).rstrip(' ?.!')
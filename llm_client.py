@@ -0,0 +1,419 @@
+"""
+LLM clients
+File: llm_client.py
+
+GeminiClient talks to Google Gemini through the google-genai SDK, which is imported
+when the first client is created. LocalLLMClient is an offline stand-in with the
+same interface. ResilientLLMClient wraps either one with request hedging and a
+circuit breaker.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+
+# ============================================
+# GEMINI LLM INTEGRATION
+# ============================================
+
+class CachedContextRegistry:
+    """Keeps one provider-side cached context per static prompt prefix and renews it before it expires"""
+
+    def __init__(self, llm_client, ttl_seconds: int = 3600, refresh_margin_seconds: int = 300):
+        self.llm = llm_client
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds // 2)
+        self._entries = {}  # prefix key -> {"name": ..., "expire_time": ...}
+        self._failures = {}  # prefix key -> time of the last failed create
+        self._pending = {}  # prefix key -> Future of the create/refresh in flight for it
+        self._lock = threading.Lock()  # Guards the dicts only; provider calls run outside it
+
+    def _key(self, contents: str, system_instruction: Optional[str], model: Optional[str]) -> str:
+        digest = hashlib.sha256()
+        for part in (model or self.llm.model_name, system_instruction or '', contents):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, contents: str, system_instruction: str = None, model: str = None) -> Optional[str]:
+        """Return the cached context name for this prefix, or None if caching is unavailable.
+
+        Cached contexts are tied to one model; `model` defaults to the client's model.
+        Only one create or refresh per prefix is in flight; concurrent callers for the
+        same prefix wait for it, callers for other prefixes do not.
+        """
+        key = self._key(contents, system_instruction, model)
+        now = time.time()
+
+        with self._lock:
+            # Do not retry a prefix the provider rejected (e.g. below the minimum cache size) until the TTL passes
+            failed_at = self._failures.get(key)
+            if failed_at is not None and now - failed_at < self.ttl_seconds:
+                return None
+
+            entry = self._entries.get(key)
+            if entry and now < entry['expire_time'] - self.refresh_margin_seconds:
+                return entry['name']
+
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return pending.result()
+
+        name = None
+        try:
+            if entry and now < entry['expire_time']:
+                # Close to expiry - extend the TTL instead of uploading the prefix again
+                expire_time = self.llm.refresh_cached_context(entry['name'], self.ttl_seconds)
+                entry = {**entry, 'expire_time': expire_time}
+            else:
+                entry = self.llm.create_cached_context(
+                    contents,
+                    system_instruction=system_instruction,
+                    ttl_seconds=self.ttl_seconds,
+                    display_name=f"schema-{key[:12]}",
+                    model=model
+                )
+            with self._lock:
+                self._entries[key] = entry
+                self._failures.pop(key, None)
+            name = entry['name']
+        except Exception:
+            with self._lock:
+                self._entries.pop(key, None)
+                self._failures[key] = now
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set_result(name)
+        return name
+
+    def invalidate(self, name: str):
+        """Forget a cached context the provider no longer recognizes"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry['name'] == name:
+                    del self._entries[key]
+
+
+class GeminiClient:
+    def __init__(self, api_key: str = None, cache_ttl_seconds: int = 3600,
+                 model_name: str = 'gemini-2.0-flash-exp'):
+        """Initialize Gemini client using the new google-genai SDK"""
+        api_key = api_key or os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment")
+
+        # The SDK is only imported when a client is actually created
+        from google import genai
+
+        # Use the new Client API (REST-based, no gRPC issues)
+        self.client = genai.Client(api_key=api_key)
+        # Explicit context caching needs a stable model version; on models without it
+        # the cache registry falls back to sending the full prompt
+        self.model_name = model_name  # Use available model
+
+        # Configure generation settings
+        self.generation_config = {
+            'temperature': 0.1,  # Low temperature for more deterministic outputs
+            'max_output_tokens': 2048,
+        }
+
+        # Reusable static prompt prefixes (schema + instructions)
+        self.context_cache = CachedContextRegistry(self, ttl_seconds=cache_ttl_seconds)
+
+    def create_cached_context(self, contents: str, system_instruction: str = None,
+                              ttl_seconds: int = 3600, display_name: str = None, model: str = None) -> Dict:
+        """Upload a static prompt prefix to the Gemini context cache"""
+        cache = self.client.caches.create(
+            model=model or self.model_name,
+            config={
+                'contents': [contents],
+                'system_instruction': system_instruction,
+                'ttl': f"{ttl_seconds}s",
+                'display_name': display_name,
+            }
+        )
+        return {"name": cache.name, "expire_time": cache.expire_time.timestamp()}
+
+    def refresh_cached_context(self, name: str, ttl_seconds: int) -> float:
+        """Extend the TTL of a cached context, returning the new expiry timestamp"""
+        cache = self.client.caches.update(name=name, config={'ttl': f"{ttl_seconds}s"})
+        return cache.expire_time.timestamp()
+
+    def call(self, prompt: str, system_instruction: str = None, cached_context: str = None,
+             model: str = None, response_schema: Dict = None) -> str:
+        """Make Gemini API call; `model` overrides the client's default model for this call.
+
+        With `response_schema` the model answers with JSON constrained to that schema.
+        """
+        try:
+            config = dict(self.generation_config)
+            if response_schema:
+                config['response_mime_type'] = 'application/json'
+                config['response_schema'] = response_schema
+
+            if cached_context:
+                # The system instruction lives in the cached context
+                full_prompt = prompt
+                config['cached_content'] = cached_context
+            elif system_instruction:
+                # Combine system instruction with prompt if provided
+                full_prompt = f"{system_instruction}\n\n{prompt}"
+            else:
+                full_prompt = prompt
+
+            # Generate response using the new SDK
+            response = self.client.models.generate_content(
+                model=model or self.model_name,
+                contents=full_prompt,
+                config=config
+            )
+
+            return response.text
+
+        except Exception as e:
+            if cached_context:
+                self.context_cache.invalidate(cached_context)
+            raise Exception(f"Gemini API error: {str(e)}")
+
+
+class LocalLLMClient:
+    """Offline stand-in for GeminiClient.
+
+    Answers with a local ``responder(prompt, system_instruction) -> str`` and keeps cached
+    contexts in memory with the same create/refresh/expiry behaviour as the provider, so
+    prompt assembly and caching can be exercised without network access.
+    `model_responders` answers for specific model names instead of `responder`.
+    """
+
+    def __init__(self, responder, model_name: str = 'local', cache_ttl_seconds: int = 3600,
+                 model_responders: Optional[Dict] = None):
+        self.responder = responder
+        self.model_name = model_name
+        self.model_responders = model_responders or {}
+        self._caches = {}
+        self.usage = {"calls": 0, "prompt_chars": 0, "cached_chars": 0, "models": {}}
+        self.context_cache = CachedContextRegistry(self, ttl_seconds=cache_ttl_seconds)
+
+    def create_cached_context(self, contents: str, system_instruction: str = None,
+                              ttl_seconds: int = 3600, display_name: str = None, model: str = None) -> Dict:
+        name = f"cachedContents/local-{len(self._caches) + 1}"
+        expire_time = time.time() + ttl_seconds
+        self._caches[name] = {
+            "contents": contents,
+            "system_instruction": system_instruction,
+            "model": model or self.model_name,
+            "expire_time": expire_time
+        }
+        return {"name": name, "expire_time": expire_time}
+
+    def refresh_cached_context(self, name: str, ttl_seconds: int) -> float:
+        if name not in self._caches:
+            raise KeyError(f"Cached content not found: {name}")
+        self._caches[name]['expire_time'] = time.time() + ttl_seconds
+        return self._caches[name]['expire_time']
+
+    def call(self, prompt: str, system_instruction: str = None, cached_context: str = None,
+             model: str = None, response_schema: Dict = None) -> str:
+        # Responders produce schema-shaped JSON themselves; the schema is only counted
+        model = model or self.model_name
+        self.usage['calls'] += 1
+        if response_schema:
+            self.usage['structured_calls'] = self.usage.get('structured_calls', 0) + 1
+        self.usage['prompt_chars'] += len(prompt)
+        self.usage['models'][model] = self.usage['models'].get(model, 0) + 1
+
+        if cached_context:
+            cache = self._caches.get(cached_context)
+            if cache is None or cache['expire_time'] <= time.time() or cache['model'] != model:
+                self.context_cache.invalidate(cached_context)
+                raise Exception(f"Local LLM error: cached content expired or not found: {cached_context}")
+            self.usage['cached_chars'] += len(cache['contents'])
+            prompt = f"{cache['contents']}\n\n{prompt}"
+            system_instruction = cache['system_instruction']
+
+        return self.model_responders.get(model, self.responder)(prompt, system_instruction)
+
+
+# ============================================
+# TAIL LATENCY AND FAILURE HANDLING
+# ============================================
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose recent error rate tripped the breaker"""
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency at quantile q (0-1), or None until min_samples calls were seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """Opens when the error rate over the last `window` calls reaches `failure_rate`.
+
+    While open, calls are refused for `cooldown_seconds`; then one trial call is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10,
+                 cooldown_seconds: float = 30.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"  # closed, open, half_open
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self.state = "half_open"
+                return True  # the trial call
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == "half_open":
+                if success:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self.state = "open"
+                    self._opened_at = time.monotonic()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class ResilientLLMClient:
+    """Wraps an LLM client with hedged requests and a circuit breaker.
+
+    A call still running after the `hedge_percentile` latency of recent calls gets one
+    duplicate request, and whichever answers first wins. When the breaker is open, calls
+    go to `fallback` if one is configured, else fail fast with CircuitOpenError.
+    Cached contexts belong to the primary client, so calls using one are never sent to
+    the fallback; callers retry those with the full prompt.
+    """
+
+    def __init__(self, primary, fallback=None, hedge_percentile: float = 0.95,
+                 breaker: Optional[CircuitBreaker] = None, max_workers: int = 64):
+        self.primary = primary
+        self.fallback = fallback
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = {}  # model name -> LatencyTracker
+        self.model_name = primary.model_name
+        self.context_cache = getattr(primary, 'context_cache', None)
+        # Every request and hedge runs here and losing hedges finish in the background. The
+        # client is shared by all sessions, so the pool is sized well above the callers (job
+        # workers times speculative candidates) to keep requests from queueing.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "fallback_calls": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _latency_for(self, model: Optional[str]) -> LatencyTracker:
+        return self.latency.setdefault(model or self.model_name, LatencyTracker())
+
+    def create_cached_context(self, *args, **kwargs) -> Dict:
+        return self.primary.create_cached_context(*args, **kwargs)
+
+    def refresh_cached_context(self, name: str, ttl_seconds: int) -> float:
+        return self.primary.refresh_cached_context(name, ttl_seconds)
+
+    def call(self, prompt: str, system_instruction: str = None, cached_context: str = None,
+             model: str = None, response_schema: Dict = None) -> str:
+        self._count('calls')
+        if not self.breaker.allow():
+            if self.fallback is not None and not cached_context:
+                # The fallback answers with its own model
+                self._count('fallback_calls')
+                return self.fallback.call(prompt, system_instruction, response_schema=response_schema)
+            self._count('rejected')
+            raise CircuitOpenError(f"{self.model_name} circuit open after repeated errors")
+
+        try:
+            response = self._hedged_call(prompt, system_instruction, cached_context, model, response_schema)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        return response
+
+    def _timed_call(self, started: threading.Event, *args) -> tuple:
+        """One request on a pool thread: (response, seconds from when it actually started)"""
+        start = time.monotonic()
+        started.set()
+        response = self.primary.call(*args)
+        return response, time.monotonic() - start
+
+    def _hedged_call(self, prompt: str, system_instruction: Optional[str], cached_context: Optional[str],
+                     model: Optional[str], response_schema: Optional[Dict] = None) -> str:
+        args = (prompt, system_instruction, cached_context, model, response_schema)
+        started = threading.Event()
+        first = self._executor.submit(self._timed_call, started, *args)
+        pending = {first}
+
+        # Models differ in latency, so each keeps its own history
+        latency = self._latency_for(model)
+        delay = latency.percentile(self.hedge_percentile)
+        if delay is not None:
+            # The hedge deadline counts from the request's start, not from time queued in the pool
+            started.wait()
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                self._count('hedged')
+                pending.add(self._executor.submit(self._timed_call, threading.Event(), *args))
+
+        # First successful answer wins; an error only counts once every request has failed
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response, seconds = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is not first:
+                    self._count('hedge_wins')
+                latency.record(seconds)
+                return response
+        raise error
@@ -0,0 +1,982 @@
+"""
+Text-to-SQL Pipeline
+File: pipeline.py
+
+Three steps: the LLM identifies the tables a question needs, the knowledge graph
+supplies the joins, and the LLM writes the SQL. Importable without Streamlit,
+plotting libraries or the Gemini SDK.
+"""
+
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Optional
+
+from knowledge_graph import TableKnowledgeGraph
+from llm_client import GeminiClient
+from prompt_budget import PromptBudget, query_terms, rank_lines
+from query_templates import QueryTemplateCache
+from sql_builder import SQL_PARTS_SCHEMA, assemble_sql, build_from_clause, table_aliases
+
+
+# ============================================
+# TEXT-TO-SQL PIPELINE
+# ============================================
+
+def _no_progress(stage: str):
+    """Default stage callback"""
+
+
+class SpeculationCancelled(Exception):
+    """Raised inside a speculative generate_sql once its candidate has lost"""
+
+
+def _check_cancelled(cancel: Optional[threading.Event]):
+    if cancel is not None and cancel.is_set():
+        raise SpeculationCancelled()
+
+
+class TextToSQLPipeline:
+    def __init__(self, kg: TableKnowledgeGraph, llm_client: GeminiClient, speculative_candidates: int = 0,
+                 use_context_cache: bool = True, template_cache: Optional[QueryTemplateCache] = None,
+                 prompt_budget: Optional[PromptBudget] = None, model_cascade: Optional[List[Optional[str]]] = None,
+                 skeleton_sql: bool = False):
+        self.kg = kg
+        self.llm = llm_client
+        # Models to try for each LLM step, fastest first; the next one is only used when the
+        # answer fails local validation. None stands for the client's default model.
+        self.model_cascade = list(model_cascade or [None])
+        # Per-call token budget; schema lines beyond it are dropped by relevance
+        self.prompt_budget = prompt_budget or PromptBudget()
+        # Estimated size of every prompt sent for the current question (or batch), in call order
+        self.prompt_log = []
+        # Shared across pipelines so templates learned from one question serve the next
+        self.template_cache = template_cache
+        # Send the static schema + instructions prefix as a provider-side cached context
+        self.use_context_cache = use_context_cache
+        # Number of (tables, context) guesses to run generate_sql for while step 1 is in flight.
+        # 0 disables speculation; each candidate costs at most one extra LLM call.
+        self.speculative_candidates = speculative_candidates
+        # Build FROM/JOIN from the join plan and have the LLM return only the other clauses
+        self.skeleton_sql = skeleton_sql
+
+    def predict_table_candidates(self, user_query: str, max_candidates: Optional[int] = None) -> List[Dict]:
+        """Guess likely step 1 answers locally from table names and join contexts in the graph"""
+        query_lower = user_query.lower()
+
+        # Tables mentioned by name (singular or plural)
+        mentioned = []
+        for match in self.kg.entity_matcher.match(user_query):
+            if match['kind'] == 'table' and match['table'] not in mentioned:
+                mentioned.append(match['table'])
+
+        # The most connected table is the usual anchor for the joins
+        degrees = dict(self.kg.undirected.degree())
+        hub = max(degrees, key=degrees.get) if degrees else None
+
+        table_sets = []
+        if hub and hub not in mentioned:
+            table_sets.append(sorted(mentioned + [hub]))
+        if mentioned:
+            table_sets.append(sorted(mentioned))
+        if hub and [hub] not in table_sets:
+            table_sets.append([hub])
+
+        # Non-default edge contexts whose keywords the query mentions, as the schema
+        # names them, e.g. "country" -> "For country level data"
+        contexts = []
+        for edge_context in self.kg.edge_contexts():
+            if edge_context == 'default':
+                continue
+            if any(word not in ('for', 'level', 'data') and word in query_lower
+                   for word in edge_context.lower().split()):
+                contexts.append(edge_context)
+        contexts.append(None)
+
+        candidates = [
+            {"tables": tables, "context": context}
+            for tables in table_sets
+            for context in contexts
+        ]
+        return candidates[:max_candidates]
+
+    @staticmethod
+    def _join_signature(join_info: Dict) -> tuple:
+        """Key identifying the inputs generate_sql actually depends on"""
+        return (
+            tuple(sorted(join_info['all_tables_needed'])),
+            tuple(sorted(
+                (join['from_table'], join['to_table'], join['join_type'], join['join_condition'])
+                for join in join_info['joins']
+            ))
+        )
+
+    def _call_llm(self, step: str, sections: Dict[str, str], prompt: str,
+                  system_instruction: Optional[str] = None, cached_context: Optional[str] = None,
+                  model: Optional[str] = None, response_schema: Optional[Dict] = None,
+                  cancel: Optional[threading.Event] = None) -> str:
+        """Call the LLM, recording the estimated size of each prompt section.
+
+        Raises SpeculationCancelled instead of calling once `cancel` is set.
+        """
+        _check_cancelled(cancel)
+        if system_instruction:
+            sections = {**sections, "system": system_instruction}
+        # Measured on the text the model reads; a cached prefix is read on every call too
+        sent = "\n\n".join(text for text in (system_instruction, sections.get("cached_prefix"), prompt) if text)
+        entry = self.prompt_budget.report(sections, sent)
+        entry['step'] = step
+        entry['cached_context'] = cached_context is not None
+        entry['model'] = model or self.llm.model_name
+        entry['structured'] = response_schema is not None
+        self.prompt_log.append(entry)
+        if cached_context is not None:
+            return self.llm.call(prompt, cached_context=cached_context, model=model, response_schema=response_schema)
+        return self.llm.call(prompt, system_instruction, model=model, response_schema=response_schema)
+
+    def _escalate(self, step: str, model: Optional[str], reason: str):
+        """Note on the last logged call why its answer was rejected"""
+        for entry in reversed(self.prompt_log):
+            if entry['step'] == step and entry['model'] == (model or self.llm.model_name):
+                entry['rejected'] = reason
+                break
+
+    def _mentioned_columns(self, user_query: str, grounding: Optional[Dict] = None,
+                           literals: Optional[List[Dict]] = None) -> Dict[str, set]:
+        """Columns the query names or holds a value for, per table"""
+        grounding = grounding or self.kg.entity_matcher.ground(user_query)
+        literals = self.kg.value_index.resolve(user_query) if literals is None else literals
+        mentioned = {table: set(columns) for table, columns in grounding['columns'].items()}
+        for lit in literals:
+            for c in lit['columns']:
+                mentioned.setdefault(c['table'], set()).add(c['column'])
+        return mentioned
+
+    @staticmethod
+    def _join_key_columns(join_info: Dict) -> Dict[str, set]:
+        """Columns used in the join conditions, per table"""
+        keys = {}
+        for join in join_info['joins']:
+            for condition in join['join_condition'].split(" AND "):
+                for side in condition.split(" = "):
+                    table, _, column = side.partition('.')
+                    keys.setdefault(table, set()).add(column)
+        return keys
+
+    def _budget_schema_lines(self, schemas: Dict, user_query: str, fixed_sections: Dict[str, str],
+                             mentioned: Dict[str, set], required: Optional[Dict[str, set]] = None,
+                             max_lines_per_table: Optional[int] = None,
+                             render: Optional[Callable[[Dict[str, List[Dict]]], str]] = None) -> Dict[str, List[Dict]]:
+        """Schema lines per table, ranked by relevance and cut to the budget left after the fixed sections.
+
+        With `render` (selected lines -> full prompt) the assembled prompt is measured
+        and the schema cut further until the prompt fits, down to the minimum schema share.
+        """
+        required = required or {}
+        terms = query_terms(user_query)
+        lines_by_table = {}
+        scores_by_table = {}
+        for table, columns in schemas.items():
+            lines = self.kg.schema_summary.lines(table, columns)
+            scores = rank_lines(lines, terms, mentioned.get(table, ()), required.get(table, ()))
+            if max_lines_per_table is not None:
+                # Beyond the cap only lines the query points at are considered
+                keep = [i for i, score in enumerate(scores) if i < max_lines_per_table or score >= 100]
+                lines = [lines[i] for i in keep]
+                scores = [scores[i] for i in keep]
+            lines_by_table[table] = lines
+            scores_by_table[table] = scores
+        budget = self.prompt_budget
+        allowance = budget.schema_allowance(fixed_sections)
+        selected = budget.select(lines_by_table, scores_by_table, allowance)
+        if render is None:
+            return selected
+
+        system = fixed_sections.get("system")
+        while allowance > budget.min_schema_tokens:
+            prompt = render(selected)
+            overshoot = budget.measure(f"{system}\n\n{prompt}" if system else prompt) - budget.total_tokens
+            if overshoot <= 0:
+                break
+            allowance = max(allowance - overshoot, budget.min_schema_tokens)
+            smaller = budget.select(lines_by_table, scores_by_table, allowance)
+            if smaller == selected:
+                break  # Only required lines left
+            selected = smaller
+        return selected
+    
+    IDENTIFY_SYSTEM_INSTRUCTION = "You are a database expert. Analyze queries and identify required tables."
+
+    IDENTIFY_GUIDELINES = """Follow these guidelines:
+
+1. If the query asks about "concentration", you typically need BOTH the "Counterparty" and "Concentration" tables joined together.
+2. If the query asks about "trades", you typically need BOTH the "Counterparty" and "Trade" tables joined together.
+3. If the query specifically asks only about counterparty attributes, you may only need the "Counterparty" table.
+
+Also set "context" to the join context the query asks for (e.g. country, rating or sector level data), or to null if it names none."""
+
+    # Above this many tables the response schema lists no table names; _check_table_info still rejects unknown ones
+    MAX_TABLE_ENUM = 500
+
+    def identify_response_schema(self, batch: bool = False) -> Dict:
+        """Structured output for step 1: known table names and join contexts only"""
+        tables = sorted(self.kg.graph.nodes())
+        table_item = {"type": "STRING"}
+        if len(tables) <= self.MAX_TABLE_ENUM:
+            table_item["enum"] = tables
+        context = {"type": "STRING", "nullable": True}
+        contexts = [c for c in self.kg.edge_contexts() if c != 'default']
+        if contexts:
+            context["enum"] = contexts
+        answer = {
+            "type": "OBJECT",
+            "properties": {
+                "tables": {"type": "ARRAY", "items": table_item},
+                "context": context,
+                "reasoning": {"type": "STRING"}
+            },
+            "required": ["tables", "context"]
+        }
+        if not batch:
+            return answer
+        answer["properties"] = {"id": {"type": "STRING"}, **answer["properties"]}
+        answer["required"] = ["id"] + answer["required"]
+        return {"type": "ARRAY", "items": answer}
+
+    @staticmethod
+    def _grounding_hints(grounding: Dict, literals: List[Dict], indent: str = "  ") -> str:
+        """Schema names and literal values found in a question, as prompt lines"""
+        hints = ""
+        if grounding['matches']:
+            hints += "Schema names mentioned in the query:\n"
+            for match in grounding['matches']:
+                target = match['table'] if match['kind'] == 'table' else f"{match['table']}.{match['column']}"
+                hints += f"{indent}- \"{match['text']}\" -> {match['kind']} {target}\n"
+            hints += "\n"
+
+        if literals:
+            hints += "Values in the query and the columns that hold them:\n"
+            for lit in literals:
+                targets = ', '.join(f"{c['table']}.{c['column']}" for c in lit['columns'])
+                hints += f"{indent}- \"{lit['value']}\" ({lit['kind']}) -> {targets}\n"
+            hints += "\n"
+        return hints
+
+    def _identify_schema_context(self, query_text: str, fixed_sections: Dict[str, str],
+                                 mentioned: Dict[str, set], render_prompt: Callable[[str], str]) -> str:
+        """Table list for step 1: up to 15 column lines per table plus any column the query
+        mentions, most relevant first, so that render_prompt(table list) fits the token budget"""
+        selected = self._budget_schema_lines(
+            self.kg.schemas,
+            query_text,
+            fixed_sections,
+            mentioned,
+            max_lines_per_table=15,
+            render=lambda lines: render_prompt(self._format_table_list(lines))
+        )
+        return self._format_table_list(selected)
+
+    @staticmethod
+    def _format_table_list(selected: Dict[str, List[Dict]]) -> str:
+        """Step 1 table list with the selected column lines"""
+        schema_context = "Available tables and their descriptions:\n\n"
+        for table_name, lines in selected.items():
+            schema_context += f"Table: {table_name}\n"
+            schema_context += "Key columns:\n"
+            for line in lines:
+                schema_context += f"  - {line['text']}\n"
+            schema_context += "\n"
+        return schema_context
+
+    @staticmethod
+    def _parse_json_response(response: str, opening: str = '{', closing: str = '}'):
+        """Parse JSON from an LLM response, tolerating markdown fences and surrounding text"""
+        try:
+            # Clean up response - remove markdown code blocks if present
+            response = response.strip()
+            if response.startswith('```json'):
+                response = response[7:]
+            elif response.startswith('```'):
+                response = response[3:]
+            if response.endswith('```'):
+                response = response[:-3]
+            response = response.strip()
+
+            # Try to extract JSON if there's extra text
+            start = response.find(opening)
+            end = response.rfind(closing) + 1
+            if start != -1 and end > start:
+                return json.loads(response[start:end])
+            return json.loads(response)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Failed to parse LLM response: {response}") from e
+
+    def identify_tables(self, user_query: str) -> Dict:
+        """Step 1: Identify required tables using LLM"""
+        # Tables and columns the query mentions by name or by value, found locally
+        grounding = self.kg.entity_matcher.ground(user_query)
+        literals = self.kg.value_index.resolve(user_query)
+        hints = self._grounding_hints(grounding, literals)
+
+        request = f"""User Query: "{user_query}"
+
+Based on the query, identify which tables are needed. {self.IDENTIFY_GUIDELINES}"""
+
+        schema_context = self._identify_schema_context(
+            user_query,
+            {"hints": hints, "request": request, "system": self.IDENTIFY_SYSTEM_INSTRUCTION},
+            self._mentioned_columns(user_query, grounding, literals),
+            lambda table_list: f"{table_list}{hints}\n{request}"
+        )
+
+        print(schema_context)
+
+        prompt = f"{schema_context}{hints}\n{request}"
+
+        # Escalate to the next model when the answer fails the checks against the graph
+        response_schema = self.identify_response_schema()
+        for model in self.model_cascade:
+            response = self._call_llm(
+                "identify_tables",
+                {"schema": schema_context, "hints": hints, "request": request},
+                prompt,
+                self.IDENTIFY_SYSTEM_INSTRUCTION,
+                model=model,
+                response_schema=response_schema
+            )
+            try:
+                table_info = json.loads(response)
+            except json.JSONDecodeError:
+                self._escalate("identify_tables", model, "invalid JSON")
+                continue
+            problem = self._check_table_info(table_info)
+            if problem is None:
+                return table_info
+            self._escalate("identify_tables", model, problem)
+
+        # No usable answer: continue with the local guess rather than failing the question
+        candidates = self.predict_table_candidates(user_query, max_candidates=1)
+        if not candidates:
+            raise ValueError(f"No valid table identification for: {user_query}")
+        # Same checks as an LLM answer, so single-question and batch mode accept the same guesses
+        problem = self._check_table_info(candidates[0])
+        if problem:
+            raise ValueError(f"No valid table identification for: {user_query} ({problem})")
+        return {**candidates[0], "reasoning": "Predicted locally; no valid LLM answer", "fallback": True}
+
+    def _check_table_info(self, item) -> Optional[str]:
+        """Why a step 1 answer is unusable, or None if it names known tables"""
+        if not isinstance(item, dict):
+            return "not a JSON object"
+        tables = item.get('tables')
+        if not isinstance(tables, list) or not tables:
+            return "missing \"tables\""
+        unknown = [t for t in tables if t not in self.kg.graph]
+        if unknown:
+            return f"unknown tables {unknown}"
+        context = item.get('context')
+        if context is not None and not isinstance(context, str):
+            return "\"context\" must be a string or null"
+        # Exactly one of the schema's contexts, as the response schema's enum lists them
+        if context and context not in [c for c in self.kg.edge_contexts() if c != 'default']:
+            return f"unknown context {context!r}"
+        return None
+
+    def identify_tables_batch(self, questions: Dict[str, str], batch_size: int = 20) -> Dict:
+        """Step 1 for many questions: one LLM call per chunk of `batch_size` questions.
+
+        The schema context is sent once per chunk instead of once per question. Answers
+        missing from the returned array, or naming unknown tables, are retried one question
+        at a time with identify_tables; questions that still fail are reported in "errors".
+        Returns {"results": {id: table_info}, "errors": {id: message}}.
+        """
+        results = {}
+        errors = {}
+        ids = list(questions)
+        for chunk_start in range(0, len(ids), batch_size):
+            chunk = ids[chunk_start:chunk_start + batch_size]
+            answers = {}
+            try:
+                answers = self._identify_chunk({qid: questions[qid] for qid in chunk})
+            except Exception:
+                answers = {}  # Whole chunk failed - every question is retried below
+
+            for qid in chunk:
+                answer = answers.get(qid)
+                if answer is not None and self._check_table_info(answer) is None:
+                    results[qid] = {key: value for key, value in answer.items() if key != 'id'}
+                    continue
+                try:
+                    answer = self.identify_tables(questions[qid])
+                    problem = self._check_table_info(answer)
+                    if problem:
+                        raise ValueError(problem)
+                    results[qid] = answer
+                except Exception as e:
+                    errors[qid] = str(e)
+
+        return {"results": results, "errors": errors}
+
+    def _identify_chunk(self, questions: Dict[str, str]) -> Dict[str, Dict]:
+        """One packed step 1 call; returns the parsed answers keyed by question ID"""
+        question_lines = ""
+        hints = ""
+        mentioned = {}
+        for qid, question in questions.items():
+            grounding = self.kg.entity_matcher.ground(question)
+            literals = self.kg.value_index.resolve(question)
+            question_lines += f"- id {json.dumps(qid)}: \"{question}\"\n"
+            question_hints = self._grounding_hints(grounding, literals, indent="    ")
+            if question_hints:
+                hints += f"For id {json.dumps(qid)}:\n{question_hints}"
+            for table, columns in self._mentioned_columns(question, grounding, literals).items():
+                mentioned.setdefault(table, set()).update(columns)
+
+        request = f"""User Queries:
+{question_lines}
+For EACH query, identify which tables are needed. {self.IDENTIFY_GUIDELINES}
+
+Return one answer per query; every id listed above must appear exactly once."""
+
+        schema_context = self._identify_schema_context(
+            " ".join(questions.values()),
+            {"hints": hints, "request": request, "system": self.IDENTIFY_SYSTEM_INSTRUCTION},
+            mentioned,
+            lambda table_list: f"{table_list}{hints}\n{request}"
+        )
+        prompt = f"{schema_context}{hints}\n{request}"
+
+        # Failed answers are retried per question, which escalates through the cascade
+        response = self._call_llm(
+            "identify_tables_batch",
+            {"schema": schema_context, "hints": hints, "request": request},
+            prompt,
+            self.IDENTIFY_SYSTEM_INSTRUCTION,
+            model=self.model_cascade[0],
+            response_schema=self.identify_response_schema(batch=True)
+        )
+        answers = json.loads(response)
+        if not isinstance(answers, list):
+            raise ValueError(f"Expected a JSON array, got: {response}")
+        return {
+            str(answer['id']): answer
+            for answer in answers
+            if isinstance(answer, dict) and str(answer.get('id')) in questions
+        }
+
+    def get_join_info(self, tables: List[str], context: Optional[str]) -> Dict:
+        """Step 2: Get join information from Knowledge Graph"""
+        # Cheap join tree (Steiner 2-approximation) over the requested tables: intermediate
+        # tables included, exactly one join (of the query's context) per pair of joined tables
+        tree = self.kg.join_planner.plan(tables, context)
+        all_tables = tree['tables']
+        joins = tree['joins']
+
+        # Driving table and join order from table statistics, when the graph has them
+        join_plan = self.kg.plan_join_order(all_tables, joins)
+        if join_plan:
+            position = {table: i for i, table in enumerate(join_plan['join_order'])}
+            joins.sort(key=lambda j: max(position[j['from_table']], position[j['to_table']]))
+
+        # Get schemas
+        schemas = self.kg.get_columns_for_tables(all_tables)
+
+        return {
+            "requested_tables": tables,
+            "all_tables_needed": all_tables,
+            "joins": joins,
+            "schemas": schemas,
+            "context": context,
+            "join_plan": join_plan
+        }
+    
+    SQL_SYSTEM_INSTRUCTION = "You are a SQL expert. Generate accurate, well-formatted SQL queries based on provided schema and join information. CRITICAL: You MUST use ALL parts of every join condition provided - never omit any condition. Return only the SQL query without any markdown formatting or explanations."
+
+    SQL_INSTRUCTIONS = """INSTRUCTIONS FOR SQL GENERATION:
+
+1. JOIN CONDITIONS - ABSOLUTELY CRITICAL:
+   - Copy the EXACT join condition from the JOIN RELATIONSHIPS section into your ON clause
+   - If you see " AND " in the join condition, that means MULTIPLE conditions - use ALL of them
+   - DO NOT simplify or omit any part of the join condition
+   - DO NOT use only one part of a multi-part join condition
+
+2. SELECT relevant columns based on the user query
+
+3. Include appropriate WHERE clauses if needed
+
+4. Use table aliases for readability
+
+5. Format properly with indentation
+
+6. COLUMN FAMILIES:
+   - A schema line such as "Stressed MPE - Scenario{1..10}" or "# of {IR|FX} Trades" stands for several columns
+   - Always write the exact expanded column name, e.g. "Stressed MPE - Scenario3" or "# of FX Trades"
+
+EXAMPLE OF CORRECT JOIN USAGE:
+If the join condition provided is:
+"Counterparty.Entity = Trade.Entity AND Counterparty.Counterparty ID = Trade.Reporting Counterparty ID"
+
+Your ON clause MUST be:
+ON c.Entity = t.Entity AND c."Counterparty ID" = t."Reporting Counterparty ID"
+
+NOT just: ON c."Counterparty ID" = t."Reporting Counterparty ID"  (WRONG - missing Entity)
+NOT just: ON c.Entity = t.Entity  (WRONG - missing Counterparty ID)
+
+Return ONLY the SQL query without any explanations, markdown formatting, or code blocks."""
+
+    def _format_schemas(self, schemas: Dict, selected: Optional[Dict[str, List[Dict]]] = None) -> str:
+        """Render table schemas as one line per column, or per column family.
+
+        `selected` holds the lines kept by the token budget; without it every line is shown.
+        """
+        lines_by_table = {
+            table: self.kg.schema_summary.lines(table, columns) for table, columns in schemas.items()
+        }
+        if selected is None or selected == lines_by_table:
+            text = "TABLE SCHEMAS (with all columns and descriptions):\n"
+        else:
+            text = "TABLE SCHEMAS (columns most relevant to the query):\n"
+            lines_by_table = selected
+        for table, lines in lines_by_table.items():
+            text += f"\n{table}:\n"
+            for line in lines:
+                text += f"  - {line['text']}\n"
+        return text
+
+    def build_sql_static_context(self) -> str:
+        """Static part of the SQL prompt: every table schema plus the instructions.
+
+        Depends only on the knowledge graph, so it is identical for every query against the
+        same graph version and can be held in the provider's context cache.
+        """
+        return f"{self._format_schemas(self.kg.schemas)}\n\n{self.SQL_INSTRUCTIONS}"
+
+    def build_sql_request(self, user_query: str, join_info: Dict) -> str:
+        """Per-query part of the SQL prompt: the question and the join plan"""
+        context = f"""Generate a SQL query for the following request.
+
+USER QUERY: "{user_query}"
+
+TABLES TO USE: {', '.join(join_info['all_tables_needed'])}
+
+JOIN RELATIONSHIPS:
+"""
+
+        for join in join_info['joins']:
+            context += f"\n{join['from_table']} {join['join_type']} JOIN {join['to_table']}"
+            context += f"\nON {join['join_condition']}"
+
+            # Emphasize multi-part joins
+            if " AND " in join['join_condition']:
+                context += f"\n*** THIS IS A COMPOSITE JOIN - YOU MUST USE ALL CONDITIONS: {join['join_condition']} ***"
+
+            if join.get('description'):
+                context += f"\n({join['description']})"
+            context += "\n"
+
+        plan = join_info.get('join_plan')
+        if plan:
+            context += "\nJOIN ORDER (from table statistics):\n"
+            context += f"FROM {plan['driving_table']} (~{plan['row_counts'][plan['driving_table']]:,} rows, the driving table)\n"
+            for step in plan['steps']:
+                matches = f", ~{step['fanout']:,.1f} matching rows per row" if step['fanout'] is not None else ""
+                context += f"JOIN {step['table']} (~{step['rows']:,} rows{matches})\n"
+            context += (f"Start the FROM clause with {plan['driving_table']} and join the other tables "
+                        f"in this order; do not start from a smaller table.\n")
+
+        return context + self._literal_value_hints(user_query, join_info)
+
+    def _literal_value_hints(self, user_query: str, join_info: Dict, aliases: Optional[Dict[str, str]] = None) -> str:
+        """Literal values resolved to their columns from the schema's example values, as a prompt section"""
+        value_hints = []
+        for lit in self.kg.value_index.resolve(user_query):
+            columns = [c for c in lit['columns'] if c['table'] in join_info['all_tables_needed']]
+            if columns:
+                targets = ' or '.join(f'{(aliases or {}).get(c["table"], c["table"])}."{c["column"]}"'
+                                      for c in columns)
+                value_hints.append(f"'{lit['value']}' -> {targets}")
+        if not value_hints:
+            return ""
+        return "\nLITERAL VALUES (filter these columns):\n" + "\n".join(value_hints) + "\n"
+
+    PARTS_SYSTEM_INSTRUCTION = "You are a SQL expert. Fill in the clauses of a SQL query whose FROM clause is given. Return only the JSON object."
+
+    PARTS_INSTRUCTIONS = """Return the SELECT list, WHERE, GROUP BY, HAVING and ORDER BY parts as JSON:
+- Qualify every column with its table alias and double-quote names, e.g. c."Counterparty ID"
+- Leave out the FROM clause and joins; they are added as shown
+- Column family lines such as "Stressed MPE - Scenario{1..10}" stand for the expanded names, e.g. "Stressed MPE - Scenario3"
+- Use null or an empty list for a clause the query does not need"""
+
+    def build_parts_request(self, user_query: str, join_info: Dict, from_clause: str,
+                            aliases: Dict[str, str]) -> str:
+        """Per-query part of the skeleton prompt: the question, the fixed FROM clause and its aliases"""
+        request = f"""USER QUERY: "{user_query}"
+
+FROM CLAUSE (fixed):
+{from_clause}
+
+TABLE ALIASES: {', '.join(f'{alias} = {table}' for table, alias in aliases.items())}
+"""
+        return request + self._literal_value_hints(user_query, join_info, aliases)
+
+    def _generate_sql_from_parts(self, user_query: str, join_info: Dict,
+                                 cancel: Optional[threading.Event] = None) -> Optional[str]:
+        """Step 3 in skeleton mode: FROM/JOIN from the join plan, the other clauses from the LLM.
+
+        Returns None when the plan does not connect all tables, or no model returned
+        usable parts; generate_sql then asks for the whole query instead.
+        """
+        aliases = table_aliases(join_info['all_tables_needed'])
+        from_clause = build_from_clause(join_info, aliases)
+        if from_clause is None:
+            return None
+
+        request = self.build_parts_request(user_query, join_info, from_clause, aliases)
+        selected = self._budget_schema_lines(
+            join_info['schemas'],
+            user_query,
+            {"request": request, "instructions": self.PARTS_INSTRUCTIONS, "system": self.PARTS_SYSTEM_INSTRUCTION},
+            self._mentioned_columns(user_query),
+            render=lambda lines: f"{request}\n{self._format_schemas(join_info['schemas'], lines)}\n{self.PARTS_INSTRUCTIONS}"
+        )
+        schema_text = self._format_schemas(join_info['schemas'], selected)
+        prompt = f"{request}\n{schema_text}\n{self.PARTS_INSTRUCTIONS}"
+
+        sql_query = None
+        for attempt, model in enumerate(self.model_cascade, 1):
+            response = self._call_llm(
+                "generate_sql",
+                {"request": request, "schema": schema_text, "instructions": self.PARTS_INSTRUCTIONS},
+                prompt,
+                self.PARTS_SYSTEM_INSTRUCTION,
+                model=model,
+                response_schema=SQL_PARTS_SCHEMA,
+                cancel=cancel
+            )
+            try:
+                candidate = assemble_sql(from_clause, self._parse_json_response(response))
+            except ValueError as e:
+                self._escalate("generate_sql", model, f"unusable SQL parts: {e}")
+                continue
+            sql_query = candidate
+            if self.validate_sql(candidate)['valid']:
+                break
+            if attempt < len(self.model_cascade):
+                self._escalate("generate_sql", model, "unknown identifiers")
+        return sql_query
+
+    def generate_sql(self, user_query: str, join_info: Dict, cancel: Optional[threading.Event] = None) -> str:
+        """Step 3: Generate SQL query using LLM.
+
+        A speculative run passes `cancel`; once it is set no further LLM call is made
+        and SpeculationCancelled is raised.
+        """
+        if self.skeleton_sql:
+            sql_query = self._generate_sql_from_parts(user_query, join_info, cancel)
+            if sql_query is not None:
+                return sql_query
+
+        request = self.build_sql_request(user_query, join_info)
+
+        # Escalate to the next model when a join condition is incomplete or an identifier unknown
+        for attempt, model in enumerate(self.model_cascade, 1):
+            sql_query = self._generate_sql_with(model, user_query, join_info, request, cancel)
+            if attempt == len(self.model_cascade):
+                break
+            missing = self.missing_join_conditions(sql_query, join_info)
+            if missing:
+                self._escalate("generate_sql", model, f"missing join conditions {missing}")
+                continue
+            if not self.validate_sql(sql_query)['valid']:
+                self._escalate("generate_sql", model, "unknown identifiers")
+                continue
+            break
+
+        return sql_query
+
+    def _generate_sql_with(self, model: Optional[str], user_query: str, join_info: Dict, request: str,
+                           cancel: Optional[threading.Event] = None) -> str:
+        """One SQL generation call to one model"""
+        _check_cancelled(cancel)  # Creating the cached context is a network call too
+        # Reuse the cached schema + instructions prefix when the client supports it and the
+        # whole catalog still fits the budget (cached tokens are still read on every call)
+        cached_context = None
+        static_context = None
+        if self.use_context_cache and getattr(self.llm, 'context_cache', None) is not None:
+            static_context = self.build_sql_static_context()
+            within_budget = self.prompt_budget.measure(
+                f"{self.SQL_SYSTEM_INSTRUCTION}\n\n{static_context}\n\n{request}"
+            ) <= self.prompt_budget.total_tokens
+            if within_budget:
+                cached_context = self.llm.context_cache.get(static_context, self.SQL_SYSTEM_INSTRUCTION, model=model)
+
+        sql_query = None
+        if cached_context:
+            try:
+                sql_query = self._call_llm(
+                    "generate_sql",
+                    {"cached_prefix": static_context, "request": request},
+                    request,
+                    self.SQL_SYSTEM_INSTRUCTION,
+                    cached_context=cached_context,
+                    model=model,
+                    cancel=cancel
+                )
+            except SpeculationCancelled:
+                raise
+            except Exception:
+                sql_query = None  # Cache expired or was evicted - fall back to the full prompt
+
+        if sql_query is None:
+            # Build context with the schemas of the tables involved, join keys and the
+            # columns the query points at first, cut to the token budget
+            selected = self._budget_schema_lines(
+                join_info['schemas'],
+                user_query,
+                {"request": request, "instructions": self.SQL_INSTRUCTIONS, "system": self.SQL_SYSTEM_INSTRUCTION},
+                self._mentioned_columns(user_query),
+                required=self._join_key_columns(join_info),
+                render=lambda lines: (f"{request}\n\n{self._format_schemas(join_info['schemas'], lines)}"
+                                      f"\n\n{self.SQL_INSTRUCTIONS}")
+            )
+            schema_text = self._format_schemas(join_info['schemas'], selected)
+            context = f"{request}\n\n{schema_text}\n\n{self.SQL_INSTRUCTIONS}"
+            sql_query = self._call_llm(
+                "generate_sql",
+                {"request": request, "schema": schema_text, "instructions": self.SQL_INSTRUCTIONS},
+                context,
+                self.SQL_SYSTEM_INSTRUCTION,
+                model=model,
+                cancel=cancel
+            )
+        
+        # Clean up the response
+        sql_query = sql_query.strip()
+        if sql_query.startswith('```sql'):
+            sql_query = sql_query[6:]
+        elif sql_query.startswith('```'):
+            sql_query = sql_query[3:]
+        if sql_query.endswith('```'):
+            sql_query = sql_query[:-3]
+        
+        return sql_query.strip()
+
+    @staticmethod
+    def missing_join_conditions(sql_query: str, join_info: Dict) -> List[str]:
+        """Parts of the planned join conditions that do not appear in the SQL.
+
+        A part "A.x = B.y" is found as x = y (either side first), with any table alias
+        and with or without double quotes around the column names.
+        """
+        def column(name: str) -> str:
+            return r'(?:[\w"]+\.)?(?:"' + re.escape(name) + r'"|' + re.escape(name) + r'(?![\w]))'
+
+        missing = []
+        for join in join_info['joins']:
+            for condition in join['join_condition'].split(" AND "):
+                left, _, right = condition.partition(" = ")
+                left_column = left.partition('.')[2]
+                right_column = right.partition('.')[2]
+                found = any(
+                    re.search(column(a) + r'\s*=\s*' + column(b), sql_query, re.IGNORECASE)
+                    for a, b in ((left_column, right_column), (right_column, left_column))
+                )
+                if not found:
+                    missing.append(condition)
+        return missing
+    
+    def validate_sql(self, sql_query: str) -> Dict:
+        """Check quoted identifiers in generated SQL against the exact table and column names"""
+        unknown = self.kg.schema_summary.unknown_identifiers(sql_query)
+        return {
+            "valid": not unknown,
+            "unknown_identifiers": unknown
+        }
+
+    def process_speculative(self, user_query: str, progress: Callable[[str], None] = _no_progress) -> Dict:
+        """Execute the pipeline, overlapping step 3 for predicted table sets with step 1"""
+        progress("identify_tables")
+        # Deduplicate candidates that resolve to the same joins
+        speculative_infos = {}
+        for candidate in self.predict_table_candidates(user_query):
+            if len(speculative_infos) >= self.speculative_candidates:
+                break
+            candidate_info = self.get_join_info(candidate['tables'], candidate['context'])
+            speculative_infos.setdefault(self._join_signature(candidate_info), candidate_info)
+
+        # One flag per candidate: a losing candidate already in flight stops before its next LLM call
+        cancels = {signature: threading.Event() for signature in speculative_infos}
+        executor = ThreadPoolExecutor(max_workers=1 + len(speculative_infos))
+        try:
+            table_future = executor.submit(self.identify_tables, user_query)
+            sql_futures = {
+                signature: executor.submit(self.generate_sql, user_query, candidate_info, cancels[signature])
+                for signature, candidate_info in speculative_infos.items()
+            }
+
+            # Step 1: Identify tables
+            table_info = table_future.result()
+
+            # Step 2: Get join information
+            progress("join_info")
+            join_info = self.get_join_info(
+                table_info['tables'],
+                table_info.get('context')
+            )
+
+            # Step 3: Keep the matching speculative SQL, discard the rest
+            progress("generate_sql")
+            matched_future = sql_futures.pop(self._join_signature(join_info), None)
+            for signature, future in sql_futures.items():
+                cancels[signature].set()
+                future.cancel()
+
+            sql_query = None
+            if matched_future is not None:
+                try:
+                    sql_query = matched_future.result()
+                except Exception:
+                    sql_query = None  # Retry below without speculation
+            speculation_hit = sql_query is not None
+            if sql_query is None:
+                sql_query = self.generate_sql(user_query, join_info)
+        finally:
+            # Do not wait for losing candidates that are already in flight; on an error
+            # every candidate is stopped
+            for cancel in cancels.values():
+                cancel.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return {
+            "user_query": user_query,
+            "table_info": table_info,
+            "join_info": join_info,
+            "sql_query": sql_query,
+            "speculation": {
+                "candidates": len(speculative_infos),
+                "hit": speculation_hit
+            }
+        }
+
+    def _template_result(self, user_query: str) -> Optional[Dict]:
+        """Answer a repeat-shaped question from a cached template without any LLM call"""
+        if self.template_cache is None:
+            return None
+        cached = self.template_cache.lookup(user_query)
+        # Templates stored against an earlier schema version are not reused
+        if not cached or cached['payload'].get('graph_fingerprint') != self.kg.fingerprint:
+            return None
+        return {
+            "user_query": user_query,
+            "graph_fingerprint": self.kg.fingerprint,
+            "table_info": cached['payload']['table_info'],
+            "join_info": cached['payload']['join_info'],
+            "sql_query": cached['sql'],
+            "validation": self.validate_sql(cached['sql']),
+            "template": {
+                "hit": True,
+                "template_sql": cached['template_sql'],
+                "parameters": cached['parameters']
+            }
+        }
+
+    def _complete(self, user_query: str, table_info: Dict, progress: Callable[[str], None] = _no_progress) -> Dict:
+        """Steps 2 and 3 for an answered step 1"""
+        # Step 2: Get join information
+        progress("join_info")
+        join_info = self.get_join_info(
+            table_info['tables'],
+            table_info.get('context')
+        )
+
+        # Step 3: Generate SQL
+        progress("generate_sql")
+        sql_query = self.generate_sql(user_query, join_info)
+
+        return {
+            "user_query": user_query,
+            "table_info": table_info,
+            "join_info": join_info,
+            "sql_query": sql_query
+        }
+
+    def _finish(self, user_query: str, result: Dict) -> Dict:
+        """Validate the SQL and offer it to the template cache"""
+        result['validation'] = self.validate_sql(result['sql_query'])
+        # Schema version the SQL was generated against
+        result['graph_fingerprint'] = self.kg.fingerprint
+
+        # SQL built on a locally guessed step 1 answer is not worth reusing
+        reusable = not result['validation']['unknown_identifiers'] and not result['table_info'].get('fallback')
+        if self.template_cache is not None and reusable:
+            stored = self.template_cache.store(
+                user_query,
+                result['sql_query'],
+                {"table_info": result['table_info'], "join_info": result['join_info'],
+                 "graph_fingerprint": self.kg.fingerprint}
+            )
+            result['template'] = {"hit": False, "stored": stored}
+        elif self.template_cache is not None:
+            result['template'] = {"hit": False, "stored": False}
+
+        return result
+
+    def process(self, user_query: str, progress: Callable[[str], None] = _no_progress) -> Dict:
+        """Execute complete pipeline.
+
+        `progress` is called with each stage name before the stage starts; an exception it
+        raises (e.g. on cancellation) stops the pipeline there.
+        """
+        self.prompt_log = []
+        progress("template_lookup")
+        cached = self._template_result(user_query)
+        if cached:
+            return cached
+
+        if self.speculative_candidates > 0:
+            result = self.process_speculative(user_query, progress)
+        else:
+            # Step 1: Identify tables
+            progress("identify_tables")
+            table_info = self.identify_tables(user_query)
+            result = self._complete(user_query, table_info, progress)
+
+        # Prompts sent for this question, including speculative calls
+        result['prompts'] = list(self.prompt_log)
+        progress("validate")
+        return self._finish(user_query, result)
+
+    def process_batch(self, questions: Dict[str, str], batch_size: int = 20) -> Dict[str, Dict]:
+        """Execute the pipeline for many questions, with step 1 packed into shared calls.
+
+        Returns one result per question ID; questions that fail carry an "error" message
+        instead of SQL.
+        """
+        self.prompt_log = []
+        results = {}
+        pending = {}
+        for qid, question in questions.items():
+            cached = self._template_result(question)
+            if cached:
+                results[qid] = cached
+            else:
+                pending[qid] = question
+
+        step1 = self.identify_tables_batch(pending, batch_size)
+        for qid, error in step1['errors'].items():
+            results[qid] = {"user_query": pending[qid], "error": error}
+
+        for qid, table_info in step1['results'].items():
+            question = pending[qid]
+            # Earlier questions in the batch may have stored a template this one fits
+            cached = self._template_result(question)
+            if cached:
+                results[qid] = cached
+                continue
+            try:
+                results[qid] = self._finish(question, self._complete(question, table_info))
+            except Exception as e:
+                results[qid] = {"user_query": question, "table_info": table_info, "error": str(e)}
+
+        return {qid: results[qid] for qid in questions}
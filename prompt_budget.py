@@ -0,0 +1,122 @@
+"""
+Prompt token budget
+File: prompt_budget.py
+
+Local token estimation and a budget allocator for prompt assembly. Instructions and
+join information are always sent whole; schema lines are ranked by relevance to the
+question and added until the schema's share of the budget is used up. The assembled
+prompt is measured again before it is sent, since per-line estimates do not add up
+exactly to the rendered text.
+"""
+
+import math
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+WORD_RE = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it of on or show the to what which with all list
+give me get find their there this that those these per each any
+""".split())
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count: about four characters per word piece, one per symbol"""
+    tokens = 0
+    for piece in WORD_RE.findall(text):
+        tokens += math.ceil(len(piece) / 4) if piece[0].isalnum() else 1
+    return tokens
+
+
+def query_terms(text: str) -> Set[str]:
+    """Content words of a question, for lexical relevance"""
+    return {
+        word for word in (w.lower() for w in re.findall(r"[A-Za-z0-9]+", text))
+        if len(word) > 2 and word not in STOPWORDS
+    }
+
+
+def rank_lines(lines: List[Dict], terms: Set[str], priority_columns: Iterable[str] = (),
+               required_columns: Iterable[str] = ()) -> List[float]:
+    """Relevance score per schema line (higher first).
+
+    Required columns (join keys) always rank first, then columns the question names or
+    filters on, then lines sharing words with the question; schema order breaks ties.
+    """
+    priority = set(priority_columns)
+    required = set(required_columns)
+    scores = []
+    for i, line in enumerate(lines):
+        score = 1.0 - i / max(len(lines), 1)
+        if required.intersection(line['columns']):
+            score += 1000
+        if priority.intersection(line['columns']):
+            score += 100
+        score += 10 * len(terms & query_terms(line['text']))
+        scores.append(score)
+    return scores
+
+
+class PromptBudget:
+    """Splits a per-call token budget between instructions, join info and schema columns.
+
+    Instructions and joins are needed for correct SQL, so they are sent whole and the
+    schema gets what is left, but never less than min_schema_share of the budget.
+    """
+
+    def __init__(self, total_tokens: int = 8000, min_schema_share: float = 0.25,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        self.total_tokens = total_tokens
+        self.min_schema_share = min_schema_share
+        # Token counter for whole prompts, e.g. the provider's; defaults to the local estimate
+        self.count_tokens = count_tokens or estimate_tokens
+
+    @property
+    def min_schema_tokens(self) -> int:
+        return int(self.total_tokens * self.min_schema_share)
+
+    def measure(self, text: str) -> int:
+        """Tokens of an assembled prompt"""
+        return self.count_tokens(text)
+
+    def schema_allowance(self, fixed_sections: Dict[str, str]) -> int:
+        """Tokens left for schema lines once the sections that are always sent whole are counted"""
+        fixed = sum(estimate_tokens(text) for text in fixed_sections.values())
+        return max(self.total_tokens - fixed, self.min_schema_tokens)
+
+    @staticmethod
+    def select(lines_by_table: Dict[str, List[Dict]], scores_by_table: Dict[str, List[float]],
+               allowance: int) -> Dict[str, List[Dict]]:
+        """Greedily keep the highest scoring lines that fit, preserving schema order per table"""
+        candidates = []
+        for table, lines in lines_by_table.items():
+            for i, (line, score) in enumerate(zip(lines, scores_by_table[table])):
+                candidates.append((score, table, i, line))
+        candidates.sort(key=lambda c: -c[0])
+
+        # Table headers are always sent
+        used = sum(estimate_tokens(f"\n{table}:\n") for table in lines_by_table)
+        chosen = {table: set() for table in lines_by_table}
+        for score, table, i, line in candidates:
+            cost = estimate_tokens(f"  - {line['text']}\n")
+            if used + cost > allowance and score < 1000:
+                continue  # Required lines (join keys) are kept even over budget
+            chosen[table].add(i)
+            used += cost
+
+        return {
+            table: [line for i, line in enumerate(lines) if i in chosen[table]]
+            for table, lines in lines_by_table.items()
+        }
+
+    def report(self, sections: Dict[str, str], prompt: str) -> Dict:
+        """Estimated size of each prompt section, and the measured size of the prompt sent, against the budget"""
+        tokens = {name: estimate_tokens(text) for name, text in sections.items()}
+        measured = self.measure(prompt)
+        return {
+            "sections": tokens,
+            "estimated_tokens": sum(tokens.values()),
+            "prompt_tokens": measured,
+            "budget": self.total_tokens,
+            "over_budget": measured > self.total_tokens
+        }
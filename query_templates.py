@@ -0,0 +1,204 @@
+"""
+Parameterized query-template cache
+File: query_templates.py
+
+Questions that differ only in a literal ("... with AAA rating" / "... with BBB rating")
+share one SQL template. The literals are pulled out of the question, the remaining
+shape is looked up, and the new literals are bound back into the cached SQL.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from literals import LiteralExtractor, NUMBER_RE, classify_value
+
+
+# Single-quoted SQL strings (with '' escapes) and double-quoted identifiers
+SQL_QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+# Bare numeric literals outside identifiers and aliases (c2, t."x")
+SQL_NUMBER_RE = re.compile(r'(?<![A-Za-z0-9_.])-?\d+(?:\.\d+)?(?![A-Za-z0-9_])')
+# ISO dates; the other date form literals.DATE_RE accepts is d/m/YYYY
+ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+class QueryTemplate:
+    """SQL split into fixed text and literal slots"""
+
+    def __init__(self, parts: List, slot_kinds: List[str], in_string: List[bool], payload: Optional[Dict] = None):
+        self.parts = parts  # str for fixed text, int for a slot index
+        self.slot_kinds = slot_kinds
+        self.in_string = in_string  # whether each slot sits inside a SQL string literal
+        self.payload = payload or {}
+
+    @property
+    def sql(self) -> str:
+        """Template text with :p<N> placeholders, for display"""
+        return ''.join(part if isinstance(part, str) else f":p{part}" for part in self.parts)
+
+    def bind(self, values: List[str]) -> Optional[str]:
+        """Substitute literal values into the template, or None if a value cannot be bound safely"""
+        rendered = []
+        for part in self.parts:
+            if isinstance(part, str):
+                rendered.append(part)
+            elif self.in_string[part]:
+                rendered.append(values[part].replace("'", "''"))
+            elif NUMBER_RE.match(values[part]):
+                rendered.append(values[part])
+            else:
+                return None
+        return ''.join(rendered)
+
+
+class QueryTemplateCache:
+    """LRU cache of SQL templates keyed by question shape"""
+
+    def __init__(self, schemas: Dict, max_entries: int = 512):
+        self.extractor = LiteralExtractor(schemas)
+        self.max_entries = max_entries
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+
+    @staticmethod
+    def _key_kind(literal: Dict) -> str:
+        """Slot kind in the cache key; dates also carry their format, since a value is bound as written"""
+        if literal['kind'] == 'date':
+            return 'date:iso' if ISO_DATE_RE.match(literal['value']) else 'date:dmy'
+        return literal['kind']
+
+    def _key(self, literals: List[Dict], question: str) -> tuple:
+        return (
+            self.extractor.shape(question, literals),
+            tuple(self._key_kind(literal) for literal in literals)
+        )
+
+    def lookup(self, question: str) -> Optional[Dict]:
+        """Return SQL for the question from a cached template, or None on a miss"""
+        literals = self.extractor.extract(question)
+        if not literals:
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+
+        key = self._key(literals, question)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+
+        values = [literal['value'] for literal in literals]
+        sql = template.bind(values) if template is not None else None
+
+        with self._lock:
+            self.stats['hits' if sql is not None else 'misses'] += 1
+        if sql is None:
+            return None
+
+        return {
+            "sql": sql,
+            "template_sql": template.sql,
+            "parameters": {f"p{i}": value for i, value in enumerate(values)},
+            "payload": template.payload
+        }
+
+    def store(self, question: str, sql: str, payload: Optional[Dict] = None) -> bool:
+        """Cache the SQL generated for a question as a template; returns False if it cannot be templated"""
+        literals = self.extractor.extract(question)
+        if not literals:
+            return False
+
+        # Identical literals would make the slot mapping ambiguous
+        values = [literal['value'].lower() for literal in literals]
+        if len(set(values)) != len(values):
+            return False
+
+        template = self._parameterize(sql, literals, payload)
+        if template is None:
+            return False
+
+        with self._lock:
+            self._templates[self._key(literals, question)] = template
+            self._templates.move_to_end(self._key(literals, question))
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+            self.stats['stored'] += 1
+        return True
+
+    @staticmethod
+    def _has_stray_literal(sql: str, segments: List, matches: List, kinds: set) -> bool:
+        """Whether the SQL holds a literal of one of the slot kinds that is not a slot"""
+        def outside_slots(start: int, end: int) -> List[str]:
+            pieces, position = [], start
+            for m_start, m_end, _ in matches:
+                if m_end <= start or m_start >= end:
+                    continue
+                pieces.append(sql[position:m_start])
+                position = m_end
+            pieces.append(sql[position:end])
+            return pieces
+
+        for start, end, is_string in segments:
+            for piece in outside_slots(start, end):
+                if is_string:
+                    if classify_value(piece.replace("''", "'").strip(' %,')) in kinds:
+                        return True
+                elif 'number' in kinds and SQL_NUMBER_RE.search(piece):
+                    return True
+        return False
+
+    @staticmethod
+    def _parameterize(sql: str, literals: List[Dict], payload: Optional[Dict]) -> Optional[QueryTemplate]:
+        """Replace every occurrence of each literal in the SQL by its slot"""
+        # Segments of the SQL that may hold literals: string contents, and bare text for numbers
+        segments = []  # (start, end, in_string)
+        position = 0
+        for match in SQL_QUOTED_RE.finditer(sql):
+            segments.append((position, match.start(), False))
+            if match.group(0).startswith("'"):
+                segments.append((match.start() + 1, match.end() - 1, True))
+            position = match.end()
+        segments.append((position, len(sql), False))
+
+        matches = []  # (start, end, slot)
+        placements = [set() for _ in literals]  # in_string flags seen for each slot
+        for slot, literal in enumerate(literals):
+            pattern = re.compile(
+                r'(?<![A-Za-z0-9])' + re.escape(literal['value']) + r'(?![A-Za-z0-9])',
+                re.IGNORECASE
+            )
+            found = False
+            for start, end, is_string in segments:
+                if not is_string and literal['kind'] != 'number':
+                    continue
+                for match in pattern.finditer(sql, start, end):
+                    matches.append((match.start(), match.end(), slot))
+                    placements[slot].add(is_string)
+                    found = True
+            if not found:
+                # The literal did not make it into the SQL verbatim - not safe to template
+                return None
+            if len(placements[slot]) > 1:
+                # Used both quoted and bare - cannot be bound consistently
+                return None
+        in_string = [True in placement for placement in placements]
+
+        matches.sort()
+        # Other literals of a slot's kind were likely derived from the question's literal
+        # ("AAA or better" -> IN ('AAA', 'AA+')) and would not follow a new value
+        if QueryTemplateCache._has_stray_literal(sql, segments, matches, {lit['kind'] for lit in literals}):
+            return None
+
+        parts = []
+        position = 0
+        for start, end, slot in matches:
+            if start < position:
+                return None  # Overlapping literals
+            parts.append(sql[position:start])
+            parts.append(slot)
+            position = end
+        parts.append(sql[position:])
+
+        return QueryTemplate(parts, [literal['kind'] for literal in literals], in_string, payload)
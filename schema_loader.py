@@ -0,0 +1,65 @@
+"""
+Schema workbook loader
+File: schema_loader.py
+
+Reads table schemas and join relationships from AI_SampleDataStruture.xlsx.
+pandas is imported on first use so importing this module stays cheap.
+"""
+
+
+def read_schema_workbook(file_path: str) -> tuple:
+    """Load schemas and relationships from the Excel workbook.
+
+    Raises on a missing file or sheet; callers decide how to report it.
+    """
+    import pandas as pd  # Data stack loads on first use
+
+    # Read all sheets
+    counterparty_df = pd.read_excel(file_path, sheet_name="Counterparty New")
+    trade_df = pd.read_excel(file_path, sheet_name="Trade New")
+    concentration_df = pd.read_excel(file_path, sheet_name="Concentration New")
+    joins_df = pd.read_excel(file_path, sheet_name="Joins")
+
+    # Build schemas dictionary
+    schemas = {
+        "Counterparty": [
+            {
+                "name": row["Column Name"],
+                "description": row["Description"],
+                "example": row.get("Example Value", "")
+            }
+            for _, row in counterparty_df.iterrows()
+        ],
+        "Trade": [
+            {
+                "name": row["Column Name"],
+                "description": row["Description"],
+                "example": row.get("Example Value", "")
+            }
+            for _, row in trade_df.iterrows()
+        ],
+        "Concentration": [
+            {
+                "name": row["Column Name"],
+                "description": row["Description"],
+                "example": row.get("Example Value", "")
+            }
+            for _, row in concentration_df.iterrows()
+        ]
+    }
+
+    # Build relationships list
+    relationships = []
+    for _, row in joins_df.iterrows():
+        rel = {
+            "table1": row["Table1"],
+            "table2": row["Table2"],
+            "join_key_1": row["Join Key Table1"],
+            "join_key_2": row["Join Key Table2"],
+            "join_type": "INNER",
+            "context": row.get("Context", "default") if pd.notna(row.get("Context")) else "default",
+            "description": f"Join {row['Table1']} with {row['Table2']}"
+        }
+        relationships.append(rel)
+
+    return schemas, relationships
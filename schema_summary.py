@@ -0,0 +1,181 @@
+"""
+Column-family schema summarizer
+File: schema_summary.py
+
+Detects families of columns whose names differ in a single token, such as
+"Stressed MPE - Scenario1..10" or "# of IR/FX/CDS/... Trades", and renders each
+family as one prompt line ("Stressed MPE - Scenario{1..10}"). Families expand back
+to the exact column names, which is how generated SQL is validated.
+"""
+
+import re
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+# Tokens keep their separators so joining them gives back the exact name
+TOKEN_RE = re.compile(r'\d+|[A-Za-z]+|\s+|[^\sA-Za-z\d]+')
+QUOTED_IDENTIFIER_RE = re.compile(r'"((?:[^"]|"")+)"')
+
+
+class ColumnFamily:
+    """Columns sharing every name token except one"""
+
+    def __init__(self, tokens: List[str], position: int, members: List[str], variants: List[str]):
+        self.tokens = tokens  # template tokens; tokens[position] is the varying slot
+        self.position = position
+        self.members = members  # exact column names, in schema order
+        self.variants = variants  # the varying token of each member
+
+    @property
+    def variant_text(self) -> str:
+        """Compact variant list: {1..10} for a contiguous number range, else {IR|FX|...}"""
+        if all(v.isdigit() for v in self.variants):
+            numbers = sorted(int(v) for v in self.variants)
+            if numbers == list(range(numbers[0], numbers[-1] + 1)) and len(numbers) > 2:
+                return f"{{{numbers[0]}..{numbers[-1]}}}"
+        return "{" + "|".join(self.variants) + "}"
+
+    @property
+    def pattern(self) -> str:
+        """Family name as shown in prompts"""
+        tokens = list(self.tokens)
+        tokens[self.position] = self.variant_text
+        return ''.join(tokens)
+
+    def expand(self) -> List[str]:
+        return list(self.members)
+
+
+class SchemaSummary:
+    """Per-table column families and compact prompt lines"""
+
+    def __init__(self, schemas: Dict, min_family_size: int = 3, min_description_similarity: float = 0.9):
+        self.min_family_size = min_family_size
+        self.min_description_similarity = min_description_similarity
+        self.families = {}  # table -> [ColumnFamily]
+        self._family_of = {}  # (table, column) -> ColumnFamily
+        self._descriptions = {}  # (table, column) -> description
+        self._columns = {}  # table -> set of column names
+
+        for table_name, columns in schemas.items():
+            names = [col['name'] for col in columns]
+            self._columns[table_name] = set(names)
+            for col in columns:
+                self._descriptions[(table_name, col['name'])] = col['description']
+            self.families[table_name] = self._detect(table_name, names)
+            for family in self.families[table_name]:
+                for member in family.members:
+                    self._family_of[(table_name, member)] = family
+
+    def _detect(self, table_name: str, names: List[str]) -> List[ColumnFamily]:
+        """Group names that differ in exactly one word or number token and share a description"""
+        groups = {}  # (length, position, numeric variant, template) -> [(name, variant)]
+        for name in names:
+            tokens = TOKEN_RE.findall(str(name))
+            for position, token in enumerate(tokens):
+                if not token.isalnum():
+                    continue
+                template = tuple(tokens[:position]) + (None,) + tuple(tokens[position + 1:])
+                # Needs at least one fixed word, and variants of one kind (all numbers or all words)
+                if not any(t.isalnum() for t in template if t is not None):
+                    continue
+                kind = token.isdigit()
+                groups.setdefault((len(tokens), position, kind, template), []).append((name, token))
+
+        # Largest families first; each column joins at most one family
+        assigned = set()
+        families = []
+        for (length, position, kind, template), members in sorted(groups.items(), key=lambda item: -len(item[1])):
+            members = [(name, variant) for name, variant in members if name not in assigned]
+            if len(members) < self.min_family_size:
+                continue
+            family = ColumnFamily(
+                list(t if t is not None else '' for t in template),
+                position,
+                [name for name, _ in members],
+                [variant for _, variant in members]
+            )
+            # "Counterparty ID" and "Counterparty Name" differ in one token but are not one family
+            if not self._descriptions_match(table_name, family):
+                continue
+            assigned.update(family.members)
+            families.append(family)
+
+        order = {name: i for i, name in enumerate(names)}
+        families.sort(key=lambda family: order[family.members[0]])
+        return families
+
+    def _templated_descriptions(self, table_name: str, family: ColumnFamily) -> List[str]:
+        """Member descriptions with each member's variant replaced by a marker"""
+        return [
+            re.sub(r'(?<![A-Za-z0-9])' + re.escape(variant) + r'(?![A-Za-z0-9])', '\0',
+                   str(self._descriptions.get((table_name, member), '')))
+            for member, variant in zip(family.members, family.variants)
+        ]
+
+    def _descriptions_match(self, table_name: str, family: ColumnFamily) -> bool:
+        templated = self._templated_descriptions(table_name, family)
+        return all(
+            SequenceMatcher(None, templated[0], other).ratio() >= self.min_description_similarity
+            for other in templated[1:]
+        )
+
+    def _family_description(self, table_name: str, family: ColumnFamily) -> str:
+        # Descriptions that only differ by the variant collapse to one templated description
+        return self._templated_descriptions(table_name, family)[0].replace('\0', family.variant_text)
+
+    def lines(self, table_name: str, columns) -> List[Dict]:
+        """Prompt lines for a table's columns, one per single column or per family.
+
+        Each line is a dict with "text" and "columns" (the exact names it stands for).
+        """
+        emitted = set()
+        lines = []
+        for col in columns:
+            family = self._family_of.get((table_name, col['name']))
+            if family is None:
+                lines.append({"text": f"{col['name']}: {col['description']}", "columns": [col['name']]})
+            elif id(family) not in emitted:
+                emitted.add(id(family))
+                description = self._family_description(table_name, family)
+                lines.append({
+                    "text": f"{family.pattern}: {description} ({len(family.members)} columns)",
+                    "columns": family.expand()
+                })
+        return lines
+
+    def expand(self, table_name: str, name: str) -> List[str]:
+        """Exact column names for a column or family pattern of a table"""
+        if name in self._columns.get(table_name, ()):
+            return [name]
+        for family in self.families.get(table_name, []):
+            if family.pattern == name:
+                return family.expand()
+        return []
+
+    def find_family(self, name: str) -> Optional[ColumnFamily]:
+        """Family whose rendered pattern is `name`, in any table"""
+        for families in self.families.values():
+            for family in families:
+                if family.pattern == name:
+                    return family
+        return None
+
+    def unknown_identifiers(self, sql: str) -> List[Dict]:
+        """Double-quoted identifiers in SQL that are not a table or exact column name"""
+        known = set(self._columns)
+        for names in self._columns.values():
+            known.update(names)
+
+        unknown = []
+        for match in QUOTED_IDENTIFIER_RE.finditer(sql):
+            identifier = match.group(1).replace('""', '"')
+            if identifier in known or any(u['identifier'] == identifier for u in unknown):
+                continue
+            family = self.find_family(identifier)
+            unknown.append({
+                "identifier": identifier,
+                # A family pattern copied verbatim means the model did not pick a member
+                "family_members": family.expand() if family else []
+            })
+        return unknown
@@ -0,0 +1,161 @@
+"""
+Deterministic SQL assembly
+File: sql_builder.py
+
+Builds the FROM/JOIN part of a query from the join plan, with quoted identifiers and
+short table aliases, and combines it with the clauses the LLM fills in (SELECT list,
+WHERE, GROUP BY, HAVING, ORDER BY) returned as structured JSON. Join conditions are
+never written by the model, so they cannot be incomplete.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from sql_preview import quote_identifier
+
+# Structured output the LLM returns in skeleton mode (Gemini response_schema format)
+SQL_PARTS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "select": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "where": {"type": "STRING", "nullable": True},
+        "group_by": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "having": {"type": "STRING", "nullable": True},
+        "order_by": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["select"]
+}
+
+# Words an alias must not be: DuckDB's reserved keywords plus those of standard SQL
+# and the join syntax (is, by, join, left, ...)
+SQL_KEYWORDS = frozenset("""
+    all analyse analyze and any array as asc asymmetric both case cast check collate column
+    constraint create default deferrable desc describe distinct do else end except false fetch
+    for foreign from group having in initially intersect into lambda lateral leading limit not
+    null offset on only or order pivot placing primary qualify references returning select show
+    some summarize symmetric table then to trailing true union unique unpivot using variadic when
+    where window with
+    anti asof at between by cross exists full ilike inner is isnull join left like natural
+    notnull outer over positional right semi set similar top values
+""".split())
+
+# Clause text that would escape the fixed skeleton. Quoted strings and identifiers are
+# masked first; FROM/JOIN/UNION are only refused outside parentheses, since
+# EXTRACT(YEAR FROM d), TRIM(x FROM y) and IN (SELECT ... FROM ...) stay in their clause.
+QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+FORBIDDEN_ANYWHERE_RE = re.compile(r';|--|/\*|\b(?:INSERT|UPDATE|DELETE|DROP)\b', re.IGNORECASE)
+TOP_LEVEL_TOKEN_RE = re.compile(r'[()]|\b(?:FROM|JOIN|UNION)\b', re.IGNORECASE)
+
+
+def table_aliases(tables: List[str]) -> Dict[str, str]:
+    """Short lowercase alias per table from its initials: Counterparty -> c, Trade -> t, a clash -> c2.
+
+    Initials that are a SQL keyword get the clash suffix too (Order Note -> on2), and
+    initials that do not start with a letter get a 't' prefix (2024 Trades -> t2t).
+    """
+    aliases = {}
+    used = set()
+    for table in tables:
+        words = re.findall(r'[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])', table) or [table]
+        base = ''.join(word[0] for word in words).lower() or 't'
+        if not re.match(r'[a-z]', base):
+            base = 't' + base
+        alias, number = base, 2
+        while alias in used or alias in SQL_KEYWORDS:
+            alias, number = f"{base}{number}", number + 1
+        aliases[table] = alias
+        used.add(alias)
+    return aliases
+
+
+def build_from_clause(join_info: Dict, aliases: Dict[str, str]) -> Optional[str]:
+    """FROM/JOIN clause following the join plan, or None if a table has no join to the others.
+
+    Tables are joined in the statistics-based join order when there is one, else in
+    the order of all_tables_needed; every ON clause has all column pairs of its join.
+    """
+    plan = join_info.get('join_plan')
+    order = plan['join_order'] if plan else join_info['all_tables_needed']
+
+    def ref(table: str, column: str) -> str:
+        return f"{aliases[table]}.{quote_identifier(column)}"
+
+    lines = [f"FROM {quote_identifier(order[0])} AS {aliases[order[0]]}"]
+    placed = {order[0]}
+    for table in order[1:]:
+        joins = [j for j in join_info['joins']
+                 if table in (j['from_table'], j['to_table'])
+                 and (j['to_table'] if j['from_table'] == table else j['from_table']) in placed]
+        if not joins:
+            return None
+        conditions = [
+            f"{ref(join['from_table'], src)} = {ref(join['to_table'], tgt)}"
+            for join in joins
+            for src, tgt in zip(join['source_columns'], join['target_columns'])
+        ]
+        join_type = joins[0]['join_type'].upper()
+        lines.append(f"{join_type} JOIN {quote_identifier(table)} AS {aliases[table]}")
+        lines.append(f"  ON {' AND '.join(conditions)}")
+        placed.add(table)
+    return "\n".join(lines)
+
+
+def _escapes_clause(text: str) -> bool:
+    """Whether clause text would add tables, statements or comments to the skeleton"""
+    masked = QUOTED_RE.sub(' 0 ', text)
+    if "'" in masked or '"' in masked:
+        return True  # Unterminated quote
+    if FORBIDDEN_ANYWHERE_RE.search(masked):
+        return True
+    depth = 0
+    for token in TOP_LEVEL_TOKEN_RE.finditer(masked):
+        if token.group() == '(':
+            depth += 1
+        elif token.group() == ')':
+            depth -= 1
+            if depth < 0:
+                return True  # Closes a parenthesis the clause did not open
+        elif depth == 0:
+            return True
+    return depth != 0
+
+
+def _clause_list(value, field: str) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"'{field}' must be a list of strings")
+    return [v.strip() for v in value if v.strip()]
+
+
+def assemble_sql(from_clause: str, parts: Dict) -> str:
+    """Full query from the fixed FROM/JOIN clause and the LLM's clauses.
+
+    Raises ValueError when the parts are malformed or try to add tables or statements.
+    """
+    if not isinstance(parts, dict):
+        raise ValueError("SQL parts must be a JSON object")
+    select = _clause_list(parts.get('select'), 'select')
+    if not select:
+        raise ValueError("SQL parts have an empty 'select'")
+    group_by = _clause_list(parts.get('group_by'), 'group_by')
+    order_by = _clause_list(parts.get('order_by'), 'order_by')
+    where = (parts.get('where') or '').strip()
+    having = (parts.get('having') or '').strip()
+
+    for text in select + group_by + order_by + [where, having]:
+        if _escapes_clause(text):
+            raise ValueError(f"SQL part outside the SELECT/WHERE/GROUP BY/ORDER BY clauses: {text}")
+
+    sql = "SELECT " + ",\n       ".join(select) + "\n" + from_clause
+    if where:
+        sql += f"\nWHERE {where}"
+    if group_by:
+        sql += "\nGROUP BY " + ", ".join(group_by)
+    if having:
+        sql += f"\nHAVING {having}"
+    if order_by:
+        sql += "\nORDER BY " + ", ".join(order_by)
+    return sql
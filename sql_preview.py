@@ -0,0 +1,173 @@
+"""
+SQL preview over local sample data
+File: sql_preview.py
+
+Runs generated SQL in an embedded DuckDB database with a row and time limit. Each
+table of the knowledge graph is a view over sample files in the sample directory:
+<Table>.parquet, a <Table>/ directory of Parquet files, or <Table>.arrow (Arrow IPC,
+memory-mapped). Tables without samples, or whose sample files cannot be read, are
+created empty with types inferred from the schema's example values, so the SQL is
+still bound and checked.
+
+The SQL comes from the model, so only a single SELECT is run, and once the views are
+set up the database cannot touch files outside the sample directory (no read_csv of
+local files, no COPY ... TO) nor change that configuration.
+
+duckdb and pyarrow are optional and imported on first use.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from knowledge_graph import TableKnowledgeGraph
+from literals import classify_value
+
+SAMPLE_DATA_DIR = "sample_data"
+
+# Value kind of the example -> column type for empty tables
+SQL_TYPES = {
+    'date': 'DATE',
+    'number': 'DOUBLE',
+}
+
+
+class PreviewError(Exception):
+    """The preview query failed, timed out, or the engine is not installed"""
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def column_types(kg: TableKnowledgeGraph) -> Dict[str, Dict[str, str]]:
+    """Column type per table from example values; both sides of a join key share one type"""
+    types = {
+        table: {col['name']: SQL_TYPES.get(classify_value(col['example']), 'VARCHAR') for col in columns}
+        for table, columns in kg.schemas.items()
+    }
+    for source, target, data in kg.graph.edges(data=True):
+        for src, tgt in zip(data['source_columns'], data['target_columns']):
+            if src in types.get(source, {}) and tgt in types.get(target, {}) \
+                    and types[source][src] != types[target][tgt]:
+                types[source][src] = types[target][tgt] = 'VARCHAR'
+    return types
+
+
+class SqlPreview:
+    """Embedded DuckDB database over the sample files of every graph table"""
+
+    def __init__(self, kg: TableKnowledgeGraph, sample_dir: str = SAMPLE_DATA_DIR,
+                 row_limit: int = 100, timeout_seconds: float = 10.0):
+        try:
+            import duckdb  # Optional dependency, loaded on first use
+        except ImportError as e:
+            raise PreviewError("SQL preview needs duckdb: pip install duckdb pyarrow") from e
+
+        self.row_limit = row_limit
+        self.timeout_seconds = timeout_seconds
+        self.sample_dir = sample_dir
+        self.sources = {}  # table -> sample file, directory, or None for an empty table
+        self.unreadable = {}  # table -> error for sample files that could not be read
+        self._arrow_tables = {}  # table -> memory-mapped Arrow table, registered on each cursor
+
+        try:
+            self._con = duckdb.connect(":memory:")
+            types = column_types(kg)
+            for table in kg.schemas:
+                try:
+                    self.sources[table] = self._attach(table, types[table])
+                except Exception as e:
+                    # Corrupt or truncated sample: keep the table, empty, so the SQL still binds
+                    self.unreadable[table] = str(e)
+                    self._arrow_tables.pop(table, None)
+                    self.sources[table] = self._attach_empty(table, types[table])
+            self._lock_down()
+        except duckdb.Error as e:
+            raise PreviewError(str(e)) from e
+
+    def _lock_down(self):
+        """Allow file access only to the sample directory, then freeze the configuration"""
+        literal = os.path.join(os.path.abspath(self.sample_dir), "").replace("'", "''")
+        try:
+            self._con.execute(f"SET allowed_directories = ['{literal}']")
+        except Exception as e:
+            raise PreviewError("SQL preview needs duckdb 1.2 or later: pip install -U duckdb") from e
+        self._con.execute("SET enable_external_access = false")
+        self._con.execute("SET lock_configuration = true")
+
+    def _attach(self, table: str, types: Dict[str, str]) -> Optional[str]:
+        """Create the view or empty table for one graph table; returns the sample source used"""
+        name = quote_identifier(table)
+        base = os.path.join(self.sample_dir, table)
+
+        if os.path.isfile(base + ".parquet"):
+            path = base + ".parquet"
+        elif os.path.isdir(base):
+            path = os.path.join(base, "*.parquet")
+        elif os.path.isfile(base + ".arrow"):
+            import pyarrow as pa
+            # Zero-copy: DuckDB scans the memory-mapped Arrow buffers directly
+            self._arrow_tables[table] = pa.ipc.open_file(pa.memory_map(base + ".arrow")).read_all()
+            return base + ".arrow"
+        else:
+            return self._attach_empty(table, types)
+
+        literal = os.path.abspath(path).replace("'", "''")
+        self._con.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{literal}')")
+        return path
+
+    def _attach_empty(self, table: str, types: Dict[str, str]) -> None:
+        """Create an empty table with the schema's columns"""
+        columns = ", ".join(f"{quote_identifier(col)} {sql_type}" for col, sql_type in types.items())
+        self._con.execute(f"CREATE TABLE {quote_identifier(table)} ({columns})")
+
+    def _single_select(self, sql_query: str) -> str:
+        """The query text if it is exactly one SELECT statement; raises PreviewError otherwise"""
+        import duckdb
+
+        try:
+            statements = self._con.extract_statements(sql_query)
+        except duckdb.Error as e:
+            raise PreviewError(str(e)) from e
+        if len(statements) != 1:
+            raise PreviewError(f"Preview runs a single statement, got {len(statements)}")
+        if statements[0].type != duckdb.StatementType.SELECT:
+            raise PreviewError(f"Preview runs SELECT statements only, got {statements[0].type.name}")
+        return statements[0].query.strip().rstrip(';')
+
+    def run(self, sql_query: str, row_limit: Optional[int] = None) -> Dict:
+        """Run a query with the row and time limit.
+
+        Returns {"table": pyarrow.Table, "rows", "truncated", "seconds"}; the Arrow table is
+        handed to the UI as-is.
+        """
+        row_limit = row_limit or self.row_limit
+        sql_query = self._single_select(sql_query)
+        # One row past the limit tells whether the result was cut off
+        limited = f"SELECT * FROM ({sql_query}) AS preview LIMIT {row_limit + 1}"
+
+        # Cursors are independent connections to the same database, safe to use per thread
+        cursor = self._con.cursor()
+        for table, arrow_table in self._arrow_tables.items():
+            cursor.register(table, arrow_table)
+        timer = threading.Timer(self.timeout_seconds, cursor.interrupt)
+        start = time.perf_counter()
+        timer.start()
+        try:
+            table = cursor.execute(limited).fetch_arrow_table()
+        except Exception as e:
+            if time.perf_counter() - start >= self.timeout_seconds:
+                raise PreviewError(f"Preview timed out after {self.timeout_seconds:g}s") from e
+            raise PreviewError(str(e)) from e
+        finally:
+            timer.cancel()
+            cursor.close()
+
+        return {
+            "table": table.slice(0, row_limit),
+            "rows": min(table.num_rows, row_limit),
+            "truncated": table.num_rows > row_limit,
+            "seconds": time.perf_counter() - start
+        }
@@ -0,0 +1,96 @@
+"""
+Table statistics
+File: table_stats.py
+
+Row counts and join-key cardinalities used to order joins. They come from an
+optional "Stats" sheet of the schema workbook or, failing that, are computed from
+the sample files with DuckDB. Without either the graph carries no statistics and
+joins are left in the order the knowledge graph lists them.
+
+Statistics layout: {table: {"row_count": n, "distinct": {"Col A + Col B": n}}};
+composite keys are written the way the Joins sheet writes them.
+"""
+
+import os
+from typing import Dict, List
+
+from knowledge_graph import TableKnowledgeGraph
+
+STATS_SHEET = "Stats"
+
+
+def column_key(columns: List[str]) -> str:
+    """Key of a (composite) column set in the "distinct" mapping"""
+    return " + ".join(col.strip() for col in columns)
+
+
+def read_stats_sheet(file_path: str, sheet_name: str = STATS_SHEET) -> Dict[str, Dict]:
+    """Statistics from the workbook's stats sheet.
+
+    Columns: Table, Column, Row Count, Distinct Count. A row with an empty Column
+    gives the table's row count; composite keys are written "Col A + Col B".
+    Raises when the sheet is missing.
+    """
+    import pandas as pd  # Data stack loads on first use
+
+    stats_df = pd.read_excel(file_path, sheet_name=sheet_name)
+    stats = {}
+    for _, row in stats_df.iterrows():
+        table = stats.setdefault(row["Table"], {"row_count": None, "distinct": {}})
+        column = row.get("Column")
+        if pd.isna(column) or not str(column).strip():
+            if pd.notna(row.get("Row Count")):
+                table["row_count"] = int(row["Row Count"])
+        elif pd.notna(row.get("Distinct Count")):
+            table["distinct"][column_key(str(column).split('+'))] = int(row["Distinct Count"])
+    return stats
+
+
+def compute_sample_stats(kg: TableKnowledgeGraph, sample_dir: str) -> Dict[str, Dict]:
+    """Row counts and join-key distinct counts of the tables that have sample files.
+
+    Distinct counts are exact: samples are small, and an estimate off by a third
+    would show up as fan-out on a unique key. Rows with a NULL in the key are not
+    counted, as they never join.
+    """
+    from sql_preview import SqlPreview, quote_identifier
+
+    preview = SqlPreview(kg, sample_dir, timeout_seconds=300)
+    join_keys = {}  # table -> column sets used in its joins
+    for source, target, data in kg.graph.edges(data=True):
+        join_keys.setdefault(source, set()).add(tuple(data['source_columns']))
+        join_keys.setdefault(target, set()).add(tuple(data['target_columns']))
+
+    stats = {}
+    for table, source in preview.sources.items():
+        if source is None:
+            continue  # No sample files: an empty table says nothing about the real one
+        keys = sorted(join_keys.get(table, ()))
+        counts = ["COUNT(*)"]
+        for cols in keys:
+            quoted = [quote_identifier(col) for col in cols]
+            not_null = " AND ".join(f"{col} IS NOT NULL" for col in quoted)
+            counts.append(f"COUNT(DISTINCT ({', '.join(quoted)})) FILTER (WHERE {not_null})")
+        result = preview.run(f"SELECT {', '.join(counts)} FROM {quote_identifier(table)}")['table']
+        values = [column[0].as_py() for column in result.columns]
+        stats[table] = {
+            "row_count": int(values[0]),
+            "distinct": {column_key(cols): int(n) for cols, n in zip(keys, values[1:])}
+        }
+    return stats
+
+
+def load_table_stats(kg: TableKnowledgeGraph, file_path: str, sample_dir: str) -> Dict[str, Dict]:
+    """Statistics from the stats sheet, else from the sample files, else none ({})"""
+    try:
+        return read_stats_sheet(file_path)
+    except (FileNotFoundError, ValueError, KeyError):
+        pass  # No stats sheet, or not in the expected layout
+
+    if os.path.isdir(sample_dir):
+        from sql_preview import PreviewError
+        try:
+            return compute_sample_stats(kg, sample_dir)
+        except PreviewError:
+            pass  # DuckDB not installed, or the samples do not match the schema
+    return {}
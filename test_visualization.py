@@ -2,14 +2,17 @@
 Quick test to verify knowledge graph visualization works
 """
 
-import pandas as pd
 import networkx as nx
-from app import TableKnowledgeGraph, load_excel_data
-import plotly.graph_objects as go
+from knowledge_graph import TableKnowledgeGraph
+from schema_loader import read_schema_workbook
 
 # Load data
 print("Loading data from Excel...")
-schemas, relationships = load_excel_data("AI_SampleDataStruture.xlsx")
+try:
+    schemas, relationships = read_schema_workbook("AI_SampleDataStruture.xlsx")
+except Exception as e:
+    print(f"Error loading Excel file: {e}")
+    schemas, relationships = None, None
 
 if schemas and relationships:
     print(f"✓ Loaded {len(schemas)} tables")
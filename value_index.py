@@ -0,0 +1,60 @@
+"""
+Value-to-column inverted index
+File: value_index.py
+
+Indexes the schema's "Example Value" metadata two ways: by the normalized example
+value itself and by its value pattern (rating code, ISO country code, ID, date...).
+Literals in a question are resolved against it so the prompts can name the exact
+column a value belongs to instead of leaving the model to guess.
+"""
+
+from typing import Dict, List
+
+from literals import LiteralExtractor, classify_value, normalize_value
+
+
+# Pattern kinds too common to point at a specific column (every measure is a number)
+AMBIGUOUS_KINDS = frozenset(['number', 'flag', 'text'])
+
+
+class ValueColumnIndex:
+    """Maps literal values and value patterns to the columns that hold them"""
+
+    def __init__(self, schemas: Dict, max_pattern_columns: int = 5):
+        self.by_value = {}  # normalized example value -> [(table, column)]
+        self.by_kind = {}  # value kind -> [(table, column)]
+        self.max_pattern_columns = max_pattern_columns
+
+        for table_name, columns in schemas.items():
+            for col in columns:
+                example = col.get('example')
+                kind = classify_value(example)
+                if kind is None:
+                    continue
+                location = (table_name, col['name'])
+                self.by_value.setdefault(normalize_value(example), []).append(location)
+                if kind not in AMBIGUOUS_KINDS:
+                    self.by_kind.setdefault(kind, []).append(location)
+
+        self.extractor = LiteralExtractor(schemas)
+
+    def columns_for(self, value, kind: str = None) -> List[Dict]:
+        """Columns that hold a value: exact example matches first, else columns sharing its pattern"""
+        exact = self.by_value.get(normalize_value(value))
+        if exact:
+            return [{"table": t, "column": c, "match": "exact"} for t, c in exact]
+
+        kind = kind or classify_value(value)
+        candidates = self.by_kind.get(kind, [])
+        if not candidates or len(candidates) > self.max_pattern_columns:
+            return []
+        return [{"table": t, "column": c, "match": "pattern"} for t, c in candidates]
+
+    def resolve(self, question: str) -> List[Dict]:
+        """Resolve the literals in a question to candidate columns"""
+        resolved = []
+        for literal in self.extractor.extract(question):
+            columns = self.columns_for(literal['value'], literal['kind'])
+            if columns:
+                resolved.append({**literal, "columns": columns})
+        return resolved
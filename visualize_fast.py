@@ -0,0 +1,401 @@
+"""
+Fast Knowledge Graph Visualization
+File: visualize_fast.py
+
+Renderer behind `python visualize_kg.py --fast`, for large catalogs: edges are drawn
+as one batched trace/collection per join context instead of one object per edge,
+and the HTML and PNG are rendered in parallel worker processes.
+
+Usage: python visualize_kg.py --fast [--input knowledge_graph_data.json]
+                              [--formats html,png] [--dpi 300]
+
+--input also accepts a columnar export directory (graph_export.save_graph_tables).
+"""
+import argparse
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import networkx as nx
+
+DEFAULT_INPUT = "knowledge_graph_data.json"
+HTML_OUTPUT = "knowledge_graph_visualization.html"
+PNG_OUTPUT = "knowledge_graph_static.png"
+OUTPUT_FORMATS = ("html", "png")
+
+# Edge styling by join context: (Plotly color, matplotlib color, line width, legend label)
+DEFAULT_STYLE = ('#888', 'gray', 2, 'Default')
+CONTEXT_STYLES = {
+    'For country level data': ('#4CAF50', '#4CAF50', 3, 'Country Level'),
+    'For sector level data': ('#2196F3', '#2196F3', 3, 'Sector Level'),
+    'For rating level data': ('#FF9800', '#FF9800', 3, 'Rating Level'),
+}
+
+
+# ============================================
+# LOADING
+# ============================================
+
+def load_graph(input_path: str) -> nx.MultiDiGraph:
+    """Graph from the JSON export, or from a columnar export directory"""
+    if Path(input_path).is_dir():
+        from graph_export import load_graph_tables
+        return load_graph_tables(input_path).graph
+
+    # Load the knowledge graph data
+    with open(input_path, 'r') as f:
+        kg_data = json.load(f)
+
+    # Build NetworkX graph
+    G = nx.MultiDiGraph()
+
+    # Add nodes
+    for node in kg_data['nodes']:
+        G.add_node(
+            node['table_name'],
+            columns=node['columns'],
+            column_count=node['column_count']
+        )
+
+    # Add edges
+    for edge in kg_data['edges']:
+        G.add_edge(
+            edge['from'],
+            edge['to'],
+            source_columns=edge['source_columns'],
+            target_columns=edge['target_columns'],
+            join_type=edge['join_type'],
+            context=edge['context'],
+            description=edge['description']
+        )
+
+    return G
+
+
+def print_summary(G: nx.MultiDiGraph, max_items: int = None):
+    """Tables and relationships of the graph; at most max_items of each when set"""
+    for node in list(G.nodes())[:max_items]:
+        columns = list(G.nodes[node].get('columns', []))
+        print(f"\nTable: {node}")
+        print(f"  Columns: {len(columns)}")
+        print(f"  Sample: {', '.join(columns[:5])}...")
+
+    print("\n" + "="*60)
+    print("RELATIONSHIPS")
+    print("="*60)
+
+    for source, target, edge in list(G.edges(data=True))[:max_items]:
+        join_condition = " AND ".join([
+            f"{source}.{src} = {target}.{tgt}"
+            for src, tgt in zip(edge['source_columns'], edge['target_columns'])
+        ])
+
+        print(f"\n{source} -> {target}")
+        print(f"  Context: {edge['context']}")
+        print(f"  Join Type: {edge['join_type']}")
+        print(f"  Condition: {join_condition}")
+
+    if max_items is not None and max(G.number_of_nodes(), G.number_of_edges()) > max_items:
+        print(f"\n... showing the first {max_items} tables and relationships")
+
+
+# ============================================
+# INTERACTIVE (PLOTLY) VISUALIZATION
+# ============================================
+
+def _edge_hover(source: str, target: str, edge_data: dict) -> str:
+    join_info = f"<b>{source} → {target}</b><br>"
+    join_info += f"<br><b>Join Keys:</b><br>"
+    for src, tgt in zip(edge_data['source_columns'], edge_data['target_columns']):
+        join_info += f"  {source}.{src} = {target}.{tgt}<br>"
+    join_info += f"<br><b>Type:</b> {edge_data['join_type']}<br>"
+    join_info += f"<b>Context:</b> {edge_data['context']}"
+    return join_info
+
+
+def _batched_edge_traces(G: nx.MultiDiGraph, pos: dict) -> list:
+    """One line trace and one arrowhead marker trace per context instead of per edge"""
+    import plotly.graph_objects as go
+
+    groups = {}  # style -> lines, arrowheads and hover texts of its edges
+    for source, target, key, edge_data in G.edges(keys=True, data=True):
+        x0, y0 = pos[source]
+        x1, y1 = pos[target]
+        group = groups.setdefault(CONTEXT_STYLES.get(edge_data.get('context'), DEFAULT_STYLE),
+                                  {"x": [], "y": [], "text": [], "ax": [], "ay": [], "angle": [], "hover": []})
+        hover = _edge_hover(source, target, edge_data)
+        group["x"] += [x0, x1, None]
+        group["y"] += [y0, y1, None]
+        group["text"] += [hover, hover, None]
+        # Arrowhead 80% along the line; marker angles are clockwise from "up"
+        group["ax"].append(x0 + 0.8 * (x1 - x0))
+        group["ay"].append(y0 + 0.8 * (y1 - y0))
+        group["angle"].append(90 - math.degrees(math.atan2(y1 - y0, x1 - x0)))
+        group["hover"].append(hover)
+
+    traces = []
+    for (color, _, width, _), group in groups.items():
+        traces.append(go.Scatter(
+            x=group["x"], y=group["y"], mode='lines',
+            line=dict(width=width, color=color),
+            hoverinfo='text', text=group["text"], showlegend=False
+        ))
+        traces.append(go.Scatter(
+            x=group["ax"], y=group["ay"], mode='markers',
+            marker=dict(symbol='arrow', size=12, angle=group["angle"], color=color, opacity=0.7),
+            hoverinfo='text', text=group["hover"], showlegend=False
+        ))
+    return traces
+
+
+def _node_trace(G: nx.MultiDiGraph, pos: dict):
+    import plotly.graph_objects as go
+
+    node_x = []
+    node_y = []
+    node_text = []
+    node_hover = []
+    node_colors = []
+    node_sizes = []
+
+    for node in G.nodes():
+        x, y = pos[node]
+        node_x.append(x)
+        node_y.append(y)
+        node_text.append(node)
+
+        # Build hover text
+        columns = list(G.nodes[node].get('columns', []))
+        node_info = f"<b>{node}</b><br><br>"
+        node_info += f"<b>Total Columns:</b> {len(columns)}<br><br>"
+        node_info += f"<b>Columns:</b><br>"
+
+        # Show first 10 columns in hover
+        for col in columns[:10]:
+            node_info += f"  • {col}<br>"
+        if len(columns) > 10:
+            node_info += f"  • ... and {len(columns) - 10} more"
+
+        node_hover.append(node_info)
+
+        # Node styling
+        node_colors.append('#FF6B6B')  # Red for all nodes
+        # Size based on number of columns
+        node_sizes.append(20 + (len(columns) / 10))
+
+    return go.Scatter(
+        x=node_x,
+        y=node_y,
+        mode='markers+text',
+        hoverinfo='text',
+        text=node_text,
+        textposition="top center",
+        textfont=dict(size=14, color='black', family='Arial Black'),
+        hovertext=node_hover,
+        marker=dict(
+            size=node_sizes,
+            color=node_colors,
+            line=dict(width=3, color='white'),
+            symbol='circle'
+        ),
+        showlegend=False
+    )
+
+
+def build_plotly_figure(G: nx.MultiDiGraph, pos: dict):
+    """Interactive figure with batched edges and arrowheads drawn as markers"""
+    import plotly.graph_objects as go
+
+    edge_traces = _batched_edge_traces(G, pos)
+
+    # Create figure
+    fig = go.Figure(data=edge_traces + [_node_trace(G, pos)])
+
+    # Add legend for edge colors
+    legend_traces = [
+        go.Scatter(
+            x=[None], y=[None],
+            mode='lines',
+            line=dict(width=3, color=color),
+            name=label if label != 'Default' else 'Default Join',
+            showlegend=True
+        )
+        for color, _, _, label in [DEFAULT_STYLE] + list(CONTEXT_STYLES.values())
+    ]
+
+    fig.add_traces(legend_traces)
+
+    # Update layout
+    fig.update_layout(
+        title=dict(
+            text="<b>Database Knowledge Graph</b><br><sub>Hover over nodes and edges for details</sub>",
+            font=dict(size=20),
+            x=0.5,
+            xanchor='center'
+        ),
+        showlegend=True,
+        legend=dict(
+            title=dict(text="<b>Join Contexts</b>"),
+            x=1.02,
+            y=1,
+            bgcolor='rgba(255,255,255,0.9)',
+            bordercolor='black',
+            borderwidth=1
+        ),
+        hovermode='closest',
+        margin=dict(b=40, l=40, r=200, t=100),
+        xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+        yaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+        plot_bgcolor='#F5F5F5',
+        width=1200,
+        height=700
+    )
+
+    return fig
+
+
+def render_html(G: nx.MultiDiGraph, pos: dict, output_file: str = HTML_OUTPUT) -> str:
+    fig = build_plotly_figure(G, pos)
+    fig.write_html(output_file)
+    return output_file
+
+
+# ============================================
+# STATIC (MATPLOTLIB) VISUALIZATION
+# ============================================
+
+def render_png(G: nx.MultiDiGraph, pos: dict, output_file: str = PNG_OUTPUT, dpi: int = 300) -> str:
+    """Static image with all edges drawn as one LineCollection and one quiver"""
+    import matplotlib
+    matplotlib.use("Agg")  # Worker processes have no display
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from matplotlib.patches import Patch
+
+    plt.figure(figsize=(14, 10))
+    plt.title("Database Knowledge Graph\n", fontsize=18, fontweight='bold')
+
+    edges = [
+        (pos[source], pos[target], CONTEXT_STYLES.get(edge_data.get('context'), DEFAULT_STYLE))
+        for source, target, key, edge_data in G.edges(keys=True, data=True)
+    ]
+
+    ax = plt.gca()
+    ax.add_collection(LineCollection(
+        [(p0, p1) for p0, p1, _ in edges],
+        colors=[style[1] for _, _, style in edges],
+        linewidths=[style[2] for _, _, style in edges],
+        alpha=0.6
+    ))
+    if edges:
+        # Arrowheads from 70% to 80% along each edge, as in the per-edge drawing
+        x0 = [p0[0] + 0.7 * (p1[0] - p0[0]) for p0, p1, _ in edges]
+        y0 = [p0[1] + 0.7 * (p1[1] - p0[1]) for p0, p1, _ in edges]
+        ax.quiver(x0, y0, [0.1 * (p1[0] - p0[0]) for p0, p1, _ in edges],
+                  [0.1 * (p1[1] - p0[1]) for p0, p1, _ in edges],
+                  color=[style[1] for _, _, style in edges], angles='xy', scale_units='xy', scale=1,
+                  width=0.003, headwidth=6, headlength=6, alpha=0.7)
+
+    # Draw nodes
+    node_colors_list = []
+    for node in G.nodes():
+        columns = G.nodes[node].get('columns', [])
+        # Color based on number of columns
+        if len(columns) > 100:
+            node_colors_list.append('#FF6B6B')  # Red for large tables
+        elif len(columns) > 30:
+            node_colors_list.append('#FFD93D')  # Yellow for medium tables
+        else:
+            node_colors_list.append('#6BCB77')  # Green for small tables
+
+    nx.draw_networkx_nodes(G, pos, node_color=node_colors_list, node_size=3000,
+                           node_shape='o', edgecolors='black', linewidths=3)
+
+    # Draw labels
+    nx.draw_networkx_labels(G, pos, font_size=12, font_weight='bold',
+                            font_family='sans-serif')
+
+    # Add legend
+    legend_elements = [
+        Patch(facecolor='#FF6B6B', edgecolor='black', label='Large Table (>100 cols)'),
+        Patch(facecolor='#FFD93D', edgecolor='black', label='Medium Table (30-100 cols)'),
+        Patch(facecolor='#6BCB77', edgecolor='black', label='Small Table (<30 cols)'),
+    ] + [
+        plt.Line2D([0], [0], color=color, linewidth=width, label=f"{label} Join")
+        for _, color, width, label in [DEFAULT_STYLE] + list(CONTEXT_STYLES.values())
+    ]
+
+    plt.legend(handles=legend_elements, loc='upper left', fontsize=10,
+              frameon=True, fancybox=True, shadow=True)
+
+    plt.axis('off')
+    plt.tight_layout()
+
+    # Save static image
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight', facecolor='white')
+    plt.close()
+    return output_file
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the knowledge graph as HTML and PNG diagrams, fast")
+    parser.add_argument("--input", default=DEFAULT_INPUT,
+                        help="JSON export, or a columnar export directory (graph_export.save_graph_tables)")
+    parser.add_argument("--formats", default=",".join(OUTPUT_FORMATS),
+                        help="Comma-separated outputs to render: html, png")
+    parser.add_argument("--dpi", type=int, default=300, help="Resolution of the PNG")
+    parser.add_argument("--fast", action="store_true", help="Accepted for visualize_kg.py, which hands over here")
+    args = parser.parse_args()
+
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    unknown = set(formats) - set(OUTPUT_FORMATS)
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+
+    print("="*60)
+    print("KNOWLEDGE GRAPH VISUALIZATION")
+    print("="*60)
+
+    G = load_graph(args.input)
+    # Meant for large catalogs: keep the console listing short
+    print_summary(G, max_items=20)
+
+    print("\n" + "="*60)
+    print("GENERATING VISUALIZATIONS")
+    print("="*60)
+
+    # Get layout positions (computed once and shared by both outputs)
+    pos = nx.spring_layout(G, k=2, iterations=50, seed=42)
+
+    renderers = {
+        "html": (render_html, (G, pos, HTML_OUTPUT)),
+        "png": (render_png, (G, pos, PNG_OUTPUT, args.dpi)),
+    }
+    # One worker process per output format
+    with ProcessPoolExecutor(max_workers=max(len(formats), 1)) as executor:
+        futures = [executor.submit(fn, *fn_args) for fn, fn_args in (renderers[f] for f in formats)]
+        files = [future.result() for future in futures]
+    for path in files:
+        print(f"[OK] Saved: {path}")
+
+    print("\n" + "="*60)
+    print("SUMMARY")
+    print("="*60)
+    print(f"Total Tables: {G.number_of_nodes()}")
+    print(f"Total Relationships: {G.number_of_edges()}")
+    print(f"\nFiles created:")
+    for number, path in enumerate(files, 1):
+        kind = "interactive HTML" if path.endswith(".html") else "static PNG"
+        print(f"  {number}. {path} ({kind})")
+    if HTML_OUTPUT in files:
+        print("\nOpen the HTML file in your browser for an interactive experience!")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 """
 Knowledge Graph Visualization Script
 Visualizes the knowledge graph from JSON file
+
+For large catalogs, python visualize_kg.py --fast [--input ...] [--formats html,png] [--dpi 300]
+hands over to visualize_fast.py (batched edge drawing, outputs rendered in parallel).
 """
 import json
+import runpy
+import sys
 import networkx as nx
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 from pathlib import Path
 
+if __name__ == "__main__" and "--fast" in sys.argv[1:]:
+    # Run as the main module, so worker processes import visualize_fast rather than this script
+    runpy.run_module("visualize_fast", run_name="__main__", alter_sys=True)
+    sys.exit()
+
 # Load the knowledge graph data
 with open('knowledge_graph_data.json', 'r') as f:
     kg_data = json.load(f)